@@ -0,0 +1,176 @@
+"""Kontrola dopuszczenia żądań: limity współbieżności per grupa endpointów i budżet pamięci.
+
+Każde kosztowne żądanie przed odczytem treści zajmuje w swojej grupie (np.
+``merge``, ``codes``) tyle jednostek, ile wynika z rozmiaru przesyłanych danych,
+oraz szacowaną ilość pamięci we wspólnym budżecie procesu. Brak miejsca oznacza
+oczekiwanie w ograniczonej kolejce FIFO; pełna kolejka lub przekroczony czas
+oczekiwania kończą się odrzuceniem (``AdmissionRejected`` -> 429 z Retry-After).
+
+``max_pending`` ogranicza łączną liczbę kosztownych żądań (wykonywanych i
+oczekujących), tak by wątki serwera pozostały dostępne dla tanich wywołań
+(``/health``, ``supported-formats``, statystyki).
+"""
+import threading
+import time
+from collections import deque
+
+from metrics import ADMISSION_IN_USE, ADMISSION_QUEUE_DEPTH, ADMISSION_REJECTIONS, ADMISSION_WAIT
+
+REJECT_QUEUE_FULL = 'queue_full'
+REJECT_TIMEOUT = 'timeout'
+REJECT_OVERLOADED = 'overloaded'
+
+MEMORY_GROUP = 'memory'
+
+
+class AdmissionRejected(Exception):
+    """Żądanie nie zostało dopuszczone do wykonania"""
+
+    def __init__(self, group, reason, retry_after):
+        super().__init__(f'Serwis jest przeciążony ({group}: {reason}) - spróbuj ponownie za {retry_after}s')
+        self.group = group
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class WeightedLimiter:
+    """Semafor ważony z kolejką FIFO ograniczoną do ``max_queue`` oczekujących"""
+
+    def __init__(self, name, capacity, max_queue):
+        self.name = name
+        self.capacity = max(1, int(capacity))
+        self.max_queue = max(0, int(max_queue))
+        self.in_use = 0
+        self._waiting = deque()
+        self._condition = threading.Condition()
+
+    def acquire(self, weight, timeout, retry_after):
+        """Zajmuje ``weight`` jednostek (maks. całą pojemność); zwraca zajętą liczbę"""
+        weight = min(max(1, int(weight)), self.capacity)
+        with self._condition:
+            if not self._waiting and self.in_use + weight <= self.capacity:
+                self._take(weight)
+                return weight
+            if len(self._waiting) >= self.max_queue:
+                raise AdmissionRejected(self.name, REJECT_QUEUE_FULL, retry_after)
+
+            waiter = object()
+            self._waiting.append(waiter)
+            ADMISSION_QUEUE_DEPTH.set(len(self._waiting), group=self.name)
+            deadline = time.monotonic() + timeout
+            try:
+                # Kolejność FIFO - duże żądanie na czele kolejki nie jest wyprzedzane przez mniejsze
+                while self._waiting[0] is not waiter or self.in_use + weight > self.capacity:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise AdmissionRejected(self.name, REJECT_TIMEOUT, retry_after)
+                    self._condition.wait(remaining)
+                self._take(weight)
+                return weight
+            finally:
+                self._waiting.remove(waiter)
+                ADMISSION_QUEUE_DEPTH.set(len(self._waiting), group=self.name)
+                self._condition.notify_all()
+
+    def _take(self, weight):
+        self.in_use += weight
+        ADMISSION_IN_USE.set(self.in_use, group=self.name)
+
+    def release(self, weight):
+        with self._condition:
+            self.in_use -= weight
+            ADMISSION_IN_USE.set(self.in_use, group=self.name)
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {'capacity': self.capacity, 'inUse': self.in_use, 'queued': len(self._waiting),
+                    'maxQueue': self.max_queue}
+
+
+class AdmissionTicket:
+    """Zajęte zasoby dopuszczonego żądania; ``release()`` jest idempotentne"""
+
+    def __init__(self, controller, group, weight, memory):
+        self.group = group
+        self.weight = weight
+        self.memory = memory
+        self._controller = controller
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release(self)
+
+
+class AdmissionController:
+    """Dopuszcza kosztowne żądania według limitów grup i wspólnego budżetu pamięci"""
+
+    def __init__(self, limits, max_queue=2, queue_timeout=10.0, memory_budget=1024 * 1024 * 1024,
+                 max_pending=None, retry_after=5, enabled=True):
+        self.enabled = enabled
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.max_pending = max_pending
+        self.groups = {name: WeightedLimiter(name, capacity, max_queue) for name, capacity in limits.items()}
+        # Pamięć liczona w bajtach - oczekujący na nią trzymają już jednostki swojej grupy
+        self.memory = WeightedLimiter(MEMORY_GROUP, memory_budget, max_queue * max(1, len(limits)))
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._stats = {'admitted': 0, 'queued': 0, 'rejected': 0}
+
+    def admit(self, group, weight=1, memory=0):
+        """Czeka na dopuszczenie żądania; zwraca ``AdmissionTicket`` lub zgłasza ``AdmissionRejected``"""
+        limiter = self.groups[group]
+        with self._lock:
+            if self.max_pending is not None and self._pending >= self.max_pending:
+                self._stats['rejected'] += 1
+                ADMISSION_REJECTIONS.inc(group=group, reason=REJECT_OVERLOADED)
+                raise AdmissionRejected(group, REJECT_OVERLOADED, self.retry_after)
+            self._pending += 1
+
+        started = time.perf_counter()
+        taken_weight = taken_memory = 0
+        try:
+            taken_weight = limiter.acquire(weight, self.queue_timeout, self.retry_after)
+            if memory:
+                remaining = max(0.0, self.queue_timeout - (time.perf_counter() - started))
+                taken_memory = self.memory.acquire(memory, remaining, self.retry_after)
+        except AdmissionRejected as e:
+            if taken_weight:
+                limiter.release(taken_weight)
+            with self._lock:
+                self._pending -= 1
+                self._stats['rejected'] += 1
+            ADMISSION_REJECTIONS.inc(group=e.group, reason=e.reason)
+            raise
+
+        waited = time.perf_counter() - started
+        ADMISSION_WAIT.observe(waited, group=group)
+        with self._lock:
+            self._stats['admitted'] += 1
+            if waited > 0.001:
+                self._stats['queued'] += 1
+        return AdmissionTicket(self, group, taken_weight, taken_memory)
+
+    def _release(self, ticket):
+        if ticket.memory:
+            self.memory.release(ticket.memory)
+        self.groups[ticket.group].release(ticket.weight)
+        with self._lock:
+            self._pending -= 1
+
+    def stats(self):
+        """Stan grup, budżetu pamięci i liczniki dopuszczeń"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['pending'] = self._pending
+        snapshot.update({
+            'enabled': self.enabled,
+            'maxPending': self.max_pending,
+            'queueTimeout': self.queue_timeout,
+            'groups': {name: limiter.stats() for name, limiter in self.groups.items()},
+            'memory': self.memory.stats(),
+        })
+        return snapshot
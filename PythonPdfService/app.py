@@ -1,25 +1,55 @@
-from flask import Flask, request, send_file, jsonify
+from flask import Blueprint, Flask, Request, Response, current_app, g, request, send_file, jsonify, stream_with_context
 from flask_cors import CORS
+from werkzeug.exceptions import HTTPException
 from werkzeug.utils import secure_filename
 from flask_swagger_ui import get_swaggerui_blueprint
 import os
-import tempfile
 import shutil
+import logging
 from datetime import datetime
-import PyPDF2
-from PIL import Image
-import img2pdf
 import io
-import fitz  # PyMuPDF
-import cv2
-import numpy as np
-from pyzbar import pyzbar
-import qrcode
-from qreader import QReader
-import easyocr
+import tempfile
+import threading
+import json
+import time
+import contextvars
+import hmac
+import ipaddress
+import tarfile
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from lazy_imports import import_report, lazy_import, start_warmup, subsystems, warmup_state
+from detector_pool import DetectorPool, DetectorPoolTimeout
+from ingest import SpooledUpload, UploadBatch
+from result_cache import ResultCache, cache_key
+from image_pipeline import (
+    DEFAULT_IMAGE_OPTIONS, ImageOptionsError, configure_image_pool, image_options, image_pool_stats,
+    timing_header
+)
+from image_pipeline import images_to_pdf as convert_images  # Nazwa images_to_pdf należy do endpointu
+from text_extractor import (
+    DEFAULT_OCR_OPTIONS, STRUCTURED_FORMATS, OcrOptionsError, TextExtractor, create_ocr_reader, iter_page_structures,
+    ocr_options
+)
+from pdf_optimizer import DEFAULT_OPTIMIZE_OPTIONS, OptimizeOptionsError, optimize_options, optimize_pdf, report_headers
+from pixmap_cache import PixmapCache, configure_pixmap_cache
+from pdf_output import configure_output_dir
+from merge_engine import DEFAULT_MERGE_OPTIONS, MergeOptionsError, merge_documents, merge_options, parse_selection
+import metrics
+from admission import AdmissionController, AdmissionRejected
+from metrics import RequestProfiler, add_pages, observe_stage, stage
+from jobs import JOB_CANCELLED, JOB_FAILED, JobManager, JobQueueFull
+from code_scanner import (
+    CODE_KINDS, CodeScanner, ScanOptionsError, configure_qr_pool, create_qreader, render_options, scan_image
+)
+
+# Ciężkie zależności ładowane przy pierwszym użyciu (lub w rozgrzewce - STARTUP_MODE)
+cv2 = lazy_import('cv2', 'images')
+fitz = lazy_import('fitz', 'pdf')
 
-app = Flask(__name__)
-CORS(app)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO'))
+
+api = Blueprint('api', __name__)
 
 # Konfiguracja Swagger
 SWAGGER_URL = '/swagger'
@@ -31,16 +61,178 @@ swaggerui_blueprint = get_swaggerui_blueprint(
         'app_name': "PythonPdfService API"
     }
 )
-app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
 
 # Konfiguracja
 UPLOAD_FOLDER = '/tmp'
 ALLOWED_IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.bmp', '.gif', '.tiff', '.tif'}
 ALLOWED_PDF_EXTENSIONS = {'.pdf'}
-MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50MB
+MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', 50 * 1024 * 1024))  # 50MB
+UPLOAD_MAX_PART_SIZE = int(os.environ.get('UPLOAD_MAX_PART_SIZE', MAX_CONTENT_LENGTH))  # Limit pojedynczego pliku
+UPLOAD_MAX_PARTS = int(os.environ.get('UPLOAD_MAX_PARTS', 1000))  # Maks. liczba części multipart w żądaniu
+# Zaufani klienci (token w X-Api-Key lub adres z sieci) mogą wysyłać większe żądania - duże pliki trafiają na dysk
+TRUSTED_MAX_CONTENT_LENGTH = int(os.environ.get('TRUSTED_MAX_CONTENT_LENGTH', 1024 * 1024 * 1024))
+TRUSTED_MAX_PART_SIZE = int(os.environ.get('TRUSTED_MAX_PART_SIZE', TRUSTED_MAX_CONTENT_LENGTH))
+TRUSTED_CLIENT_TOKENS = [token.strip() for token in os.environ.get('TRUSTED_CLIENT_TOKENS', '').split(',') if token.strip()]
+TRUSTED_CLIENT_NETWORKS = [
+    ipaddress.ip_network(network.strip(), strict=False)
+    for network in os.environ.get('TRUSTED_CLIENT_NETWORKS', '').split(',') if network.strip()
+]
+QREADER_POOL_SIZE = int(os.environ.get('QREADER_POOL_SIZE', 2))  # Równoległe inferencje (i modele) QR w procesie serwera
+QREADER_POOL_TIMEOUT = float(os.environ.get('QREADER_POOL_TIMEOUT', 30))  # Maks. czas oczekiwania na detektor (s)
+QREADER_PREWARM = os.environ.get('QREADER_PREWARM', 'false').lower() in ('1', 'true', 'yes')
+OCR_POOL_SIZE = int(os.environ.get('OCR_POOL_SIZE', 1))  # Czytniki OCR w procesie (każdy ~kilkaset MB)
+OCR_POOL_TIMEOUT = float(os.environ.get('OCR_POOL_TIMEOUT', 120))  # Maks. czas oczekiwania na czytnik (s)
+OCR_PREWARM = os.environ.get('OCR_PREWARM', 'false').lower() in ('1', 'true', 'yes')
+DEFAULT_OCR_OPTIONS.update(
+    mode=os.environ.get('OCR_MODE', DEFAULT_OCR_OPTIONS['mode']),  # auto | off | force
+    dpi=int(os.environ.get('OCR_DPI', DEFAULT_OCR_OPTIONS['dpi'])),
+    languages=tuple(lang.strip() for lang in os.environ.get('OCR_LANGUAGES', 'pl,en').split(',') if lang.strip())
+)
+INGEST_SPILL_THRESHOLD = int(os.environ.get('INGEST_SPILL_THRESHOLD', 16 * 1024 * 1024))  # Powyżej - zapis na dysk
+CODE_SCAN_WORKERS = int(os.environ.get('CODE_SCAN_WORKERS', os.cpu_count() or 1))  # Procesy skanujące strony
+# Procesy skanujące kody QR - każdy ładuje własny QReader; modeli w workerze najwyżej QREADER_POOL_SIZE + tyle
+CODE_SCAN_QR_WORKERS = int(os.environ.get('CODE_SCAN_QR_WORKERS', min(CODE_SCAN_WORKERS, QREADER_POOL_SIZE)))
+CODE_SCAN_CHUNK_PAGES = int(os.environ.get('CODE_SCAN_CHUNK_PAGES', 4))  # Stron na zadanie procesu
+CODE_SCAN_PARALLEL_MIN_PAGES = int(os.environ.get('CODE_SCAN_PARALLEL_MIN_PAGES', 4))  # Mniej stron - skan lokalny
+CODE_SCAN_TIMEOUT = float(os.environ.get('CODE_SCAN_TIMEOUT', 60))  # Maks. czas skanowania dokumentu (s), 0 = bez limitu
+CODE_RENDER_MODE = os.environ.get('CODE_RENDER_MODE', 'adaptive')  # full | adaptive (zgrubny przebieg + wycinki)
+RESULT_CACHE_ENABLED = os.environ.get('RESULT_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RESULT_CACHE_MAX_BYTES = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))  # Warstwa w pamięci
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR')  # Katalog warstwy dyskowej (brak = wyłączona)
+RESULT_CACHE_DISK_MAX_BYTES = int(os.environ.get('RESULT_CACHE_DISK_MAX_BYTES', 1024 * 1024 * 1024))
+STARTUP_MODE = os.environ.get('STARTUP_MODE', 'lazy').lower()  # lazy | background | eager
+MERGE_ENGINE = os.environ.get('MERGE_ENGINE', 'pymupdf')  # pymupdf | pypdf2
+DEFAULT_MERGE_OPTIONS.update(
+    garbage=int(os.environ.get('MERGE_GARBAGE', DEFAULT_MERGE_OPTIONS['garbage'])),
+    compression=int(os.environ.get('MERGE_COMPRESSION', DEFAULT_MERGE_OPTIONS['compression'])),
+    linearize=os.environ.get('MERGE_LINEARIZE', 'false').lower() in ('1', 'true', 'yes')
+)
+DEFAULT_IMAGE_OPTIONS.update(
+    dpi=int(os.environ.get('IMAGE_TARGET_DPI', DEFAULT_IMAGE_OPTIONS['dpi'])),  # 0 - bez zmniejszania obrazów
+    jpeg_quality=int(os.environ.get('IMAGE_JPEG_QUALITY', DEFAULT_IMAGE_OPTIONS['jpeg_quality'])),
+    encoding=os.environ.get('IMAGE_ENCODING', DEFAULT_IMAGE_OPTIONS['encoding'])  # auto | jpeg | png
+)
+DEFAULT_OPTIMIZE_OPTIONS.update(
+    dpi=int(os.environ.get('OPTIMIZE_DPI', DEFAULT_OPTIMIZE_OPTIONS['dpi'])),  # Maks. DPI obrazów po optymalizacji
+    jpeg_quality=int(os.environ.get('OPTIMIZE_JPEG_QUALITY', DEFAULT_OPTIMIZE_OPTIONS['jpeg_quality']))
+)
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', max(2, os.cpu_count() or 1)))  # Wątki przygotowujące obrazy
+IMAGE_MAX_INFLIGHT_BYTES = int(os.environ.get('IMAGE_MAX_INFLIGHT_BYTES', 256 * 1024 * 1024))  # Zdekodowane bitmapy w toku
+PIXMAP_CACHE_ENABLED = os.environ.get('PIXMAP_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+PIXMAP_CACHE_MAX_BYTES = int(os.environ.get('PIXMAP_CACHE_MAX_BYTES', 128 * 1024 * 1024))  # Próbki pixmap w pamięci
+PIXMAP_CACHE_MAX_ENTRIES = int(os.environ.get('PIXMAP_CACHE_MAX_ENTRIES', 256))
+RENDER_DEFAULT_DPI = int(os.environ.get('RENDER_DEFAULT_DPI', 72))  # Domyślna rozdzielczość podglądu
+# Całe strony w niższej rozdzielczości są wyprowadzane z renderowania RGB w tej (0 - tylko dokładne trafienia)
+PIXMAP_CACHE_CANONICAL_DPI = int(os.environ.get('PIXMAP_CACHE_CANONICAL_DPI', RENDER_DEFAULT_DPI))
+RENDER_MAX_DPI = int(os.environ.get('RENDER_MAX_DPI', 600))
+RENDER_MAX_PIXELS = int(os.environ.get('RENDER_MAX_PIXELS', 50_000_000))  # Limit rozmiaru renderowanego obrazu
+OUTPUT_SPOOL_MAX_MEMORY = int(os.environ.get('OUTPUT_SPOOL_MAX_MEMORY', 8 * 1024 * 1024))  # Wynik większy - plik tymczasowy
+OUTPUT_CHUNK_SIZE = 256 * 1024  # Rozmiar fragmentu wysyłanej odpowiedzi
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', 2))  # Wątki wykonujące zadania asynchroniczne
+JOB_QUEUE_SIZE = int(os.environ.get('JOB_QUEUE_SIZE', 32))  # Maks. liczba zadań w kolejce
+JOB_RESULT_TTL = int(os.environ.get('JOB_RESULT_TTL', 600))  # Czas przechowywania wyników (s)
+JOB_MAX_WAIT = float(os.environ.get('JOB_MAX_WAIT', 30))  # Maks. czas long-pollingu (s)
+JOB_RETRY_AFTER = 5  # Sugerowany odstęp ponowienia (s)
+BATCH_WORKERS = int(os.environ.get('BATCH_WORKERS', 4))  # Pliki przetwarzane równolegle w żądaniu wsadowym
+BATCH_MAX_FILES = int(os.environ.get('BATCH_MAX_FILES', 1000))  # Maks. liczba plików (także z archiwów)
+BATCH_MAX_EXTRACTED_BYTES = int(os.environ.get('BATCH_MAX_EXTRACTED_BYTES', 1024 * 1024 * 1024))  # Limit rozpakowania
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+ADMISSION_ENABLED = os.environ.get('ADMISSION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ADMISSION_LIMITS = {  # Jednostki kosztu wykonywane równolegle w grupie (ADMISSION_LIMITS=merge=4,codes=2,...)
+    'merge': 4, 'codes': 4, 'text': 4, 'render': 4, 'jobs': 4,
+    **{name.strip(): int(value) for name, _, value in (
+        item.partition('=') for item in os.environ.get('ADMISSION_LIMITS', '').split(',') if '=' in item
+    )}
+}
+ADMISSION_UNIT_BYTES = int(os.environ.get('ADMISSION_UNIT_BYTES', 10 * 1024 * 1024))  # Każde rozpoczęte - jednostka kosztu
+ADMISSION_MAX_QUEUE = int(os.environ.get('ADMISSION_MAX_QUEUE', 2))  # Oczekujący w grupie - więcej daje 429
+ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 10))  # Maks. czas oczekiwania (s)
+ADMISSION_MEMORY_BUDGET = int(os.environ.get('ADMISSION_MEMORY_BUDGET', 1024 * 1024 * 1024))  # Szacowana pamięć żądań
+# Kosztowne żądania (wykonywane i oczekujące) - co najmniej jeden wątek gunicorn zostaje dla tanich wywołań
+ADMISSION_MAX_PENDING = int(os.environ.get('ADMISSION_MAX_PENDING', max(1, int(os.environ.get('GUNICORN_THREADS', 4)) - 1)))
+ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 5))  # Sugerowany odstęp ponowienia (s)
+# Endpoint -> (grupa, mnożnik pamięci względem rozmiaru żądania); pozostałe endpointy nie są ograniczane
+ADMISSION_ENDPOINTS = {
+    '/api/pdf/merge-pdfs': ('merge', 3),
+    '/api/pdf/images-to-pdf': ('merge', 6),  # Zdekodowane bitmapy są wielokrotnie większe od plików
+    '/api/pdf/merge-all': ('merge', 6),
+    '/api/pdf/optimize': ('merge', 4),
+    '/api/pdf/extract-text': ('text', 2),
+    '/api/pdf/extract-text/stream': ('text', 2),
+    '/api/pdf/render': ('render', 2),
+    '/api/pdf/read-barcodes': ('codes', 3),
+    '/api/pdf/read-qr-codes': ('codes', 3),
+    '/api/pdf/read-all-codes': ('codes', 3),
+    '/api/pdf/read-codes/batch': ('codes', 3),
+    '/api/jobs/<operation>': ('jobs', 1),  # Wykonanie ogranicza JOB_WORKERS - tu tylko przyjęcie plików
+}
+METRICS_SERVER_TIMING = os.environ.get('METRICS_SERVER_TIMING', 'false').lower() in ('1', 'true', 'yes')
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', 0))  # Część profilowanych żądań (0 - wyłączone)
+PROFILE_DIR = os.environ.get('PROFILE_DIR')  # Katalog plików .prof
+WARMUP_SUBSYSTEMS = [name.strip() for name in os.environ.get('WARMUP_SUBSYSTEMS', 'pdf,images,barcodes,qr').split(',') if name.strip()]
 
-app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
-app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+# Detektory QR ładowane raz na proces zamiast przy każdym żądaniu
+qr_detector_pool = DetectorPool(create_qreader, size=QREADER_POOL_SIZE, acquire_timeout=QREADER_POOL_TIMEOUT)
+configure_qr_pool(qr_detector_pool)
+
+# Czytniki OCR (easyocr) ładowane raz na proces - używane tylko dla stron bez warstwy tekstowej
+ocr_reader_pool = DetectorPool(
+    lambda: create_ocr_reader(DEFAULT_OCR_OPTIONS['languages']),
+    size=OCR_POOL_SIZE, acquire_timeout=OCR_POOL_TIMEOUT, name='OCR'
+)
+
+# Równoległe przygotowanie obrazów z limitem pamięci zdekodowanych bitmap
+configure_image_pool(workers=IMAGE_WORKERS, max_inflight_bytes=IMAGE_MAX_INFLIGHT_BYTES)
+
+# Wyrenderowane strony współdzielone przez podgląd (/api/pdf/render) i odczyt kodów
+pixmap_cache = PixmapCache(
+    max_bytes=PIXMAP_CACHE_MAX_BYTES, max_entries=PIXMAP_CACHE_MAX_ENTRIES, enabled=PIXMAP_CACHE_ENABLED,
+    canonical_zoom=PIXMAP_CACHE_CANONICAL_DPI / 72
+)
+configure_pixmap_cache(pixmap_cache)
+
+# Wyniki zapisywane przez PyMuPDF (łączenie, optymalizacja) - pliki tymczasowe w katalogu uploadów
+configure_output_dir(UPLOAD_FOLDER)
+
+# Cache wyników ekstrakcji i odczytu kodów (klucz: SHA-256 pliku + parametry)
+result_cache = ResultCache(
+    max_bytes=RESULT_CACHE_MAX_BYTES,
+    disk_dir=RESULT_CACHE_DIR,
+    disk_max_bytes=RESULT_CACHE_DISK_MAX_BYTES,
+    enabled=RESULT_CACHE_ENABLED
+)
+
+# Ekstrakcja tekstu z OCR stron-skanów (wyniki OCR w cache pod hashem wyrenderowanej strony)
+text_extractor = TextExtractor(ocr_reader_pool, cache=result_cache)
+
+# Kolejka zadań asynchronicznych (/api/jobs)
+job_manager = JobManager(workers=JOB_WORKERS, max_queued=JOB_QUEUE_SIZE, result_ttl=JOB_RESULT_TTL)
+
+# Wątki odczytu kodów dla żądań wsadowych (detektory QR i procesy skanujące są współdzielone)
+batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch-codes')
+
+# Limity współbieżności kosztownych endpointów (429 z Retry-After przy przeciążeniu)
+admission = AdmissionController(
+    ADMISSION_LIMITS,
+    max_queue=ADMISSION_MAX_QUEUE,
+    queue_timeout=ADMISSION_QUEUE_TIMEOUT,
+    memory_budget=ADMISSION_MEMORY_BUDGET,
+    max_pending=ADMISSION_MAX_PENDING,
+    retry_after=ADMISSION_RETRY_AFTER,
+    enabled=ADMISSION_ENABLED
+)
+
+# Próbkujące profilowanie żądań (cProfile) - PROFILE_SAMPLE_RATE i PROFILE_DIR
+request_profiler = RequestProfiler(sample_rate=PROFILE_SAMPLE_RATE, output_dir=PROFILE_DIR)
+
+# Równoległe skanowanie stron PDF w puli procesów
+code_scanner = CodeScanner(
+    workers=CODE_SCAN_WORKERS,
+    qr_workers=CODE_SCAN_QR_WORKERS,
+    chunk_pages=CODE_SCAN_CHUNK_PAGES,
+    parallel_min_pages=CODE_SCAN_PARALLEL_MIN_PAGES,
+    spill_dir=UPLOAD_FOLDER
+)
 
 def allowed_image_file(filename):
     return '.' in filename and \
@@ -60,250 +252,650 @@ def get_page_size(output_format):
     }
     return sizes.get(output_format.upper(), sizes['A4'])
 
-@app.route('/api/pdf/merge-pdfs', methods=['POST'])
-def merge_pdfs():
-    """Łączy kilka plików PDF w jeden dokument"""
-    try:
-        if 'files' not in request.files:
-            return jsonify({'message': 'Nie przekazano żadnych plików'}), 400
-        
-        files = request.files.getlist('files')
-        if not files or all(file.filename == '' for file in files):
-            return jsonify({'message': 'Nie przekazano żadnych plików'}), 400
-        
-        output_format = request.args.get('outputFormat', 'A4')
-        temp_files = []
-        pdf_files = []
-        
+def is_trusted_client(req):
+    """Czy żądanie pochodzi od zaufanego klienta (token X-Api-Key lub adres z TRUSTED_CLIENT_NETWORKS)"""
+    token = req.headers.get('X-Api-Key')
+    if token and any(hmac.compare_digest(token, trusted) for trusted in current_app.config['TRUSTED_CLIENT_TOKENS']):
+        return True
+    networks = current_app.config['TRUSTED_CLIENT_NETWORKS']
+    if networks and req.remote_addr:
         try:
-            # Zapisz pliki tymczasowo i sprawdź formaty
-            for file in files:
-                if file and file.filename:
-                    if not allowed_pdf_file(file.filename):
-                        continue
-                    
-                    temp_path = tempfile.mktemp(suffix='.pdf')
-                    file.save(temp_path)
-                    temp_files.append(temp_path)
-                    pdf_files.append(temp_path)
-            
-            if not pdf_files:
-                return jsonify({'message': 'Nie znaleziono prawidłowych plików PDF'}), 400
-            
-            # Połącz PDF-y
-            merger = PyPDF2.PdfMerger()
-            for pdf_file in pdf_files:
-                merger.append(pdf_file)
-            
-            # Zapisz wynik
-            output_filename = f"merged_pdfs_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-            
-            with open(output_path, 'wb') as output_file:
-                merger.write(output_file)
-            
-            merger.close()
-            
-            # Zwróć plik
-            return send_file(
-                output_path,
-                as_attachment=True,
-                download_name=output_filename,
-                mimetype='application/pdf'
+            address = ipaddress.ip_address(req.remote_addr)
+        except ValueError:
+            return False
+        return any(address in network for network in networks)
+    return False
+
+class IngestRequest(Request):
+    """Żądanie, którego parser multipart zapisuje pliki od razu do ``SpooledUpload``.
+
+    Limity rozmiaru żądania i pojedynczego pliku zależą od tego, czy klient jest zaufany.
+    """
+
+    @property
+    def trusted_client(self):
+        if not hasattr(self, '_trusted_client'):
+            self._trusted_client = is_trusted_client(self)
+        return self._trusted_client
+
+    @property
+    def max_content_length(self):
+        if self.trusted_client:
+            return current_app.config['TRUSTED_MAX_CONTENT_LENGTH']
+        return current_app.config['MAX_CONTENT_LENGTH']
+
+    @property
+    def max_form_parts(self):
+        return current_app.config['UPLOAD_MAX_PARTS']
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        config = current_app.config
+        return SpooledUpload(
+            filename,
+            config['INGEST_SPILL_THRESHOLD'],
+            config['UPLOAD_FOLDER'],
+            max_size=config['TRUSTED_MAX_PART_SIZE'] if self.trusted_client else config['UPLOAD_MAX_PART_SIZE']
+        )
+
+def upload_batch():
+    """Tworzy zbiór plików z żądania trzymanych w pamięci (duże pliki trafiają na dysk)"""
+    return UploadBatch(current_app.config['INGEST_SPILL_THRESHOLD'], current_app.config['UPLOAD_FOLDER'])
+
+class RequestError(Exception):
+    """Błąd walidacji żądania zwracany klientowi z podanym kodem HTTP"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+def spooled_output():
+    """Unikalny bufor wyniku: w pamięci do OUTPUT_SPOOL_MAX_MEMORY, powyżej w anonimowym pliku tymczasowym"""
+    return tempfile.SpooledTemporaryFile(max_size=OUTPUT_SPOOL_MAX_MEMORY, dir=UPLOAD_FOLDER)
+
+def merge_output(options):
+    """Bufor dla PyPDF2; PyMuPDF zapisuje wynik do własnego pliku tymczasowego (``None``)"""
+    return spooled_output() if options['engine'] == 'pypdf2' else None
+
+def iter_file_chunks(file, lock, chunk_size=OUTPUT_CHUNK_SIZE):
+    """Czyta plik fragmentami od początku; ``lock`` chroni pozycję przy równoległych pobraniach"""
+    position = 0
+    while True:
+        with lock:
+            file.seek(position)
+            chunk = file.read(chunk_size)
+        if not chunk:
+            break
+        position += len(chunk)
+        yield chunk
+
+class ResultClosed(Exception):
+    """Wynik został zamknięty (np. usunięte zadanie) przed rozpoczęciem pobrania"""
+
+class OperationResult:
+    """Wynik operacji: plik (bajty lub bufor) albo treść JSON, wraz z nagłówkami"""
+
+    def __init__(self, payload=None, filename=None, mimetype='application/json', body=None, headers=None,
+                 inline=False):
+        self.payload = payload
+        self.filename = filename
+        self.mimetype = mimetype
+        self.body = body
+        self.headers = headers or {}
+        self.inline = inline  # Content-Disposition: inline (np. podgląd strony) zamiast załącznika
+        self._detached = False
+        self._readers = 0  # Trwające pobrania wyniku zadania
+        self._closed = False
+        self._lock = threading.Lock()
+
+    def detach(self):
+        """Przygotowuje wynik do wielokrotnego pobrania (zadania)"""
+        if isinstance(self.payload, io.BytesIO):
+            self.payload = self.payload.getvalue()
+        self._detached = True
+        return self
+
+    def close(self):
+        """Zamyka bufor wyniku (plik tymczasowy) - np. przy usunięciu wyniku zadania.
+
+        Gdy wynik jest właśnie pobierany, bufor zamyka dopiero koniec ostatniego pobrania.
+        """
+        with self._lock:
+            self._closed = True
+            if not self._readers:
+                self._close_payload()
+
+    def _close_payload(self):
+        if hasattr(self.payload, 'close'):
+            self.payload.close()
+
+    def _release_reader(self):
+        with self._lock:
+            self._readers -= 1
+            if self._closed and not self._readers:
+                self._close_payload()
+
+    def to_response(self):
+        if self.body is not None:
+            response = jsonify(self.body)
+        elif isinstance(self.payload, (bytes, io.BytesIO)):
+            payload = io.BytesIO(self.payload) if isinstance(self.payload, bytes) else self.payload
+            response = send_file(
+                payload,
+                as_attachment=not self.inline,
+                download_name=self.filename,
+                mimetype=self.mimetype
             )
-            
-        finally:
-            # Wyczyść pliki tymczasowe
-            for temp_file in temp_files:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            if os.path.exists(output_path):
-                os.remove(output_path)
-                
-    except Exception as e:
-        return jsonify({'message': f'Błąd podczas łączenia plików PDF: {str(e)}'}), 500
+        else:
+            # Bufor z przelaniem na dysk - wysyłany fragmentami (bez fileno(), które wymusza zapis na dysk)
+            with self._lock:
+                if self._closed:
+                    raise ResultClosed('Wynik został usunięty')
+                self.payload.seek(0, os.SEEK_END)
+                size = self.payload.tell()
+                self._readers += self._detached
+            response = Response(iter_file_chunks(self.payload, self._lock), mimetype=self.mimetype)
+            response.headers.set('Content-Disposition', 'inline' if self.inline else 'attachment', filename=self.filename)
+            response.headers['Content-Length'] = str(size)
+            # Wywoływane także po przerwanym pobraniu; wynik zadania zamknięty w trakcie - dopiero teraz
+            response.call_on_close(self._release_reader if self._detached else self.payload.close)
+        response.headers.update(self.headers)
+        return response
 
-@app.route('/api/pdf/images-to-pdf', methods=['POST'])
-def images_to_pdf():
-    """Konwertuje obrazy do formatu PDF"""
-    try:
-        if 'files' not in request.files:
-            return jsonify({'message': 'Nie przekazano żadnych plików'}), 400
-        
-        files = request.files.getlist('files')
-        if not files or all(file.filename == '' for file in files):
-            return jsonify({'message': 'Nie przekazano żadnych plików'}), 400
+def no_progress(**fields):
+    """Pusty odbiorca postępu dla operacji wykonywanych synchronicznie"""
+
+def request_files():
+    """Zwraca listę plików z pola ``files`` lub zgłasza RequestError"""
+    if 'files' not in request.files:
+        raise RequestError('Nie przekazano żadnych plików')
+    
+    files = request.files.getlist('files')
+    if not files or all(file.filename == '' for file in files):
+        raise RequestError('Nie przekazano żadnych plików')
+    return files
+
+def request_file(empty_message='Nie wybrano pliku'):
+    """Zwraca plik z pola ``file`` lub zgłasza RequestError"""
+    if 'file' not in request.files:
+        raise RequestError('Nie przekazano pliku')
+    
+    file = request.files['file']
+    if file.filename == '':
+        raise RequestError(empty_message)
+    return file
+
+def output_timestamp():
+    return datetime.now().strftime('%Y%m%d_%H%M%S')
+
+def request_merge_options():
+    """Odczytuje opcje łączenia z zapytania (engine, garbage, compression, linearize, optimize)"""
+    linearize = request.args.get('linearize')
+    optimize = request.args.get('optimize', 'false').lower() in ('1', 'true', 'yes')
+    return merge_options(
+        engine=request.args.get('engine', MERGE_ENGINE).lower(),
+        garbage=optional_int_arg('garbage', MergeOptionsError),
+        compression=optional_int_arg('compression', MergeOptionsError),
+        linearize=linearize.lower() in ('1', 'true', 'yes') if linearize is not None else None,
+        optimize=request_optimize_options('optimizeDpi', 'optimizeJpegQuality') if optimize else None
+    )
+
+def request_optimize_options(dpi_arg='dpi', quality_arg='jpegQuality'):
+    """Odczytuje opcje optymalizacji obrazów z zapytania"""
+    return optimize_options(
+        dpi=optional_int_arg(dpi_arg, OptimizeOptionsError),
+        jpeg_quality=optional_int_arg(quality_arg, OptimizeOptionsError)
+    )
+
+def request_image_options():
+    """Odczytuje opcje konwersji obrazów z zapytania (outputFormat, dpi, jpegQuality, recompress, imageEncoding)"""
+    output_format = request.args.get('outputFormat', 'A4')
+    recompress = request.args.get('recompress')
+    encoding = request.args.get('imageEncoding')
+    return image_options(
+        page_size=None if output_format.upper() == 'ORIGINAL' else get_page_size(output_format),
+        dpi=optional_int_arg('dpi', ImageOptionsError),
+        jpeg_quality=optional_int_arg('jpegQuality', ImageOptionsError),
+        recompress=recompress.lower() in ('1', 'true', 'yes') if recompress is not None else None,
+        encoding=encoding.lower() if encoding else None
+    )
+
+def image_headers(images):
+    """Nagłówki podsumowujące normalizację obrazów"""
+    if not images:
+        return {}
+    return {
+        'X-Images-Resized': str(sum(1 for info in images if info['resized'])),
+        'X-Image-Timings': timing_header(images),
+    }
+
+def ingest_merge_files(uploads, files, with_images=False):
+    """Przyjmuje pliki do łączenia; zwraca (pdf_files, image_files, selection).
+
+    Przy wyborze stron (``pages``, np. ``files[0]:1-5,files[2]:10-@90``) przyjmowane
+    są tylko wskazane PDF-y, a ``selection`` zawiera pary (plik, element wyboru).
+    """
+    spec = request.values.get('pages')
+    selection = parse_selection(spec) if spec else None
+    referenced = {part['file'] for part in selection} if selection else None
+
+    pdf_by_index = {}
+    image_files = []
+    for index, file in enumerate(files):
+        if file and file.filename:
+            if allowed_pdf_file(file.filename):
+                if referenced is None or index in referenced:
+                    pdf_by_index[index] = uploads.add(file)
+            elif with_images and allowed_image_file(file.filename):
+                image_files.append(uploads.add(file))
+
+    if selection:
+        for part in selection:
+            if part['file'] not in pdf_by_index:
+                raise MergeOptionsError(f'Wybór stron wskazuje files[{part["file"]}], który nie jest plikiem PDF')
+        selection = [(pdf_by_index[part['file']], part) for part in selection]
+    return list(pdf_by_index.values()), image_files, selection
+
+def prepare_merge_pdfs(uploads):
+    """Przyjmuje pliki do łączenia PDF-ów; zwraca funkcję wykonującą operację"""
+    files = request_files()
+    
+    # Przyjmij pliki (w pamięci) i sprawdź formaty
+    options = request_merge_options()
+    pdf_files, _, selection = ingest_merge_files(uploads, files)
+    if not pdf_files:
+        raise RequestError('Nie znaleziono prawidłowych plików PDF')
+    
+    def run(progress):
+        progress(filesTotal=len(selection or pdf_files), filesDone=0)
+        report = {}
+        output_buffer = merge_documents(
+            pdf_files, options=options, progress=progress, output=merge_output(options), selection=selection,
+            report=report
+        )
+        return OperationResult(
+            output_buffer, f"merged_pdfs_{output_timestamp()}.pdf", 'application/pdf',
+            headers={'X-Merge-Engine': options['engine'], **(report_headers(report) if report else {})}
+        )
+    return run
+
+def prepare_images_to_pdf(uploads):
+    """Przyjmuje obrazy do konwersji na PDF; zwraca funkcję wykonującą operację"""
+    files = request_files()
+    conversion_options = request_image_options()
+    
+    image_files = [uploads.add(file) for file in files if file and file.filename and allowed_image_file(file.filename)]
+    if not image_files:
+        raise RequestError('Nie znaleziono prawidłowych plików obrazów')
+    
+    def run(progress):
+        progress(filesTotal=len(image_files), filesDone=0)
+        # Znormalizuj obrazy (format strony, DPI) i skonwertuj je do PDF
+        output_buffer, images = convert_images(image_files, conversion_options, spooled_output())
+        progress(filesDone=len(image_files), bytesWritten=output_buffer.tell())
+        output_buffer.seek(0)
+        return OperationResult(
+            output_buffer, f"images_to_pdf_{output_timestamp()}.pdf", 'application/pdf',
+            headers=image_headers(images)
+        )
+    return run
+
+def prepare_merge_all(uploads):
+    """Przyjmuje PDF-y i obrazy do połączenia; zwraca funkcję wykonującą operację"""
+    files = request_files()
+    conversion_options = request_image_options()
+    options = request_merge_options()
+    
+    pdf_files, image_files, selection = ingest_merge_files(uploads, files, with_images=True)
+    if not pdf_files and not image_files:
+        raise RequestError('Nie znaleziono prawidłowych plików PDF ani obrazów')
+    
+    def run(progress):
+        progress(filesTotal=len(selection or pdf_files) + len(image_files), filesDone=0)
+        # Konwertuj obrazy do PDF (bez zapisu pośredniego na dysk)
+        images_pdf, images = convert_images(image_files, conversion_options) if image_files else (None, [])
+        report = {}
+        output_buffer = merge_documents(
+            pdf_files, images_pdf, options, progress, output=merge_output(options), selection=selection, report=report
+        )
+        progress(filesDone=len(selection or pdf_files) + len(image_files))
+        headers = {'X-Merge-Engine': options['engine'], **image_headers(images)}
+        if report:
+            headers.update(report_headers(report))
+        return OperationResult(
+            output_buffer, f"merged_pdfs_and_images_{output_timestamp()}.pdf", 'application/pdf', headers=headers
+        )
+    return run
+
+def prepare_optimize(uploads):
+    """Przyjmuje PDF do optymalizacji rozmiaru (dpi, jpegQuality); zwraca funkcję wykonującą operację"""
+    file = request_file('Nie przekazano pliku')
+    if not allowed_pdf_file(file.filename):
+        raise RequestError('Przekazany plik nie jest plikiem PDF')
+    
+    options = request_optimize_options()
+    uploaded = uploads.add(file)
+    
+    def run(progress):
+        output_buffer, report = optimize_pdf(uploaded, options)
+        add_pages(report.get('pageCount', 0))
+        progress(bytesWritten=report['optimizedBytes'])
+        return OperationResult(
+            output_buffer, f"{os.path.splitext(file.filename)[0]}_optimized.pdf", 'application/pdf',
+            headers=report_headers(report)
+        )
+    return run
+
+def request_ocr_options():
+    """Odczytuje tryb OCR z zapytania (ocr=auto|off|force, ocrDpi)"""
+    mode = request.args.get('ocr')
+    return ocr_options(
+        mode=mode.lower() if mode else None,
+        dpi=optional_int_arg('ocrDpi', OcrOptionsError)
+    )
+
+def compact_json(value):
+    """Serializacja JSON bez zbędnych odstępów"""
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+EXTRACT_FORMATS = ('text',) + STRUCTURED_FORMATS
+EXTRACT_STREAM_FORMATS = ('text', 'ndjson') + STRUCTURED_FORMATS
+
+def prepare_extract_text(uploads, stream=False):
+    """Przyjmuje PDF do ekstrakcji tekstu; zwraca funkcję wykonującą operację.
+    
+    Przy ``stream`` funkcja zwraca odpowiedź strumieniową (strona po stronie) zamiast ``OperationResult``.
+    """
+    file = request_file('Nie przekazano pliku')
+    if not allowed_pdf_file(file.filename):
+        raise RequestError('Przekazany plik nie jest plikiem PDF')
+    
+    output = request.args.get('format', 'text').lower()
+    formats = EXTRACT_STREAM_FORMATS if stream else EXTRACT_FORMATS
+    if output not in formats:
+        raise RequestError(f'Nieobsługiwany format (dozwolone: {", ".join(formats)})')
+    options = request_ocr_options() if output not in STRUCTURED_FORMATS else None
+    if stream:
+        return prepare_extract_stream(uploads.add(file), output, options)
+    if output in STRUCTURED_FORMATS:
+        return prepare_extract_structure(uploads, file, output)
+    
+    uploaded = uploads.add(file)
+    output_filename = f"{os.path.splitext(file.filename)[0]}_extracted_text.txt"
+    
+    def run(progress):
+        key = cache_key(uploaded.sha256(), 'extract-text', options)
+        extracted_text = result_cache.get(key)
+        cache_status = 'HIT' if extracted_text is not None else 'MISS'
+        headers = {'X-Cache': cache_status}
+        if extracted_text is None:
+            # Warstwa tekstowa PyMuPDF, OCR tylko dla stron-skanów (dokument otwierany z pamięci)
+            doc = uploaded.open_pdf()
+            try:
+                progress(pagesTotal=len(doc), pagesDone=0)
+                parts = []
+                ocr_pages = 0
+                for result in text_extractor.iter_pages(doc, options):
+                    parts.append(f"Strona {result['page']}:\n{result['text']}\n\n")
+                    ocr_pages += result['source'] != 'text'
+                    progress(pagesDone=result['page'])
+                add_pages(len(doc))
+            finally:
+                doc.close()
+            extracted_text = ''.join(parts).encode('utf-8')
+            result_cache.put(key, extracted_text)
+            headers['X-OCR-Pages'] = str(ocr_pages)
         
-        output_format = request.args.get('outputFormat', 'A4')
-        temp_files = []
-        image_files = []
+        progress(bytesWritten=len(extracted_text))
+        return OperationResult(io.BytesIO(extracted_text), output_filename, 'text/plain', headers=headers)
+    return run
+
+def prepare_extract_structure(uploads, file, output):
+    """Ekstrakcja tekstu z położeniem (blocks|words|json) - jeden dokument JSON z tablicą stron"""
+    uploaded = uploads.add(file)
+    output_filename = f"{os.path.splitext(file.filename)[0]}_extracted_{output}.json"
+    
+    def run(progress):
+        key = cache_key(uploaded.sha256(), 'extract-text', {'format': output})
+        extracted = result_cache.get(key)
+        cache_status = 'HIT' if extracted is not None else 'MISS'
+        if extracted is None:
+            doc = uploaded.open_pdf()
+            try:
+                progress(pagesTotal=len(doc), pagesDone=0)
+                pages = []
+                for structure in iter_page_structures(doc, output):
+                    pages.append(compact_json(structure))
+                    progress(pagesDone=structure['page'])
+                add_pages(len(doc))
+            finally:
+                doc.close()
+            extracted = f'{{"format":"{output}","pages":[{",".join(pages)}]}}'.encode('utf-8')
+            result_cache.put(key, extracted)
         
+        progress(bytesWritten=len(extracted))
+        return OperationResult(
+            io.BytesIO(extracted), output_filename, 'application/json', headers={'X-Cache': cache_status}
+        )
+    return run
+
+RENDER_FORMATS = {'png': ('png', 'image/png'), 'jpeg': ('jpeg', 'image/jpeg'), 'jpg': ('jpeg', 'image/jpeg')}
+
+def parse_clip(value):
+    """Wycinek strony ``x0,y0,x1,y1`` w punktach PDF (None gdy brak)"""
+    if not value:
+        return None
+    try:
+        x0, y0, x1, y1 = (float(part) for part in value.split(','))
+    except ValueError:
+        raise RequestError('Parametr clip musi mieć postać x0,y0,x1,y1')
+    if x1 <= x0 or y1 <= y0:
+        raise RequestError('Parametr clip opisuje pusty obszar')
+    return x0, y0, x1, y1
+
+def prepare_render(uploads):
+    """Przyjmuje PDF do wyrenderowania strony (page, dpi, format, clip, colorspace, jpegQuality)"""
+    file = request_file('Nie przekazano pliku')
+    if not allowed_pdf_file(file.filename):
+        raise RequestError('Przekazany plik nie jest plikiem PDF')
+    
+    page_number = optional_int_arg('page', RequestError) or 1
+    dpi = optional_int_arg('dpi', RequestError) or RENDER_DEFAULT_DPI
+    if not 10 <= dpi <= RENDER_MAX_DPI:
+        raise RequestError(f'Rozdzielczość poza zakresem 10-{RENDER_MAX_DPI} DPI')
+    output = request.args.get('format', 'png').lower()
+    if output not in RENDER_FORMATS:
+        raise RequestError('Nieobsługiwany format obrazu (dozwolone: png, jpeg)')
+    colorspace = request.args.get('colorspace', 'rgb').lower()
+    if colorspace not in ('rgb', 'gray'):
+        raise RequestError('Nieobsługiwana przestrzeń barw (dozwolone: rgb, gray)')
+    jpeg_quality = optional_int_arg('jpegQuality', RequestError) or DEFAULT_IMAGE_OPTIONS['jpeg_quality']
+    if not 1 <= jpeg_quality <= 100:
+        raise RequestError('Parametr jpegQuality poza zakresem 1-100')
+    clip = parse_clip(request.args.get('clip'))
+    uploaded = uploads.add(file)
+    encoding, mimetype = RENDER_FORMATS[output]
+    
+    def run(progress):
+        doc = uploaded.open_pdf()
         try:
-            # Zapisz pliki tymczasowo i sprawdź formaty
-            for file in files:
-                if file and file.filename:
-                    if not allowed_image_file(file.filename):
-                        continue
-                    
-                    temp_path = tempfile.mktemp(suffix=os.path.splitext(file.filename)[1])
-                    file.save(temp_path)
-                    temp_files.append(temp_path)
-                    image_files.append(temp_path)
-            
-            if not image_files:
-                return jsonify({'message': 'Nie znaleziono prawidłowych plików obrazów'}), 400
-            
-            # Konwertuj obrazy do PDF
-            output_filename = f"images_to_pdf_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-            
-            # Użyj img2pdf do konwersji
-            with open(output_path, "wb") as f:
-                f.write(img2pdf.convert(image_files))
-            
-            # Zwróć plik
-            return send_file(
-                output_path,
-                as_attachment=True,
-                download_name=output_filename,
-                mimetype='application/pdf'
-            )
-            
+            if not 1 <= page_number <= len(doc):
+                raise RequestError(f'Strona {page_number} poza zakresem 1-{len(doc)}')
+            page = doc.load_page(page_number - 1)
+            area = (fitz.Rect(clip) & page.rect) if clip else page.rect
+            if area.is_empty:
+                raise RequestError('Parametr clip leży poza stroną')
+            zoom = dpi / 72
+            if area.width * zoom * area.height * zoom > RENDER_MAX_PIXELS:
+                raise RequestError('Wyrenderowany obraz przekracza dopuszczalny rozmiar - zmniejsz dpi lub clip')
+            with stage('get_pixmap'):
+                pix, cached = pixmap_cache.render(
+                    page, uploaded.sha256(), zoom, clip=area if clip else None, gray=colorspace == 'gray'
+                )
+            add_pages(1)
         finally:
-            # Wyczyść pliki tymczasowe
-            for temp_file in temp_files:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            if os.path.exists(output_path):
-                os.remove(output_path)
-                
+            doc.close()
+        with stage('encode'):
+            if encoding == 'jpeg':
+                image = pix.tobytes('jpeg', jpg_quality=jpeg_quality)
+            else:
+                image = pix.tobytes('png')
+        progress(bytesWritten=len(image))
+        return OperationResult(
+            io.BytesIO(image),
+            f"{os.path.splitext(file.filename)[0]}_page{page_number}.{'jpg' if encoding == 'jpeg' else 'png'}",
+            mimetype,
+            headers={'X-Cache': 'HIT' if cached else 'MISS', 'X-Image-Size': f'{pix.width}x{pix.height}'},
+            inline=True
+        )
+    return run
+
+def operation_error(e, message):
+    """Mapuje wyjątki operacji na odpowiedź JSON"""
+    if isinstance(e, RequestError):
+        return jsonify({'message': e.message}), e.status
+    if isinstance(e, HTTPException):
+        # Np. 413 - przekroczony limit żądania lub pojedynczego pliku przy odbiorze treści
+        return jsonify({'message': e.description}), e.code
+    if isinstance(e, (ScanOptionsError, MergeOptionsError, ImageOptionsError, OcrOptionsError, OptimizeOptionsError)):
+        return jsonify({'message': str(e)}), 400
+    if isinstance(e, DetectorPoolTimeout):
+        return jsonify({'message': str(e)}), 503
+    return jsonify({'message': f'{message}: {str(e)}'}), 500
+
+def run_operation(name):
+    """Wykonuje operację synchronicznie w ramach żądania"""
+    prepare, error_message = OPERATIONS[name]
+    try:
+        with upload_batch() as uploads:
+            return prepare(uploads)(no_progress).to_response()
     except Exception as e:
-        return jsonify({'message': f'Błąd podczas konwersji obrazów do PDF: {str(e)}'}), 500
+        return operation_error(e, error_message)
+
+@api.route('/api/pdf/merge-pdfs', methods=['POST'])
+def merge_pdfs():
+    """Łączy kilka plików PDF w jeden dokument"""
+    return run_operation('merge-pdfs')
+
+@api.route('/api/pdf/images-to-pdf', methods=['POST'])
+def images_to_pdf():
+    """Konwertuje obrazy do formatu PDF"""
+    return run_operation('images-to-pdf')
 
-@app.route('/api/pdf/merge-all', methods=['POST'])
+@api.route('/api/pdf/merge-all', methods=['POST'])
 def merge_pdfs_and_images():
     """Łączy pliki PDF i obrazy w jeden dokument"""
-    try:
-        if 'files' not in request.files:
-            return jsonify({'message': 'Nie przekazano żadnych plików'}), 400
-        
-        files = request.files.getlist('files')
-        if not files or all(file.filename == '' for file in files):
-            return jsonify({'message': 'Nie przekazano żadnych plików'}), 400
-        
-        output_format = request.args.get('outputFormat', 'A4')
-        temp_files = []
-        pdf_files = []
-        image_files = []
-        
-        try:
-            # Zapisz pliki tymczasowo i sprawdź formaty
-            for file in files:
-                if file and file.filename:
-                    temp_path = tempfile.mktemp(suffix=os.path.splitext(file.filename)[1])
-                    file.save(temp_path)
-                    temp_files.append(temp_path)
-                    
-                    if allowed_pdf_file(file.filename):
-                        pdf_files.append(temp_path)
-                    elif allowed_image_file(file.filename):
-                        image_files.append(temp_path)
-            
-            if not pdf_files and not image_files:
-                return jsonify({'message': 'Nie znaleziono prawidłowych plików PDF ani obrazów'}), 400
-            
-            # Połącz wszystkie pliki
-            merger = PyPDF2.PdfMerger()
-            
-            # Dodaj PDF-y
-            for pdf_file in pdf_files:
-                merger.append(pdf_file)
-            
-            # Konwertuj obrazy do PDF i dodaj
-            if image_files:
-                images_pdf_path = tempfile.mktemp(suffix='.pdf')
-                with open(images_pdf_path, "wb") as f:
-                    f.write(img2pdf.convert(image_files))
-                
-                merger.append(images_pdf_path)
-                temp_files.append(images_pdf_path)
-            
-            # Zapisz wynik
-            output_filename = f"merged_pdfs_and_images_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            output_path = os.path.join(app.config['UPLOAD_FOLDER'], output_filename)
-            
-            with open(output_path, 'wb') as output_file:
-                merger.write(output_file)
-            
-            merger.close()
-            
-            # Zwróć plik
-            return send_file(
-                output_path,
-                as_attachment=True,
-                download_name=output_filename,
-                mimetype='application/pdf'
-            )
-            
-        finally:
-            # Wyczyść pliki tymczasowe
-            for temp_file in temp_files:
-                if os.path.exists(temp_file):
-                    os.remove(temp_file)
-            if os.path.exists(output_path):
-                os.remove(output_path)
-                
-    except Exception as e:
-        return jsonify({'message': f'Błąd podczas łączenia plików PDF i obrazów: {str(e)}'}), 500
+    return run_operation('merge-all')
+
+@api.route('/api/pdf/optimize', methods=['POST'])
+def optimize():
+    """Zmniejsza PDF: rekompresja i zmniejszanie obrazów, deduplikacja strumieni i fontów"""
+    return run_operation('optimize')
+
+@api.route('/api/pdf/render', methods=['POST'])
+def render_page_image():
+    """Renderuje stronę PDF (lub jej wycinek) do PNG/JPEG - miniatury i podgląd.
 
-@app.route('/api/pdf/extract-text', methods=['POST'])
+    Strony przechodzą przez cache pixmap procesu (nagłówek ``X-Cache``). Podgląd
+    całej strony w rozdzielczości nie większej niż ``PIXMAP_CACHE_CANONICAL_DPI``
+    (domyślnie ``RENDER_DEFAULT_DPI``) trafia w cache także po wcześniejszym
+    odczycie kodów z tego samego pliku - ale tylko gdy skan działał w procesie
+    serwera (``CODE_SCAN_WORKERS=1`` lub dokument krótszy niż
+    ``CODE_SCAN_PARALLEL_MIN_PAGES`` stron). Strony skanowane w procesach
+    roboczych i wycinki renderowane w wysokiej rozdzielczości (``fine_dpi``)
+    nie są zapisywane w cache.
+    """
+    return run_operation('render')
+
+@api.route('/api/pdf/extract-text', methods=['POST'])
 def extract_text():
     """Ekstrahuje tekst z pliku PDF"""
+    return run_operation('extract-text')
+
+def iter_page_text(doc, output, options):
+    """Generuje tekst kolejnych stron zaraz po ich przetworzeniu (text lub ndjson)"""
+    started = time.perf_counter()
+    page_started = started
+    total_chars = 0
+    ocr_pages = 0
     try:
-        if 'file' not in request.files:
-            return jsonify({'message': 'Nie przekazano pliku'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'message': 'Nie przekazano pliku'}), 400
-        
-        if not allowed_pdf_file(file.filename):
-            return jsonify({'message': 'Przekazany plik nie jest plikiem PDF'}), 400
+        for result in text_extractor.iter_pages(doc, options):
+            text = result['text']
+            add_pages(1)
+            total_chars += len(text)
+            ocr_pages += result['source'] != 'text'
+            if output == 'ndjson':
+                yield json.dumps({
+                    'page': result['page'],
+                    'chars': len(text),
+                    'source': result['source'],
+                    'elapsedMs': round((time.perf_counter() - page_started) * 1000, 3),
+                    'text': text
+                }, ensure_ascii=False) + '\n'
+            else:
+                yield f"Strona {result['page']}:\n{text}\n\n"
+            page_started = time.perf_counter()
         
-        temp_path = None
-        try:
-            # Zapisz plik tymczasowo
-            temp_path = tempfile.mktemp(suffix='.pdf')
-            file.save(temp_path)
-            
-            # Ekstrahuj tekst używając PyMuPDF
-            doc = fitz.open(temp_path)
-            extracted_text = ""
-            
-            for page_num in range(len(doc)):
-                page = doc.load_page(page_num)
-                extracted_text += f"Strona {page_num + 1}:\n{page.get_text()}\n\n"
-            
-            doc.close()
-            
-            # Zwróć tekst jako plik
-            output_filename = f"{os.path.splitext(file.filename)[0]}_extracted_text.txt"
-            
-            return send_file(
-                io.BytesIO(extracted_text.encode('utf-8')),
-                as_attachment=True,
-                download_name=output_filename,
-                mimetype='text/plain'
-            )
-            
-        finally:
-            if temp_path and os.path.exists(temp_path):
-                os.remove(temp_path)
-                
+        if output == 'ndjson':
+            yield json.dumps({
+                'done': True,
+                'pages': len(doc),
+                'ocrPages': ocr_pages,
+                'totalChars': total_chars,
+                'elapsedMs': round((time.perf_counter() - started) * 1000, 3)
+            }) + '\n'
     except Exception as e:
-        return jsonify({'message': f'Błąd podczas ekstrakcji tekstu z PDF: {str(e)}'}), 500
+        # Nagłówki zostały już wysłane - błąd trafia do strumienia
+        if output == 'ndjson':
+            yield json.dumps({'error': f'Błąd podczas ekstrakcji tekstu z PDF: {str(e)}'}, ensure_ascii=False) + '\n'
+        else:
+            yield f"\n[Błąd podczas ekstrakcji tekstu z PDF: {str(e)}]\n"
 
-@app.route('/api/pdf/supported-formats', methods=['GET'])
+def iter_page_structure_lines(doc, output):
+    """Generuje struktury kolejnych stron jako NDJSON (format blocks|words|json)"""
+    started = time.perf_counter()
+    try:
+        for structure in iter_page_structures(doc, output):
+            add_pages(1)
+            yield compact_json(structure) + '\n'
+        yield json.dumps({
+            'done': True,
+            'pages': len(doc),
+            'elapsedMs': round((time.perf_counter() - started) * 1000, 3)
+        }) + '\n'
+    except Exception as e:
+        yield json.dumps({'error': f'Błąd podczas ekstrakcji tekstu z PDF: {str(e)}'}, ensure_ascii=False) + '\n'
+
+def prepare_extract_stream(uploaded, output, options):
+    """Zwraca funkcję otwierającą dokument i tworzącą odpowiedź strumieniową w formacie ``output``"""
+    def run():
+        doc = uploaded.open_pdf()
+        if output in STRUCTURED_FORMATS:
+            lines = iter_page_structure_lines(doc, output)
+        else:
+            lines = iter_page_text(doc, output, options)
+        mimetype = 'text/plain' if output == 'text' else 'application/x-ndjson'
+        response = Response(stream_with_context(lines), mimetype=f'{mimetype}; charset=utf-8')
+        response.headers['X-Accel-Buffering'] = 'no'
+        response.headers['X-Page-Count'] = str(len(doc))
+        response.call_on_close(doc.close)
+        return response
+    return run
+
+@api.route('/api/pdf/extract-text/stream', methods=['POST'])
+def extract_text_stream():
+    """Strumieniowa ekstrakcja tekstu strona po stronie (format=text|ndjson|blocks|words|json)"""
+    uploads = upload_batch()
+    try:
+        response = prepare_extract_text(uploads, stream=True)()
+    except Exception as e:
+        uploads.close()
+        return operation_error(e, 'Błąd podczas ekstrakcji tekstu z PDF')
+    # Wywoływane także gdy klient rozłączy się przed końcem strumienia (po zamknięciu dokumentu)
+    response.call_on_close(uploads.close)
+    return response
+
+@api.route('/api/pdf/supported-formats', methods=['GET'])
 def supported_formats():
     """Zwraca informacje o obsługiwanych formatach plików"""
     return jsonify({
@@ -311,7 +903,7 @@ def supported_formats():
         'description': 'Implementacja Python z bibliotekami PyMuPDF, img2pdf i PyPDF2',
         'supportedImageFormats': list(ALLOWED_IMAGE_EXTENSIONS),
         'supportedPdfFormats': list(ALLOWED_PDF_EXTENSIONS),
-        'supportedOutputFormats': ['A4', 'A3', 'A5', 'LETTER'],
+        'supportedOutputFormats': ['A4', 'A3', 'A5', 'LETTER', 'ORIGINAL'],
         'features': [
             'Pełna ekstrakcja tekstu z PDF',
             'Wysokiej jakości konwersja obrazów',
@@ -320,283 +912,577 @@ def supported_formats():
         ]
     })
 
-@app.route('/api/pdf/read-barcodes', methods=['POST'])
+def optional_int_arg(name, error=ScanOptionsError):
+    """Zwraca parametr zapytania jako int (None gdy brak)"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise error(f'Parametr {name} musi być liczbą całkowitą')
+
+def code_scan_options():
+    """Odczytuje parametry skanowania kodów z zapytania (pages, timeout, stopAtFirst, render*)"""
+    try:
+        timeout = float(request.args.get('timeout', CODE_SCAN_TIMEOUT))
+    except ValueError:
+        timeout = CODE_SCAN_TIMEOUT
+    if CODE_SCAN_TIMEOUT > 0:
+        timeout = min(timeout, CODE_SCAN_TIMEOUT) if timeout > 0 else CODE_SCAN_TIMEOUT
+    return {
+        'pages': request.args.get('pages', 'all'),
+        'timeout': timeout if timeout > 0 else None,
+        'stop_at_first': request.args.get('stopAtFirst', 'false').lower() in ('1', 'true', 'yes'),
+        'render': render_options(
+            mode=request.args.get('renderMode', CODE_RENDER_MODE).lower(),
+            dpi=optional_int_arg('dpi'),
+            coarse_dpi=optional_int_arg('coarseDpi'),
+            fine_dpi=optional_int_arg('fineDpi')
+        )
+    }
+
+def read_codes(uploaded, is_pdf, kinds, options, progress=no_progress):
+    """Odczytuje kody z obrazu lub PDF; zwraca (kody, statystyki skanowania, status cache)"""
+    # Limit czasu nie zmienia wyniku kompletnego skanu - nie jest częścią klucza
+    key_params = {name: value for name, value in options.items() if name != 'timeout'}
+    key = cache_key(uploaded.sha256(), 'read-codes', {'kinds': sorted(kinds), 'pdf': is_pdf, **key_params})
+    cached = result_cache.get(key)
+    if cached is not None:
+        result = json.loads(cached)
+        return result['codes'], result['scan'], 'HIT'
+    
+    if is_pdf:
+        # Dla PDF - strony renderowane i dekodowane równolegle
+        scan = code_scanner.scan_document(uploaded, kinds, progress=progress, **options)
+        codes = scan.pop('codes')
+        for page_stats in scan['render']['pages']:
+            for name, elapsed_ms in page_stats.get('timings', {}).items():
+                observe_stage(name, elapsed_ms / 1000)
+        add_pages(len(scan['scannedPages']))
+    else:
+        # Dla obrazów - bezpośrednie odczytywanie
+        with stage('decode_image'):
+            img_array = uploaded.decode_image(cv2.IMREAD_GRAYSCALE)
+        timings = {}
+        codes, scan = scan_image(img_array, kinds, timings=timings), None
+        for name, elapsed_ms in timings.items():
+            observe_stage(name, elapsed_ms / 1000)
+    
+    # Częściowe wyniki (przekroczony czas) nie trafiają do cache
+    if not (scan and scan['timedOut']):
+        result_cache.put(key, json.dumps({'codes': codes, 'scan': scan}, ensure_ascii=False).encode('utf-8'))
+    return codes, scan, 'MISS'
+
+def prepare_read_codes(uploads, kinds, build_body):
+    """Przyjmuje plik do odczytu kodów; ``build_body`` buduje odpowiedź z listy kodów"""
+    file = request_file()
+    uploaded = uploads.add(file)
+    is_pdf = file.filename.lower().endswith('.pdf')
+    options = code_scan_options() if is_pdf else {}
+    
+    def run(progress):
+        codes, scan, cache_status = read_codes(uploaded, is_pdf, kinds, options, progress)
+        body = build_body(codes)
+        body['timestamp'] = datetime.now().isoformat()
+        if scan:
+            body['scan'] = scan
+        return OperationResult(body=body, headers={'X-Cache': cache_status})
+    return run
+
+def prepare_read_barcodes(uploads):
+    return prepare_read_codes(uploads, ('barcode',), lambda codes: {
+        'success': True,
+        'barcodes': codes,
+        'count': len(codes)
+    })
+
+def prepare_read_qr_codes(uploads):
+    return prepare_read_codes(uploads, ('qr',), lambda codes: {
+        'success': True,
+        'qrCodes': codes,
+        'count': len(codes)
+    })
+
+def prepare_read_all_codes(uploads):
+    return prepare_read_codes(uploads, CODE_KINDS, lambda codes: {
+        'success': True,
+        'codes': codes,
+        'barcodes': [code for code in codes if code['type'] == 'barcode'],
+        'qrCodes': [code for code in codes if code['type'] == 'qr'],
+        'totalCount': len(codes)
+    })
+
+@api.route('/api/pdf/read-barcodes', methods=['POST'])
 def read_barcodes():
     """Odczytywanie kodów kreskowych z obrazu/PDF"""
-    try:
-        if 'file' not in request.files:
-            return jsonify({'message': 'Nie przekazano pliku'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'message': 'Nie wybrano pliku'}), 400
-        
-        # Zapisz plik tymczasowo
-        temp_path = tempfile.mktemp(suffix=os.path.splitext(file.filename)[1])
-        file.save(temp_path)
-        
-        barcodes = []
-        
-        try:
-            if file.filename.lower().endswith('.pdf'):
-                # Dla PDF - wyodrębnij strony jako obrazy
-                doc = fitz.open(temp_path)
-                for page_num in range(min(3, len(doc))):  # Pierwsze 3 strony
-                    page = doc.load_page(page_num)
-                    pix = page.get_pixmap()
-                    img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(
-                        pix.height, pix.width, pix.n
-                    )
-                    
-                    # Konwertuj do formatu OpenCV
-                    if pix.n == 4:  # RGBA
-                        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2BGR)
-                    else:  # RGB
-                        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-                    
-                    # Odczytywanie kodów kreskowych
-                    detected_barcodes = pyzbar.decode(img_array)
-                    for barcode in detected_barcodes:
-                        barcodes.append({
-                            'type': 'barcode',
-                            'data': barcode.data.decode('utf-8'),
-                            'format': barcode.type,
-                            'confidence': 1.0,
-                            'page': page_num + 1,
-                            'bounds': {
-                                'x': barcode.rect.left,
-                                'y': barcode.rect.top,
-                                'width': barcode.rect.width,
-                                'height': barcode.rect.height
-                            }
-                        })
-                
-                doc.close()
-            else:
-                # Dla obrazów - bezpośrednie odczytywanie
-                img_array = cv2.imread(temp_path)
-                detected_barcodes = pyzbar.decode(img_array)
-                
-                for barcode in detected_barcodes:
-                    barcodes.append({
-                        'type': 'barcode',
-                        'data': barcode.data.decode('utf-8'),
-                        'format': barcode.type,
-                        'confidence': 1.0,
-                        'bounds': {
-                            'x': barcode.rect.left,
-                            'y': barcode.rect.top,
-                            'width': barcode.rect.width,
-                            'height': barcode.rect.height
-                        }
-                    })
-        
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        
-        return jsonify({
-            'success': True,
-            'barcodes': barcodes,
-            'count': len(barcodes),
-            'timestamp': datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        return jsonify({'message': f'Błąd podczas odczytywania kodów kreskowych: {str(e)}'}), 500
+    return run_operation('read-barcodes')
 
-@app.route('/api/pdf/read-qr-codes', methods=['POST'])
+@api.route('/api/pdf/read-qr-codes', methods=['POST'])
 def read_qr_codes():
     """Odczytywanie kodów QR z obrazu/PDF"""
-    try:
-        if 'file' not in request.files:
-            return jsonify({'message': 'Nie przekazano pliku'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'message': 'Nie wybrano pliku'}), 400
-        
-        # Zapisz plik tymczasowo
-        temp_path = tempfile.mktemp(suffix=os.path.splitext(file.filename)[1])
-        file.save(temp_path)
-        
-        qr_codes = []
-        
-        try:
-            if file.filename.lower().endswith('.pdf'):
-                # Dla PDF - wyodrębnij strony jako obrazy
-                doc = fitz.open(temp_path)
-                qreader = QReader()
-                
-                for page_num in range(min(3, len(doc))):  # Pierwsze 3 strony
-                    page = doc.load_page(page_num)
-                    pix = page.get_pixmap()
-                    img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(
-                        pix.height, pix.width, pix.n
-                    )
-                    
-                    # Konwertuj do formatu OpenCV
-                    if pix.n == 4:  # RGBA
-                        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2BGR)
-                    else:  # RGB
-                        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-                    
-                    # Odczytywanie kodów QR
-                    decoded_text = qreader.detect_and_decode(image=img_array)
-                    if decoded_text:
-                        qr_codes.append({
-                            'type': 'qr',
-                            'data': decoded_text,
-                            'format': 'QR_CODE',
-                            'confidence': 1.0,
-                            'page': page_num + 1
-                        })
-                
-                doc.close()
-            else:
-                # Dla obrazów - bezpośrednie odczytywanie
-                img_array = cv2.imread(temp_path)
-                qreader = QReader()
-                decoded_text = qreader.detect_and_decode(image=img_array)
-                
-                if decoded_text:
-                    qr_codes.append({
-                        'type': 'qr',
-                        'data': decoded_text,
-                        'format': 'QR_CODE',
-                        'confidence': 1.0
-                    })
-        
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        
-        return jsonify({
-            'success': True,
-            'qrCodes': qr_codes,
-            'count': len(qr_codes),
-            'timestamp': datetime.now().isoformat()
-        })
-        
-    except Exception as e:
-        return jsonify({'message': f'Błąd podczas odczytywania kodów QR: {str(e)}'}), 500
+    return run_operation('read-qr-codes')
 
-@app.route('/api/pdf/read-all-codes', methods=['POST'])
+@api.route('/api/pdf/read-all-codes', methods=['POST'])
 def read_all_codes():
     """Odczytywanie wszystkich kodów (kreskowych i QR) z obrazu/PDF"""
+    return run_operation('read-all-codes')
+
+class BatchLimitError(Exception):
+    """Przekroczono limit liczby lub rozmiaru plików w żądaniu wsadowym"""
+
+def request_kinds():
+    """Rodzaje kodów z parametru ``kinds`` (domyślnie wszystkie)"""
+    value = request.args.get('kinds')
+    if not value:
+        return list(CODE_KINDS)
+    kinds = [kind.strip().lower() for kind in value.split(',') if kind.strip()]
+    unknown = [kind for kind in kinds if kind not in CODE_KINDS]
+    if unknown or not kinds:
+        raise RequestError(f'Nieobsługiwany rodzaj kodów: {", ".join(unknown) or value} (dozwolone: barcode, qr)')
+    return kinds
+
+def iter_archive_members(file):
+    """Zwraca kolejno (nazwa, strumień, rozmiar) plików archiwum zip/tar czytanego z uploadu"""
+    if file.filename.lower().endswith('.zip'):
+        with zipfile.ZipFile(file.stream) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, member, info.file_size
+    else:
+        # Tryb strumieniowy - elementy czytane po kolei, bez przewijania archiwum
+        with tarfile.open(fileobj=file.stream, mode='r|*') as archive:
+            for member in archive:
+                if member.isfile():
+                    yield member.name, archive.extractfile(member), member.size
+
+def iter_batch_sources(files, uploads):
+    """Przyjmuje pliki i zawartość archiwów; zwraca kolejno (nazwa, UploadedFile lub None, błąd)"""
+    count = 0
+    extracted = 0
+    for file in files:
+        if not file or not file.filename:
+            continue
+        if file.filename.lower().endswith(ARCHIVE_EXTENSIONS):
+            try:
+                for name, stream, size in iter_archive_members(file):
+                    # Pozostałe elementy archiwum (np. __MACOSX, pliki tekstowe) są pomijane
+                    if not (allowed_pdf_file(name) or allowed_image_file(name)):
+                        continue
+                    count += 1
+                    extracted += size
+                    if count > BATCH_MAX_FILES or extracted > BATCH_MAX_EXTRACTED_BYTES:
+                        raise BatchLimitError(
+                            f'Przekroczono limit żądania wsadowego ({BATCH_MAX_FILES} plików, '
+                            f'{BATCH_MAX_EXTRACTED_BYTES} B po rozpakowaniu)'
+                        )
+                    yield name, uploads.add_stream(name, stream, size), None
+            except (zipfile.BadZipFile, tarfile.TarError) as e:
+                yield file.filename, None, f'Nieprawidłowe archiwum: {str(e)}'
+        elif allowed_pdf_file(file.filename) or allowed_image_file(file.filename):
+            count += 1
+            if count > BATCH_MAX_FILES:
+                raise BatchLimitError(f'Przekroczono limit żądania wsadowego ({BATCH_MAX_FILES} plików)')
+            yield file.filename, uploads.add(file), None
+        else:
+            yield file.filename, None, 'Nieobsługiwany format pliku'
+
+def read_batch_file(uploaded, kinds, options):
+    """Odczytuje kody z jednego pliku wsadu i zwalnia go; zwraca wpis wyniku"""
+    started = time.perf_counter()
+    is_pdf = uploaded.extension == '.pdf'
     try:
-        if 'file' not in request.files:
-            return jsonify({'message': 'Nie przekazano pliku'}), 400
-        
-        file = request.files['file']
-        if file.filename == '':
-            return jsonify({'message': 'Nie wybrano pliku'}), 400
-        
-        # Zapisz plik tymczasowo
-        temp_path = tempfile.mktemp(suffix=os.path.splitext(file.filename)[1])
-        file.save(temp_path)
-        
-        all_codes = []
-        
-        try:
-            if file.filename.lower().endswith('.pdf'):
-                # Dla PDF - wyodrębnij strony jako obrazy
-                doc = fitz.open(temp_path)
-                qreader = QReader()
-                
-                for page_num in range(min(3, len(doc))):  # Pierwsze 3 strony
-                    page = doc.load_page(page_num)
-                    pix = page.get_pixmap()
-                    img_array = np.frombuffer(pix.samples, dtype=np.uint8).reshape(
-                        pix.height, pix.width, pix.n
-                    )
-                    
-                    # Konwertuj do formatu OpenCV
-                    if pix.n == 4:  # RGBA
-                        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGBA2BGR)
-                    else:  # RGB
-                        img_array = cv2.cvtColor(img_array, cv2.COLOR_RGB2BGR)
-                    
-                    # Odczytywanie kodów kreskowych
-                    detected_barcodes = pyzbar.decode(img_array)
-                    for barcode in detected_barcodes:
-                        all_codes.append({
-                            'type': 'barcode',
-                            'data': barcode.data.decode('utf-8'),
-                            'format': barcode.type,
-                            'confidence': 1.0,
-                            'page': page_num + 1,
-                            'bounds': {
-                                'x': barcode.rect.left,
-                                'y': barcode.rect.top,
-                                'width': barcode.rect.width,
-                                'height': barcode.rect.height
-                            }
-                        })
-                    
-                    # Odczytywanie kodów QR
-                    decoded_text = qreader.detect_and_decode(image=img_array)
-                    if decoded_text:
-                        all_codes.append({
-                            'type': 'qr',
-                            'data': decoded_text,
-                            'format': 'QR_CODE',
-                            'confidence': 1.0,
-                            'page': page_num + 1
-                        })
-                
-                doc.close()
+        codes, scan, cache_status = read_codes(uploaded, is_pdf, kinds, options if is_pdf else {})
+    finally:
+        uploaded.close()
+    entry = {
+        'codes': codes,
+        'count': len(codes),
+        'cache': cache_status,
+        'elapsedMs': round((time.perf_counter() - started) * 1000, 3)
+    }
+    if scan:
+        entry.update(pageCount=scan['pageCount'], scannedPages=len(scan['scannedPages']), timedOut=scan['timedOut'])
+    return entry
+
+def iter_batch_results(sources, kinds, options):
+    """Zleca pliki do puli i zwraca wiersze NDJSON w kolejności ukończenia"""
+    started = time.perf_counter()
+    summary = {'files': 0, 'codes': 0, 'errors': 0}
+    pending = {}
+    max_in_flight = BATCH_WORKERS * 2  # Ogranicza liczbę przyjętych, a nieprzetworzonych plików
+
+    def line(body):
+        return json.dumps(body, ensure_ascii=False) + '\n'
+
+    def completed(block):
+        done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+        for future in done:
+            index, filename = pending.pop(future)
+            try:
+                entry = future.result()
+                summary['codes'] += entry['count']
+            except Exception as e:
+                entry = {'error': str(e)}
+                summary['errors'] += 1
+            yield line({'index': index, 'filename': filename, **entry})
+
+    index = 0
+    try:
+        for filename, uploaded, error in sources:
+            if error:
+                summary['errors'] += 1
+                yield line({'index': index, 'filename': filename, 'error': error})
             else:
-                # Dla obrazów - bezpośrednie odczytywanie
-                img_array = cv2.imread(temp_path)
-                qreader = QReader()
-                
-                # Odczytywanie kodów kreskowych
-                detected_barcodes = pyzbar.decode(img_array)
-                for barcode in detected_barcodes:
-                    all_codes.append({
-                        'type': 'barcode',
-                        'data': barcode.data.decode('utf-8'),
-                        'format': barcode.type,
-                        'confidence': 1.0,
-                        'bounds': {
-                            'x': barcode.rect.left,
-                            'y': barcode.rect.top,
-                            'width': barcode.rect.width,
-                            'height': barcode.rect.height
-                        }
-                    })
-                
-                # Odczytywanie kodów QR
-                decoded_text = qreader.detect_and_decode(image=img_array)
-                if decoded_text:
-                    all_codes.append({
-                        'type': 'qr',
-                        'data': decoded_text,
-                        'format': 'QR_CODE',
-                        'confidence': 1.0
-                    })
-        
-        finally:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        
-        return jsonify({
-            'success': True,
-            'codes': all_codes,
-            'barcodes': [code for code in all_codes if code['type'] == 'barcode'],
-            'qrCodes': [code for code in all_codes if code['type'] == 'qr'],
-            'totalCount': len(all_codes),
-            'timestamp': datetime.now().isoformat()
-        })
-        
+                while len(pending) >= max_in_flight:
+                    yield from completed(block=True)
+                # Kopia kontekstu - etapy trafiają na oś czasu żądania
+                future = batch_executor.submit(
+                    contextvars.copy_context().run, read_batch_file, uploaded, kinds, options
+                )
+                pending[future] = (index, filename)
+                summary['files'] += 1
+                yield from completed(block=False)
+            index += 1
+        while pending:
+            yield from completed(block=True)
+    except Exception as e:
+        # Nagłówki zostały już wysłane - błąd trafia do strumienia, zleconych plików nie porzucamy
+        summary['errors'] += 1
+        yield line({'error': str(e), 'fatal': True})
+        while pending:
+            yield from completed(block=True)
+    finally:
+        for future in pending:
+            future.cancel()
+    yield line({'done': True, **summary, 'elapsedMs': round((time.perf_counter() - started) * 1000, 3)})
+
+@api.route('/api/pdf/read-codes/batch', methods=['POST'])
+def read_codes_batch():
+    """Odczyt kodów z wielu plików lub archiwów zip/tar; wyniki NDJSON w kolejności ukończenia"""
+    try:
+        files = request_files()
+        kinds = request_kinds()
+        options = code_scan_options()
+    except Exception as e:
+        return operation_error(e, 'Błąd podczas odczytywania kodów')
+    
+    uploads = upload_batch()
+    response = Response(
+        stream_with_context(iter_batch_results(iter_batch_sources(files, uploads), kinds, options)),
+        mimetype='application/x-ndjson; charset=utf-8'
+    )
+    response.headers['X-Accel-Buffering'] = 'no'
+    # Wywoływane także gdy klient rozłączy się przed końcem strumienia
+    response.call_on_close(uploads.close)
+    return response
+
+# Operacje dostępne synchronicznie (/api/pdf/...) i jako zadania (/api/jobs/...)
+OPERATIONS = {
+    'merge-pdfs': (prepare_merge_pdfs, 'Błąd podczas łączenia plików PDF'),
+    'images-to-pdf': (prepare_images_to_pdf, 'Błąd podczas konwersji obrazów do PDF'),
+    'merge-all': (prepare_merge_all, 'Błąd podczas łączenia plików PDF i obrazów'),
+    'extract-text': (prepare_extract_text, 'Błąd podczas ekstrakcji tekstu z PDF'),
+    'read-barcodes': (prepare_read_barcodes, 'Błąd podczas odczytywania kodów kreskowych'),
+    'read-qr-codes': (prepare_read_qr_codes, 'Błąd podczas odczytywania kodów QR'),
+    'read-all-codes': (prepare_read_all_codes, 'Błąd podczas odczytywania kodów'),
+    'render': (prepare_render, 'Błąd podczas renderowania strony PDF'),
+    'optimize': (prepare_optimize, 'Błąd podczas optymalizacji PDF'),
+}
+
+def job_body(job):
+    body = job.to_dict()
+    body['statusUrl'] = f'/api/jobs/{job.id}'
+    body['resultUrl'] = f'/api/jobs/{job.id}/result'
+    return body
+
+def run_job(operation, runner, job):
+    """Wykonuje operację w wątku zadania z własną osią czasu etapów"""
+    with metrics.timeline(f'job:{operation}') as job_timeline:
+        result = runner(job.update_progress).detach()
+    if METRICS_SERVER_TIMING:
+        result.headers['Server-Timing'] = job_timeline.server_timing()
+    return result
+
+@api.route('/api/jobs/<operation>', methods=['POST'])
+def submit_job(operation):
+    """Zleca operację do wykonania w tle; zwraca identyfikator zadania (202)"""
+    if operation not in OPERATIONS:
+        return jsonify({'message': f'Nieznana operacja: {operation}'}), 404
+    
+    prepare, error_message = OPERATIONS[operation]
+    uploads = upload_batch()
+    try:
+        runner = prepare(uploads)
+        job = job_manager.submit(
+            operation,
+            lambda job: run_job(operation, runner, job),
+            cleanup=uploads.close
+        )
+    except JobQueueFull as e:
+        uploads.close()
+        response = jsonify({'message': str(e)})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+        return response
     except Exception as e:
-        return jsonify({'message': f'Błąd podczas odczytywania kodów: {str(e)}'}), 500
+        uploads.close()
+        return operation_error(e, error_message)
+    
+    response = jsonify(job_body(job))
+    response.status_code = 202
+    response.headers['Location'] = f'/api/jobs/{job.id}'
+    return response
+
+@api.route('/api/jobs', methods=['GET'])
+def jobs_stats():
+    """Zwraca stan kolejki zadań"""
+    return jsonify(job_manager.stats())
+
+@api.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Stan i postęp zadania; ?wait=N czeka do N sekund na zmianę (long-poll, opcjonalnie od ?version=)"""
+    try:
+        wait_seconds = min(float(request.args.get('wait', 0) or 0), JOB_MAX_WAIT)
+    except ValueError:
+        wait_seconds = 0
+    version = request.args.get('version', type=int)
+    
+    job = job_manager.wait(job_id, wait_seconds, version) if wait_seconds > 0 else job_manager.get(job_id)
+    if job is None:
+        return jsonify({'message': 'Nie znaleziono zadania'}), 404
+    return jsonify(job_body(job))
 
-@app.route('/health', methods=['GET'])
+@api.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """Pobiera wynik zakończonego zadania (plik lub JSON)"""
+    job = job_manager.get(job_id)
+    if job is None:
+        return jsonify({'message': 'Nie znaleziono zadania'}), 404
+    if job.status == JOB_FAILED:
+        return jsonify({'message': f'{OPERATIONS[job.operation][1]}: {job.error}'}), 500
+    if job.status == JOB_CANCELLED:
+        return jsonify({'message': 'Zadanie zostało anulowane'}), 410
+    if not job.finished:
+        response = jsonify({'message': 'Zadanie nie zostało jeszcze zakończone', **job_body(job)})
+        response.status_code = 409
+        response.headers['Retry-After'] = str(JOB_RETRY_AFTER)
+        return response
+    result = job.result
+    try:
+        if result is None:
+            raise ResultClosed('Wynik został usunięty')
+        return result.to_response()
+    except ResultClosed:
+        return jsonify({'message': 'Nie znaleziono zadania'}), 404  # Usunięte w międzyczasie
+
+@api.route('/api/jobs/<job_id>', methods=['DELETE'])
+def delete_job(job_id):
+    """Anuluje zadanie oczekujące w kolejce lub usuwa wynik zakończonego"""
+    if job_manager.cancel(job_id) or job_manager.remove(job_id):
+        return jsonify({'jobId': job_id, 'deleted': True})
+    if job_manager.get(job_id) is None:
+        return jsonify({'message': 'Nie znaleziono zadania'}), 404
+    return jsonify({'message': 'Zadanie jest w trakcie wykonywania'}), 409
+
+@api.route('/api/pdf/qr-detector-stats', methods=['GET'])
+def qr_detector_stats():
+    """Zwraca metryki puli detektorów QR (czas oczekiwania vs czas inferencji) i limit modeli w workerze"""
+    scan_workers = code_scanner.stats()
+    return jsonify({
+        **qr_detector_pool.stats(),
+        'scanWorkers': scan_workers,
+        # Pula serwera + po jednym modelu w każdym procesie skanującym kody QR
+        'maxInstances': qr_detector_pool.size + scan_workers['qrWorkers'],
+    })
+
+@api.route('/api/pdf/ocr-reader-stats', methods=['GET'])
+def ocr_reader_stats():
+    """Zwraca metryki puli czytników OCR (czas oczekiwania vs czas inferencji)"""
+    return jsonify(ocr_reader_pool.stats())
+
+@api.route('/api/pdf/image-pool-stats', methods=['GET'])
+def image_pool_stats_route():
+    """Zwraca stan puli przygotowującej obrazy (wątki, pamięć w toku)"""
+    return jsonify(image_pool_stats())
+
+@api.route('/api/pdf/pixmap-cache-stats', methods=['GET'])
+def pixmap_cache_stats():
+    """Zwraca liczniki cache wyrenderowanych stron (wspólnego dla podglądu i odczytu kodów)"""
+    return jsonify(pixmap_cache.stats())
+
+@api.route('/api/pdf/admission-stats', methods=['GET'])
+def admission_stats():
+    """Zwraca stan kontroli dopuszczenia (zajętość grup, kolejki, odrzucenia)"""
+    return jsonify(admission.stats())
+
+@api.route('/api/pdf/cache-stats', methods=['GET'])
+def cache_stats():
+    """Zwraca liczniki cache wyników (trafienia, chybienia, eksmisje)"""
+    return jsonify(result_cache.stats())
+
+def service_gauges():
+    """Stan cache, kolejki zadań i pul dla ``/metrics``"""
+    cache = result_cache.stats()
+    jobs = job_manager.stats()
+    images = image_pool_stats()
+    qr = qr_detector_pool.stats()
+    ocr = ocr_reader_pool.stats()
+    pixmaps = pixmap_cache.stats()
+    return [
+        ('pdf_service_cache_hits_total', 'counter', 'Trafienia cache wyników', cache['hits']),
+        ('pdf_service_cache_misses_total', 'counter', 'Chybienia cache wyników', cache['misses']),
+        ('pdf_service_cache_memory_bytes', 'gauge', 'Rozmiar warstwy cache w pamięci', cache['memoryBytes']),
+        ('pdf_service_pixmap_cache_hits_total', 'counter', 'Trafienia cache pixmap', pixmaps['hits']),
+        ('pdf_service_pixmap_cache_misses_total', 'counter', 'Chybienia cache pixmap', pixmaps['misses']),
+        ('pdf_service_pixmap_cache_bytes', 'gauge', 'Rozmiar cache pixmap', pixmaps['bytes']),
+        ('pdf_service_job_queue_depth', 'gauge', 'Zadania oczekujące w kolejce', jobs['queueDepth']),
+        ('pdf_service_image_inflight_bytes', 'gauge', 'Zdekodowane bitmapy w toku', images['inFlightBytes']),
+        ('pdf_service_qr_detectors_loaded', 'gauge', 'Załadowane detektory QR', qr['loaded']),
+        ('pdf_service_ocr_readers_loaded', 'gauge', 'Załadowane czytniki OCR', ocr['loaded']),
+    ]
+
+metrics.registry.add_collector(service_gauges)
+
+def request_endpoint():
+    """Etykieta endpointu - wzorzec trasy (ograniczona liczba wartości)"""
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+@api.before_app_request
+def start_request_metrics():
+    g.metrics_timeline, g.metrics_token = metrics.start_timeline(request_endpoint())
+    g.metrics_profile = request_profiler.maybe_start()
+
+@api.before_app_request
+def admit_request():
+    """Dopuszcza kosztowne żądanie przed odczytem treści; przy przeciążeniu zwraca 429"""
+    endpoint = ADMISSION_ENDPOINTS.get(request_endpoint())
+    if not admission.enabled or endpoint is None or request.method != 'POST':
+        return None
+    group, memory_factor = endpoint
+    size = request.content_length or 0
+    try:
+        with stage('admission'):
+            g.admission_ticket = admission.admit(
+                group, weight=1 + size // ADMISSION_UNIT_BYTES, memory=size * memory_factor
+            )
+    except AdmissionRejected as e:
+        response = jsonify({'message': str(e), 'reason': e.reason})
+        response.status_code = 429
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response
+    return None
+
+@api.after_app_request
+def record_request_metrics(response):
+    timeline = g.get('metrics_timeline')
+    if timeline is None:
+        return response
+    endpoint = timeline.endpoint
+    status = str(response.status_code)
+    metrics.REQUEST_DURATION.observe(
+        time.perf_counter() - timeline.started, endpoint=endpoint, method=request.method, status=status
+    )
+    if request.content_length:
+        metrics.REQUEST_BYTES.observe(request.content_length, endpoint=endpoint)
+    if response.content_length is not None:
+        metrics.RESPONSE_BYTES.observe(response.content_length, endpoint=endpoint)
+    if response.status_code >= 400:
+        metrics.ERRORS.inc(endpoint=endpoint, status=status)
+    if current_app.config['SERVER_TIMING'] and 'Server-Timing' not in response.headers:
+        response.headers['Server-Timing'] = timeline.server_timing()
+    return response
+
+@api.teardown_app_request
+def finish_request_metrics(exc):
+    ticket = g.pop('admission_ticket', None)
+    if ticket is not None:
+        ticket.release()
+    profile = g.pop('metrics_profile', None)
+    timeline = g.pop('metrics_timeline', None)
+    if profile is not None:
+        request_profiler.stop(profile, timeline.endpoint if timeline else request_endpoint())
+    token = g.pop('metrics_token', None)
+    if token is not None:
+        try:
+            metrics.end_timeline(token)
+        except ValueError:
+            pass  # Token z innego kontekstu (np. po strumieniowaniu odpowiedzi)
+
+@api.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Metryki w formacie tekstowym Prometheus (histogramy czasu żądań i etapów)"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+@api.route('/health', methods=['GET'])
 def health():
     """Endpoint sprawdzający stan serwisu"""
     return jsonify({'status': 'healthy', 'service': 'PythonPdfService'})
 
+@api.route('/ready', methods=['GET'])
+def ready():
+    """Gotowość do obsługi ruchu - 503 dopóki trwa rozgrzewka zależności"""
+    warmup = warmup_state()
+    is_ready = warmup['state'] in ('idle', 'done')
+    return jsonify({
+        'status': 'ready' if is_ready else warmup['state'],
+        'service': 'PythonPdfService',
+        'startupMode': STARTUP_MODE,
+        'warmup': warmup,
+        'imports': import_report()
+    }), 200 if is_ready else 503
+
+def warmup_dependencies():
+    """Ładuje zależności zgodnie z STARTUP_MODE (lazy - dopiero przy pierwszym użyciu)"""
+    if STARTUP_MODE not in ('background', 'eager') and not (QREADER_PREWARM or OCR_PREWARM):
+        return
+    if warmup_state()['state'] != 'idle':
+        return  # Rozgrzewka już uruchomiona w tym procesie
+    names = [name for name in WARMUP_SUBSYSTEMS if name in subsystems()] if STARTUP_MODE != 'lazy' else []
+    start_warmup(
+        names,
+        background=STARTUP_MODE != 'eager',
+        extra=prewarm_detectors if QREADER_PREWARM or OCR_PREWARM else None
+    )
+
+def prewarm_detectors():
+    """Ładuje z wyprzedzeniem detektory QR i czytniki OCR (QREADER_PREWARM, OCR_PREWARM)"""
+    if QREADER_PREWARM:
+        qr_detector_pool.warmup()
+    if OCR_PREWARM:
+        ocr_reader_pool.warmup()
+
+def create_app(config=None):
+    """Fabryka aplikacji dla serwerów WSGI, np. gunicorn -c gunicorn.conf.py 'app:create_app()'"""
+    flask_app = Flask(__name__)
+    flask_app.request_class = IngestRequest
+    flask_app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
+    flask_app.config['MAX_CONTENT_LENGTH'] = MAX_CONTENT_LENGTH
+    flask_app.config['UPLOAD_MAX_PART_SIZE'] = UPLOAD_MAX_PART_SIZE
+    flask_app.config['UPLOAD_MAX_PARTS'] = UPLOAD_MAX_PARTS
+    flask_app.config['TRUSTED_MAX_CONTENT_LENGTH'] = TRUSTED_MAX_CONTENT_LENGTH
+    flask_app.config['TRUSTED_MAX_PART_SIZE'] = TRUSTED_MAX_PART_SIZE
+    flask_app.config['TRUSTED_CLIENT_TOKENS'] = TRUSTED_CLIENT_TOKENS
+    flask_app.config['TRUSTED_CLIENT_NETWORKS'] = TRUSTED_CLIENT_NETWORKS
+    flask_app.config['INGEST_SPILL_THRESHOLD'] = INGEST_SPILL_THRESHOLD
+    flask_app.config['SERVER_TIMING'] = METRICS_SERVER_TIMING
+    if config:
+        flask_app.config.update(config)
+    
+    CORS(flask_app)
+    flask_app.register_blueprint(swaggerui_blueprint, url_prefix=SWAGGER_URL)
+    flask_app.register_blueprint(api)
+    
+    warmup_dependencies()
+    return flask_app
+
+def shutdown_workers():
+    """Zamyka pule procesów przy wyłączaniu workera"""
+    code_scanner.shutdown()
+    batch_executor.shutdown(wait=False, cancel_futures=True)
+    text_extractor.shutdown()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5032, debug=True) 
\ No newline at end of file
+    # Serwer deweloperski - produkcyjnie: gunicorn -c gunicorn.conf.py (aplikacja tworzona raz, przez fabrykę)
+    create_app().run(host='0.0.0.0', port=5032, debug=True)
@@ -0,0 +1,113 @@
+"""Mikrobenchmarki funkcji rdzenia (bez warstwy HTTP).
+
+Uruchomienie (z katalogu PythonPdfService):
+    python benchmarks/bench_core.py [--rounds 10] [--warmup 1] [--pages 200] [--only merge,extract]
+                                    [--json wynik.json] [--compare poprzedni.json]
+
+Każdy benchmark wykonuje ``--warmup`` przebiegów rozgrzewkowych i ``--rounds``
+mierzonych; raportowane są p50/p95/p99 i szczytowe RSS procesu. Wejście to pliki
+z ``test-files/`` i ``Data/`` oraz syntetyczny PDF o ``--pages`` stronach.
+``--compare`` wypisuje zmianę mediany względem wcześniej zapisanego pliku JSON.
+"""
+import argparse
+import sys
+import time
+
+from common import (  # ustawia sys.path na katalog serwisu
+    IMAGE_PATTERNS, PDF_PATTERNS, compare, latency_stats, load_samples, peak_rss_bytes, synthetic_pdf, write_json
+)
+
+from code_scanner import CODE_KINDS, CodeScanner, render_options, scan_pages  # noqa: E402
+from image_pipeline import image_options, images_to_pdf  # noqa: E402
+from ingest import UploadedFile  # noqa: E402
+from merge_engine import merge_documents, merge_options  # noqa: E402
+
+
+def uploaded(samples):
+    return [UploadedFile(name, data=data, size=len(data)) for name, data in samples]
+
+
+def extract_text(data):
+    import fitz
+
+    doc = fitz.open(stream=data, filetype='pdf')
+    try:
+        return sum(len(page.get_text()) for page in doc)
+    finally:
+        doc.close()
+
+
+def build_benchmarks(pages):
+    """Zwraca listę (nazwa, funkcja bez argumentów)"""
+    pdfs = uploaded(load_samples(PDF_PATTERNS))
+    images = uploaded(load_samples(IMAGE_PATTERNS))
+    large = synthetic_pdf(pages=pages, codes_every=10)
+    large_file = UploadedFile('synthetic.pdf', data=large, size=len(large))
+    a4 = image_options(page_size=(595, 842))
+    a4_downsampled = image_options(page_size=(595, 842), dpi=150)
+    render = render_options()
+    scanner = CodeScanner()
+
+    benchmarks = [
+        ('merge.samples', lambda: merge_documents(pdfs, options=merge_options())),
+        ('merge.synthetic', lambda: merge_documents([large_file, large_file], options=merge_options())),
+        ('merge.synthetic.pages', lambda: merge_documents(
+            [large_file], options=merge_options(),
+            selection=[(large_file, {'file': 0, 'start': 1, 'end': max(1, pages // 10), 'rotate': 0})]
+        )),
+        ('extract.synthetic', lambda: extract_text(large)),
+        ('codes.scan-serial', lambda: scan_pages(large, range(min(pages, 20)), CODE_KINDS, options=render)),
+        ('codes.scan-parallel', lambda: scanner.scan_document(large_file, CODE_KINDS, render=render)),
+    ]
+    if images:
+        benchmarks.append(('images.to-pdf-a4', lambda: images_to_pdf(images, a4)))
+        benchmarks.append(('images.to-pdf-a4-150dpi', lambda: images_to_pdf(images, a4_downsampled)))
+    return benchmarks, scanner
+
+
+def run_benchmark(func, rounds, warmup):
+    for _ in range(warmup):
+        func()
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    stats = latency_stats(timings)
+    stats['peakRssBytes'] = peak_rss_bytes()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rounds', type=int, default=10, help='liczba mierzonych przebiegów')
+    parser.add_argument('--warmup', type=int, default=1, help='liczba przebiegów rozgrzewkowych')
+    parser.add_argument('--pages', type=int, default=200, help='liczba stron syntetycznego PDF')
+    parser.add_argument('--only', help='prefiksy nazw benchmarków rozdzielone przecinkami')
+    parser.add_argument('--json', dest='json_path', help='zapisz wyniki do pliku JSON')
+    parser.add_argument('--compare', dest='baseline', help='porównaj z wynikami z pliku JSON')
+    args = parser.parse_args()
+
+    benchmarks, scanner = build_benchmarks(args.pages)
+    prefixes = [prefix.strip() for prefix in args.only.split(',')] if args.only else None
+    results = {}
+    try:
+        for name, func in benchmarks:
+            if prefixes and not any(name.startswith(prefix) for prefix in prefixes):
+                continue
+            results[name] = stats = run_benchmark(func, args.rounds, args.warmup)
+            print(f"{name:28} p50 {stats['p50Ms']:10.2f} ms   p95 {stats['p95Ms']:10.2f} ms   "
+                  f"p99 {stats['p99Ms']:10.2f} ms   RSS {stats['peakRssBytes'] / 2 ** 20:8.1f} MiB")
+    finally:
+        scanner.shutdown()
+
+    if args.baseline:
+        for name, change in compare(results, args.baseline).items():
+            print(f'{name:28} {change:+6.1f}% (p50)')
+    if args.json_path:
+        write_json(args.json_path, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,75 @@
+"""Porównanie silników łączenia PDF (PyMuPDF vs PyPDF2).
+
+Uruchomienie (z katalogu PythonPdfService):
+    python benchmarks/bench_merge.py [--repeat 5] [--scale 10] [--json wynik.json] [--compare poprzedni.json]
+
+Wejście to pliki PDF z ``test-files/`` i ``Data/``. ``--scale`` powiela listę
+wejściową, symulując łączenie większej liczby dokumentów.
+"""
+import argparse
+import os
+import sys
+import time
+
+from common import PDF_PATTERNS, compare, latency_stats, load_samples, write_json  # ustawia sys.path
+
+from ingest import UploadedFile  # noqa: E402
+from merge_engine import merge_documents, merge_options  # noqa: E402
+
+VARIANTS = [
+    ('pypdf2', {'engine': 'pypdf2'}),
+    ('pymupdf', {'engine': 'pymupdf', 'garbage': 0, 'compression': 0}),
+    ('pymupdf+garbage3+deflate', {'engine': 'pymupdf', 'garbage': 3, 'compression': 1}),
+    ('pymupdf+garbage4+deflate-all', {'engine': 'pymupdf', 'garbage': 4, 'compression': 2}),
+    ('pymupdf+linear', {'engine': 'pymupdf', 'garbage': 3, 'compression': 1, 'linearize': True}),
+]
+
+
+def run_variant(samples, options, repeat):
+    timings = []
+    output_size = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        output_buffer = merge_documents(samples, options=options)
+        timings.append((time.perf_counter() - started) * 1000)
+        output_size = output_buffer.seek(0, os.SEEK_END)
+        output_buffer.close()
+    stats = latency_stats(timings)
+    stats['outputBytes'] = output_size
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='liczba powtórzeń na wariant')
+    parser.add_argument('--scale', type=int, default=1, help='ile razy powielić listę wejściową')
+    parser.add_argument('--json', dest='json_path', help='zapisz wyniki do pliku JSON')
+    parser.add_argument('--compare', dest='baseline', help='porównaj z wynikami z pliku JSON')
+    args = parser.parse_args()
+
+    samples = [
+        UploadedFile(name, data=data, size=len(data)) for name, data in load_samples(PDF_PATTERNS)
+    ] * max(1, args.scale)
+    if not samples:
+        print('Brak plików PDF w katalogach próbek', file=sys.stderr)
+        return 1
+    input_bytes = sum(sample.size for sample in samples)
+    print(f'Wejście: {len(samples)} plików, {input_bytes} B, powtórzeń: {args.repeat}')
+
+    results = {}
+    for name, overrides in VARIANTS:
+        results[name] = stats = run_variant(samples, merge_options(**overrides), args.repeat)
+        stats.update(inputFiles=len(samples), inputBytes=input_bytes)
+        print(f"{name:32} p50 {stats['p50Ms']:10.2f} ms   min {stats['minMs']:10.2f} ms   "
+              f"wynik {stats['outputBytes']:>10} B")
+
+    if args.baseline:
+        for name, change in compare(results, args.baseline).items():
+            print(f'{name:32} {change:+6.1f}% (p50)')
+    if args.json_path:
+        write_json(args.json_path, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,143 @@
+"""Wspólne elementy benchmarków: próbki, syntetyczne PDF-y, statystyki i zapis JSON."""
+import glob
+import io
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(SERVICE_DIR)
+if SERVICE_DIR not in sys.path:
+    sys.path.insert(0, SERVICE_DIR)
+
+SAMPLE_DIRS = ('test-files', 'Data')
+PDF_PATTERNS = ('*.pdf',)
+IMAGE_PATTERNS = ('*.jpg', '*.jpeg', '*.png')
+
+
+def load_samples(patterns):
+    """Zwraca listę (nazwa, bajty) plików pasujących do wzorców z katalogów próbek"""
+    samples = []
+    for directory in SAMPLE_DIRS:
+        for pattern in patterns:
+            for path in sorted(glob.glob(os.path.join(REPO_DIR, directory, pattern))):
+                with open(path, 'rb') as f:
+                    samples.append((os.path.basename(path), f.read()))
+    return samples
+
+
+def synthetic_pdf(pages=100, codes_every=10, image_every=0):
+    """Buduje duży PDF: strony z tekstem, co ``codes_every`` strona z kodem QR,
+    co ``image_every`` strona z pełnostronicowym obrazem (szum - słabo kompresowalny)"""
+    import fitz
+
+    qr_png = _qr_png('BENCHMARK-QR') if codes_every else None
+    noise_png = _noise_png(1240, 1754) if image_every else None
+    doc = fitz.open()
+    try:
+        for index in range(pages):
+            page = doc.new_page(width=595, height=842)
+            text = '\n'.join(
+                f'Strona {index + 1}, wiersz {line + 1}: Lorem ipsum dolor sit amet, consectetur adipiscing elit.'
+                for line in range(40)
+            )
+            page.insert_textbox(fitz.Rect(40, 40, 555, 802), text, fontsize=9)
+            if qr_png and index % codes_every == 0:
+                page.insert_image(fitz.Rect(400, 650, 540, 790), stream=qr_png)
+            if noise_png and index % image_every == 0:
+                page.insert_image(page.rect, stream=noise_png)
+        return doc.tobytes(garbage=3, deflate=True)
+    finally:
+        doc.close()
+
+
+def _qr_png(content):
+    import qrcode
+
+    buffer = io.BytesIO()
+    qrcode.make(content).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def _noise_png(width, height):
+    import cv2
+    import numpy as np
+
+    noise = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    return cv2.imencode('.png', noise)[1].tobytes()
+
+
+def latency_stats(timings_ms):
+    """Percentyle p50/p95/p99 oraz min/średnia/maks (ms)"""
+    if not timings_ms:
+        return {'count': 0}
+    ordered = sorted(timings_ms)
+
+    def percentile(q):
+        position = (len(ordered) - 1) * q
+        lower = int(position)
+        upper = min(lower + 1, len(ordered) - 1)
+        return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+    return {
+        'count': len(ordered),
+        'minMs': round(ordered[0], 3),
+        'meanMs': round(sum(ordered) / len(ordered), 3),
+        'p50Ms': round(percentile(0.50), 3),
+        'p95Ms': round(percentile(0.95), 3),
+        'p99Ms': round(percentile(0.99), 3),
+        'maxMs': round(ordered[-1], 3),
+    }
+
+
+def peak_rss_bytes(pid=None):
+    """Szczytowe RSS procesu: bieżącego (getrusage) lub wskazanego (VmHWM z /proc)"""
+    if pid is None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+def environment():
+    """Opis środowiska i commita - do porównywania wyników między wersjami"""
+    try:
+        commit = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+    }
+
+
+def write_json(path, results):
+    with open(path, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+
+
+def compare(results, baseline_path, key='p50Ms'):
+    """Zmiana (%) względem wyników z pliku bazowego; dodatnia - wolniej"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)['results']
+    changes = {}
+    for name, stats in results.items():
+        previous = baseline.get(name, {}).get(key)
+        if previous and stats.get(key) is not None:
+            changes[name] = round((stats[key] - previous) / previous * 100, 1)
+    return changes
@@ -0,0 +1,211 @@
+"""Generator obciążenia dla endpointów serwisu.
+
+Uruchomienie (z katalogu PythonPdfService):
+    python benchmarks/load_test.py [--endpoints merge-pdfs,extract-text] [--concurrency 8]
+                                   [--requests 100 | --duration 30] [--synthetic-pages 300]
+                                   [--url http://localhost:5032 [--server-pid PID]] [--json wynik.json]
+
+Bez ``--url`` żądania trafiają do aplikacji w tym samym procesie (klient testowy
+Flask), a szczytowe RSS dotyczy tego procesu. Z ``--url`` żądania wysyłane są
+przez HTTP; RSS serwera można odczytać podając ``--server-pid`` (Linux).
+Raport zawiera przepustowość, p50/p95/p99, liczbę błędów i kody odpowiedzi.
+
+Obciążane są synchroniczne endpointy przetwarzające pliki (``ENDPOINTS``, w tym
+strumieniowe - odpowiedź czytana jest do końca). API zadań asynchronicznych
+(``/api/jobs``) i endpointy statystyk nie są objęte generatorem.
+"""
+import argparse
+import io
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from common import (  # ustawia sys.path na katalog serwisu
+    IMAGE_PATTERNS, PDF_PATTERNS, compare, latency_stats, load_samples, peak_rss_bytes, synthetic_pdf, write_json
+)
+
+# nazwa -> (ścieżka, pole formularza, rodzaj plików, wiele plików)
+ENDPOINTS = {
+    'merge-pdfs': ('/api/pdf/merge-pdfs', 'files', 'pdf', True),
+    'images-to-pdf': ('/api/pdf/images-to-pdf', 'files', 'image', True),
+    'merge-all': ('/api/pdf/merge-all', 'files', 'all', True),
+    'extract-text': ('/api/pdf/extract-text', 'file', 'pdf', False),
+    'read-barcodes': ('/api/pdf/read-barcodes', 'file', 'pdf', False),
+    'read-qr-codes': ('/api/pdf/read-qr-codes', 'file', 'pdf', False),
+    'read-all-codes': ('/api/pdf/read-all-codes', 'file', 'pdf', False),
+    'read-codes-batch': ('/api/pdf/read-codes/batch', 'files', 'pdf', True),
+    'extract-text-stream': ('/api/pdf/extract-text/stream?format=ndjson', 'file', 'pdf', False),
+    'render': ('/api/pdf/render', 'file', 'pdf', False),
+    'optimize': ('/api/pdf/optimize', 'file', 'pdf', False),
+}
+
+
+def build_payloads(endpoint, samples):
+    """Zwraca listę zestawów plików (pole, [(nazwa, bajty)]) wysyłanych na zmianę"""
+    _, field, kind, multiple = ENDPOINTS[endpoint]
+    files = samples['pdf'] + samples['image'] if kind == 'all' else samples[kind]
+    if not files:
+        return []
+    if multiple:
+        return [(field, files)]
+    return [(field, [sample]) for sample in files]
+
+
+def encode_multipart(field, files):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, data in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{name}"\r\n'
+            f'Content-Type: application/octet-stream\r\n\r\n'.encode('utf-8')
+        )
+        parts.append(data)
+        parts.append(b'\r\n')
+    parts.append(f'--{boundary}--\r\n'.encode('utf-8'))
+    return b''.join(parts), f'multipart/form-data; boundary={boundary}'
+
+
+class HttpTarget:
+    """Wysyła żądania do działającego serwera"""
+
+    def __init__(self, url, timeout):
+        self.url = url.rstrip('/')
+        self.timeout = timeout
+
+    def post(self, path, field, files):
+        body, content_type = encode_multipart(field, files)
+        request = urllib.request.Request(
+            self.url + path, data=body, method='POST', headers={'Content-Type': content_type}
+        )
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, len(e.read())
+
+
+class InProcessTarget:
+    """Wysyła żądania do aplikacji Flask w tym samym procesie"""
+
+    def __init__(self):
+        from app import create_app
+
+        self.app = create_app({'TESTING': True})
+        self._local = threading.local()
+
+    def post(self, path, field, files):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        data = {field: [(io.BytesIO(content), name) for name, content in files]}
+        response = client.post(path, data=data, content_type='multipart/form-data')
+        return response.status_code, len(response.get_data())
+
+
+def run_endpoint(target, endpoint, payloads, concurrency, requests, duration):
+    """Wysyła żądania z ``concurrency`` wątków; zwraca statystyki"""
+    path = ENDPOINTS[endpoint][0]
+    timings = []
+    statuses = {}
+    bytes_received = [0]
+    lock = threading.Lock()
+    counter = [0]
+    deadline = time.perf_counter() + duration if duration else None
+
+    def next_request():
+        with lock:
+            if deadline is None and counter[0] >= requests:
+                return None
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            counter[0] += 1
+            return payloads[counter[0] % len(payloads)]
+
+    def worker():
+        while True:
+            payload = next_request()
+            if payload is None:
+                return
+            started = time.perf_counter()
+            try:
+                status, size = target.post(path, *payload)
+            except Exception as e:
+                status, size = type(e).__name__, 0
+            elapsed = (time.perf_counter() - started) * 1000
+            with lock:
+                timings.append(elapsed)
+                statuses[str(status)] = statuses.get(str(status), 0) + 1
+                bytes_received[0] += size
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(worker) for _ in range(concurrency)]:
+            future.result()
+    wall = time.perf_counter() - started
+
+    stats = latency_stats(timings)
+    errors = sum(count for status, count in statuses.items() if not status.startswith('2'))
+    stats.update({
+        'throughputRps': round(len(timings) / wall, 2) if wall else 0.0,
+        'wallSeconds': round(wall, 3),
+        'errors': errors,
+        'statuses': statuses,
+        'bytesReceived': bytes_received[0],
+        'concurrency': concurrency,
+    })
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--endpoints', default=','.join(ENDPOINTS), help='nazwy endpointów rozdzielone przecinkami')
+    parser.add_argument('--concurrency', type=int, default=4, help='liczba równoległych klientów')
+    parser.add_argument('--requests', type=int, default=50, help='liczba żądań na endpoint')
+    parser.add_argument('--duration', type=float, help='czas obciążania endpointu (s) zamiast liczby żądań')
+    parser.add_argument('--synthetic-pages', type=int, default=0, help='dołącz syntetyczny PDF o tylu stronach')
+    parser.add_argument('--url', help='adres działającego serwera (domyślnie aplikacja w procesie)')
+    parser.add_argument('--server-pid', type=int, help='PID serwera do odczytu szczytowego RSS')
+    parser.add_argument('--timeout', type=float, default=300, help='limit czasu żądania HTTP (s)')
+    parser.add_argument('--json', dest='json_path', help='zapisz wyniki do pliku JSON')
+    parser.add_argument('--compare', dest='baseline', help='porównaj z wynikami z pliku JSON')
+    args = parser.parse_args()
+
+    endpoints = [name.strip() for name in args.endpoints.split(',') if name.strip()]
+    unknown = [name for name in endpoints if name not in ENDPOINTS]
+    if unknown:
+        print(f'Nieznane endpointy: {", ".join(unknown)}', file=sys.stderr)
+        return 1
+
+    samples = {'pdf': load_samples(PDF_PATTERNS), 'image': load_samples(IMAGE_PATTERNS)}
+    if args.synthetic_pages:
+        samples['pdf'].append((f'synthetic_{args.synthetic_pages}.pdf', synthetic_pdf(args.synthetic_pages)))
+
+    target = HttpTarget(args.url, args.timeout) if args.url else InProcessTarget()
+    results = {}
+    for endpoint in endpoints:
+        payloads = build_payloads(endpoint, samples)
+        if not payloads:
+            print(f'{endpoint:20} pominięty - brak plików wejściowych')
+            continue
+        stats = run_endpoint(target, endpoint, payloads, max(1, args.concurrency), args.requests, args.duration)
+        stats['peakRssBytes'] = peak_rss_bytes(args.server_pid) if args.url else peak_rss_bytes()
+        results[endpoint] = stats
+        rss = f"{stats['peakRssBytes'] / 2 ** 20:8.1f} MiB" if stats['peakRssBytes'] else '      -'
+        print(f"{endpoint:20} {stats['throughputRps']:8.2f} req/s   p50 {stats['p50Ms']:9.2f} ms   "
+              f"p95 {stats['p95Ms']:9.2f} ms   p99 {stats['p99Ms']:9.2f} ms   "
+              f"błędy {stats['errors']:4}   RSS {rss}")
+
+    if args.baseline:
+        for name, change in compare(results, args.baseline).items():
+            print(f'{name:20} {change:+6.1f}% (p50)')
+    if args.json_path:
+        write_json(args.json_path, results)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
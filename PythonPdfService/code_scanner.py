@@ -0,0 +1,543 @@
+"""Silnik odczytu kodów kreskowych i QR z obrazów oraz wielostronicowych PDF.
+
+Strony dokumentu są renderowane i dekodowane równolegle w puli procesów.
+Każdy proces roboczy otwiera dokument samodzielnie ze ścieżki - dokument
+przyjęty w pamięci zapisywany jest raz do pliku tymczasowego, zamiast trafiać
+(serializowany) do każdej porcji stron - i trzyma własną pulę detektorów QR
+(jeden model), ładowaną raz na proces.
+
+Skany z kodami QR trafiają do osobnej, mniejszej puli ``qr_workers`` procesów,
+więc w procesie serwera jest najwyżej ``rozmiar puli detektorów + qr_workers``
+modeli QReader (każdy ładuje torch) - niezależnie od liczby procesów
+skanujących same kody kreskowe. Na hoście ta wartość mnoży się przez liczbę
+workerów gunicorn.
+"""
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+
+from detector_pool import DetectorPool
+from lazy_imports import lazy_import
+from pixmap_cache import get_pixmap_cache, render_page
+
+cv2 = lazy_import('cv2', 'images')
+fitz = lazy_import('fitz', 'pdf')
+np = lazy_import('numpy', 'images')
+pyzbar = lazy_import('pyzbar.pyzbar', 'barcodes')
+qreader = lazy_import('qreader', 'qr')  # Pociąga za sobą torch - ładowany dopiero dla kodów QR
+
+CODE_KINDS = ('barcode', 'qr')
+RENDER_MODES = ('full', 'adaptive')
+DEFAULT_RENDER_OPTIONS = {
+    'mode': 'adaptive',
+    'dpi': 72,            # Rozdzielczość trybu ``full``
+    'coarse_dpi': 50,     # Szybki przebieg wyszukujący obszary z kodami
+    'fine_dpi': 200,      # Rozdzielczość renderowania wyciętych obszarów
+    'max_regions': 8,     # Więcej obszarów - renderowana jest cała strona
+    'max_coverage': 0.5,  # Obszary zajmujące większą część strony - cała strona
+}
+
+_qr_pool = None
+_qr_pool_lock = threading.Lock()
+_decode_threads = None
+_decode_threads_lock = threading.Lock()
+
+
+class ScanOptionsError(ValueError):
+    """Nieprawidłowe parametry skanowania"""
+
+
+class PageSpecError(ScanOptionsError):
+    """Nieprawidłowa specyfikacja stron (parametr ``pages``)"""
+
+
+def configure_qr_pool(pool):
+    """Ustawia pulę detektorów QR używaną w bieżącym procesie"""
+    global _qr_pool
+    _qr_pool = pool
+
+
+def create_qreader():
+    """Tworzy detektor QReader (ładuje model YOLO)"""
+    return qreader.QReader()
+
+
+def get_qr_pool():
+    """Zwraca pulę detektorów QR procesu (w procesach roboczych tworzoną leniwie)"""
+    global _qr_pool
+    if _qr_pool is None:
+        with _qr_pool_lock:
+            if _qr_pool is None:
+                _qr_pool = DetectorPool(create_qreader, size=1)
+    return _qr_pool
+
+
+def parse_pages(spec, page_count):
+    """Zamienia specyfikację stron na listę indeksów (od 0).
+
+    Obsługiwane formy: ``all``, ``3``, ``1-5``, ``10-``, ``-4`` oraz ich listy
+    rozdzielone przecinkami, np. ``1,3,7-9``. Numeracja stron od 1.
+    """
+    spec = (spec or 'all').strip().lower()
+    if spec in ('', 'all', '*'):
+        return list(range(page_count))
+
+    selected = []
+    seen = set()
+    for part in spec.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        try:
+            if '-' in part:
+                start, end = part.split('-', 1)
+                start = int(start) if start.strip() else 1
+                end = int(end) if end.strip() else page_count
+            else:
+                start = end = int(part)
+        except ValueError:
+            raise PageSpecError(f'Nieprawidłowy zakres stron: "{part}"')
+        if start < 1 or end < start:
+            raise PageSpecError(f'Nieprawidłowy zakres stron: "{part}"')
+        for page_num in range(start, min(end, page_count) + 1):
+            if page_num not in seen:
+                seen.add(page_num)
+                selected.append(page_num - 1)
+    return selected
+
+
+def get_decode_threads():
+    """Zwraca pulę wątków dekodujących kody kreskowe równolegle z detektorem QR"""
+    global _decode_threads
+    if _decode_threads is None:
+        with _decode_threads_lock:
+            if _decode_threads is None:
+                _decode_threads = ThreadPoolExecutor(
+                    max_workers=max(2, os.cpu_count() or 1), thread_name_prefix='barcode-decode'
+                )
+    return _decode_threads
+
+
+def pixmap_gray_view(pix):
+    """Widok NumPy (bez kopiowania) na pixmapę w skali szarości.
+
+    Widok jest ważny tylko dopóki istnieje obiekt ``pix``.
+    """
+    return np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+
+
+def gray_to_color(img_array):
+    """Obraz 3-kanałowy dla detektora QR - tworzony tylko gdy jest potrzebny"""
+    if img_array.ndim == 2:
+        return cv2.cvtColor(img_array, cv2.COLOR_GRAY2BGR)
+    return img_array
+
+
+def render_options(**overrides):
+    """Łączy domyślne opcje renderowania z nadpisaniami (wartości ``None`` pomijane)"""
+    options = dict(DEFAULT_RENDER_OPTIONS)
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    if options['mode'] not in RENDER_MODES:
+        raise ScanOptionsError(f'Nieobsługiwany tryb renderowania: "{options["mode"]}"')
+    for key in ('dpi', 'coarse_dpi', 'fine_dpi'):
+        if not 10 <= options[key] <= 600:
+            raise ScanOptionsError(f'Rozdzielczość {key} poza zakresem 10-600 DPI')
+    return options
+
+
+def merge_regions(regions):
+    """Scala nakładające się prostokąty aż do braku przecięć (także łańcuchy A-B-C)"""
+    merged = []
+    for rect in regions:
+        rect = fitz.Rect(rect)
+        # Połączony prostokąt może przeciąć obszary już scalone - powtarzaj, aż nic się nie zmieni
+        while True:
+            overlapping = [existing for existing in merged if existing.intersects(rect)]
+            if not overlapping:
+                break
+            for existing in overlapping:
+                merged.remove(existing)
+                rect |= existing
+        merged.append(rect)
+    return merged
+
+
+def find_code_regions(page, options, doc_hash=None):
+    """Szybki przebieg w niskiej rozdzielczości wyszukujący obszary o dużej gęstości krawędzi.
+
+    Zwraca ``(obszary, piksele)``; obszary w punktach PDF lub ``None``,
+    gdy należy wyrenderować całą stronę.
+    """
+    scale = options['coarse_dpi'] / 72
+    pix = render_page(page, scale, gray=True, doc_hash=doc_hash)
+    gray = pixmap_gray_view(pix)
+
+    # Gęstość gradientu: kody kreskowe i QR to zwarte obszary wielu krawędzi
+    grad_x = cv2.Sobel(gray, cv2.CV_16S, 1, 0, ksize=3)
+    grad_y = cv2.Sobel(gray, cv2.CV_16S, 0, 1, ksize=3)
+    gradient = cv2.addWeighted(cv2.convertScaleAbs(grad_x), 0.5, cv2.convertScaleAbs(grad_y), 0.5, 0)
+    gradient = cv2.blur(gradient, (3, 3))
+    _, mask = cv2.threshold(gradient, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+
+    kernel_size = max(3, int(options['coarse_dpi'] * 0.15))
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (kernel_size, kernel_size))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    mask = cv2.erode(mask, None, iterations=2)
+    mask = cv2.dilate(mask, None, iterations=2)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_side = options['coarse_dpi'] * 0.2  # Kody mniejsze niż ~5 mm są pomijane
+    padding = 6  # Margines wokół obszaru (pkt)
+    regions = []
+    for contour in contours:
+        x, y, w, h = cv2.boundingRect(contour)
+        if w < min_side or h < min_side:
+            continue
+        regions.append(fitz.Rect(x / scale - padding, y / scale - padding,
+                                 (x + w) / scale + padding, (y + h) / scale + padding) & page.rect)
+    # Połącz nakładające się obszary, by nie dekodować kodu dwukrotnie ani nie ciąć go między wycinki
+    regions = merge_regions(regions)
+
+    page_area = abs(page.rect) or 1
+    if len(regions) > options['max_regions'] or \
+            sum(abs(rect) for rect in regions) / page_area > options['max_coverage']:
+        return None, pix.width * pix.height
+    return regions, pix.width * pix.height
+
+
+@contextmanager
+def timed(timings, name):
+    """Dodaje czas bloku (ms) do ``timings[name]``; ``timings=None`` - bez pomiaru"""
+    if timings is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + (time.perf_counter() - started) * 1000
+
+
+def render_gray(page, dpi, clip=None, doc_hash=None):
+    """Renderuje stronę (lub jej wycinek) bezpośrednio w skali szarości, bez kanału alfa.
+
+    Całe strony przechodzą przez cache pixmap procesu (gdy podano ``doc_hash``);
+    wycinki są jednorazowe i renderowane bez niego.
+    Zwraca ``(pixmapa, widok_numpy)`` - pixmapę trzeba trzymać, dopóki używany jest widok.
+    """
+    pix = render_page(page, dpi / 72, clip=clip, gray=True, doc_hash=doc_hash if clip is None else None)
+    return pix, pixmap_gray_view(pix)
+
+
+def _to_page_bounds(codes, origin, zoom):
+    """Przelicza współrzędne kodów z pikseli wycinka na punkty strony (72 DPI)"""
+    for code in codes:
+        bounds = code.get('bounds')
+        if bounds:
+            code['bounds'] = {
+                'x': round(origin.x + bounds['x'] / zoom, 2),
+                'y': round(origin.y + bounds['y'] / zoom, 2),
+                'width': round(bounds['width'] / zoom, 2),
+                'height': round(bounds['height'] / zoom, 2)
+            }
+    return codes
+
+
+def scan_page(page, kinds, options, doc_hash=None):
+    """Dekoduje kody z jednej strony; zwraca ``(kody, statystyki renderowania)``.
+
+    Statystyki zawierają czasy etapów w ms (``timings``: get_pixmap, find_regions,
+    cvtColor, pyzbar, qreader) - pyzbar i qreader mogą działać równolegle.
+    """
+    page_num = page.number + 1
+    timings = {}
+    if options['mode'] == 'full':
+        with timed(timings, 'get_pixmap'):
+            pix, img_array = render_gray(page, options['dpi'], doc_hash=doc_hash)
+        codes = _to_page_bounds(
+            scan_image(img_array, kinds, page=page_num, timings=timings), page.rect.tl, options['dpi'] / 72
+        )
+        return codes, {'page': page_num, 'pixels': pix.width * pix.height, 'regions': 1, 'timings': timings}
+
+    with timed(timings, 'find_regions'):
+        regions, pixels = find_code_regions(page, options, doc_hash)
+    if regions is None:
+        # Zbyt wiele kandydatów - taniej wyrenderować całą stronę
+        regions = [None]
+
+    codes = []
+    seen = set()
+    zoom = options['fine_dpi'] / 72
+    for region in regions:
+        with timed(timings, 'get_pixmap'):
+            pix, img_array = render_gray(page, options['fine_dpi'], clip=region, doc_hash=doc_hash)
+        pixels += pix.width * pix.height
+        region_codes = scan_image(img_array, kinds, page=page_num, timings=timings)
+        for code in _to_page_bounds(region_codes, (region or page.rect).tl, zoom):
+            key = (code['type'], str(code['data']))
+            if key not in seen:
+                seen.add(key)
+                codes.append(code)
+    return codes, {'page': page_num, 'pixels': pixels, 'regions': len(regions), 'timings': timings}
+
+
+def decode_barcodes(img_array, page=None, timings=None):
+    """Odczytuje kody kreskowe z obrazu (pyzbar)"""
+    codes = []
+    with timed(timings, 'pyzbar'):
+        barcodes = pyzbar.decode(img_array)
+    for barcode in barcodes:
+        code = {
+            'type': 'barcode',
+            'data': barcode.data.decode('utf-8'),
+            'format': barcode.type,
+            'confidence': 1.0
+        }
+        if page is not None:
+            code['page'] = page
+        code['bounds'] = {
+            'x': barcode.rect.left,
+            'y': barcode.rect.top,
+            'width': barcode.rect.width,
+            'height': barcode.rect.height
+        }
+        codes.append(code)
+    return codes
+
+
+def decode_qr_codes(img_array, page=None, timings=None):
+    """Odczytuje kody QR z obrazu (QReader z puli procesu)"""
+    with timed(timings, 'cvtColor'):
+        color = gray_to_color(img_array)
+    with timed(timings, 'qreader'):
+        decoded_text = get_qr_pool().detect_and_decode(color)
+    if not decoded_text:
+        return []
+    code = {
+        'type': 'qr',
+        'data': decoded_text,
+        'format': 'QR_CODE',
+        'confidence': 1.0
+    }
+    if page is not None:
+        code['page'] = page
+    return [code]
+
+
+def scan_image(img_array, kinds, page=None, timings=None):
+    """Odczytuje wskazane rodzaje kodów z pojedynczego obrazu (najlepiej w skali szarości).
+
+    Gdy potrzebne są oba dekodery, pyzbar działa w osobnym wątku na tym samym
+    buforze, równolegle z detektorem QR.
+    """
+    if 'barcode' in kinds and 'qr' in kinds:
+        barcodes = get_decode_threads().submit(decode_barcodes, img_array, page, timings)
+        qr_codes = decode_qr_codes(img_array, page, timings)
+        return barcodes.result() + qr_codes
+    if 'barcode' in kinds:
+        return decode_barcodes(img_array, page, timings)
+    if 'qr' in kinds:
+        return decode_qr_codes(img_array, page, timings)
+    return []
+
+
+def _open_source(source):
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype='pdf')
+    return fitz.open(source)
+
+
+def scan_pages(source, page_indices, kinds, deadline=None, stop_at_first=False, options=None, progress=None,
+               doc_hash=None):
+    """Renderuje i dekoduje wskazane strony dokumentu.
+
+    Funkcja wykonywana w procesie roboczym (lub lokalnie dla małych dokumentów).
+    ``deadline`` to czas bezwzględny (``time.time()``), po którym skanowanie jest przerywane.
+    ``progress`` (tylko lokalnie) otrzymuje liczbę zeskanowanych stron.
+    ``doc_hash`` (tylko lokalnie) włącza cache pixmap procesu dla całych stron.
+    Zwraca ``(kody, zeskanowane_strony, przekroczono_czas, statystyki_renderowania)``.
+    """
+    options = options or DEFAULT_RENDER_OPTIONS
+    codes = []
+    scanned = []
+    render_stats = []
+    timed_out = False
+    doc = _open_source(source)
+    try:
+        for page_index in page_indices:
+            if deadline is not None and time.time() >= deadline:
+                timed_out = True
+                break
+            page_codes, page_stats = scan_page(doc.load_page(page_index), kinds, options, doc_hash)
+            codes.extend(page_codes)
+            render_stats.append(page_stats)
+            scanned.append(page_index + 1)
+            if progress:
+                progress(pagesDone=len(scanned))
+            if stop_at_first and codes:
+                break
+    finally:
+        doc.close()
+    return codes, scanned, timed_out, render_stats
+
+
+class CodeScanner:
+    """Rozdziela strony dokumentu na procesy robocze i zbiera wyniki"""
+
+    def __init__(self, workers=None, chunk_pages=4, parallel_min_pages=4, qr_workers=None, spill_dir=None):
+        self.workers = workers or os.cpu_count() or 1
+        # Procesy ładujące QReader - ograniczają liczbę modeli poza pulą detektorów serwera
+        self.qr_workers = max(1, min(self.workers, qr_workers or self.workers))
+        self.chunk_pages = max(1, int(chunk_pages))
+        self.parallel_min_pages = max(1, int(parallel_min_pages))
+        self.spill_dir = spill_dir  # Katalog plików tymczasowych dokumentów przyjętych w pamięci
+        self._executors = {}
+        self._lock = threading.Lock()
+
+    def _pool_workers(self, kinds):
+        """Liczba procesów puli obsługującej skan ``kinds``"""
+        return self.qr_workers if 'qr' in kinds else self.workers
+
+    def _get_executor(self, workers):
+        with self._lock:
+            executor = self._executors.get(workers)
+            if executor is None:
+                # spawn - bezpieczne przy wątkach serwera i bibliotekach natywnych
+                executor = self._executors[workers] = ProcessPoolExecutor(
+                    max_workers=workers,
+                    mp_context=multiprocessing.get_context('spawn')
+                )
+            return executor
+
+    def _reset_executor(self, workers=None):
+        with self._lock:
+            for key in [workers] if workers is not None else list(self._executors):
+                executor = self._executors.pop(key, None)
+                if executor is not None:
+                    executor.shutdown(wait=False, cancel_futures=True)
+
+    def shutdown(self):
+        self._reset_executor()
+
+    def stats(self):
+        """Liczba procesów skanujących (wszystkie rodzaje kodów i skany QR)"""
+        with self._lock:
+            started = sorted(self._executors)
+        return {'workers': self.workers, 'qrWorkers': self.qr_workers, 'startedPools': started}
+
+    def scan_document(self, uploaded, kinds, pages=None, timeout=None, stop_at_first=False, render=None,
+                      progress=None):
+        """Skanuje dokument PDF i zwraca słownik z kodami oraz statystykami stron"""
+        options = render or DEFAULT_RENDER_OPTIONS
+        started = time.time()
+        deadline = started + timeout if timeout else None
+
+        doc = uploaded.open_pdf()
+        page_count = len(doc)
+        doc.close()
+        page_indices = parse_pages(pages, page_count)
+        if progress:
+            progress(pagesTotal=len(page_indices), pagesDone=0)
+
+        if self.workers <= 1 or len(page_indices) < self.parallel_min_pages:
+            doc_hash = uploaded.sha256() if get_pixmap_cache() is not None else None
+            codes, scanned, timed_out, render_stats = scan_pages(
+                uploaded.source, page_indices, kinds, deadline, stop_at_first, options, progress, doc_hash
+            )
+        else:
+            codes, scanned, timed_out, render_stats = self._scan_parallel(
+                uploaded, page_indices, kinds, deadline, stop_at_first, options, progress
+            )
+
+        render_stats.sort(key=lambda stats: stats['page'])
+        pixels_rendered = sum(stats['pixels'] for stats in render_stats)
+        stage_ms = {}
+        for stats in render_stats:
+            for name, elapsed in stats.get('timings', {}).items():
+                stage_ms[name] = round(stage_ms.get(name, 0.0) + elapsed, 3)
+
+        codes.sort(key=lambda code: code.get('page', 0))
+        return {
+            'codes': codes,
+            'pageCount': page_count,
+            'requestedPages': len(page_indices),
+            'scannedPages': sorted(scanned),
+            'timedOut': timed_out,
+            'stoppedEarly': bool(stop_at_first and codes and len(scanned) < len(page_indices)),
+            'elapsedMs': round((time.time() - started) * 1000, 3),
+            'render': {
+                'mode': options['mode'],
+                'pixelsRendered': pixels_rendered,
+                'avgPixelsPerPage': round(pixels_rendered / len(render_stats)) if render_stats else 0,
+                'stageMs': stage_ms,
+                'pages': render_stats
+            }
+        }
+
+    @contextmanager
+    def _document_path(self, uploaded):
+        """Ścieżka dokumentu dla procesów roboczych - dokument w pamięci zapisywany raz do pliku tymczasowego"""
+        if not uploaded.in_memory:
+            yield uploaded.path
+            return
+        fd, path = tempfile.mkstemp(suffix='.pdf', dir=self.spill_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(uploaded.data)
+            yield path
+        finally:
+            os.remove(path)
+
+    def _scan_parallel(self, uploaded, page_indices, kinds, deadline, stop_at_first, options, progress):
+        # Ścieżka jest tańsza w przekazaniu niż bajty dokumentu serializowane do każdej porcji stron
+        with self._document_path(uploaded) as path:
+            return self._scan_chunks(path, page_indices, kinds, deadline, stop_at_first, options, progress)
+
+    def _scan_chunks(self, source, page_indices, kinds, deadline, stop_at_first, options, progress):
+        workers = self._pool_workers(kinds)
+        chunk_size = max(1, min(self.chunk_pages, -(-len(page_indices) // workers)))
+        chunks = [page_indices[i:i + chunk_size] for i in range(0, len(page_indices), chunk_size)]
+
+        executor = self._get_executor(workers)
+        try:
+            pending = {
+                executor.submit(scan_pages, source, chunk, kinds, deadline, stop_at_first, options)
+                for chunk in chunks
+            }
+        except BrokenProcessPool:
+            self._reset_executor(workers)
+            raise
+
+        codes = []
+        scanned = []
+        render_stats = []
+        timed_out = False
+        try:
+            while pending:
+                remaining = None if deadline is None else max(0.0, deadline - time.time())
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                if not done:
+                    timed_out = True
+                    break
+                for future in done:
+                    chunk_codes, chunk_scanned, chunk_timed_out, chunk_stats = future.result()
+                    codes.extend(chunk_codes)
+                    scanned.extend(chunk_scanned)
+                    render_stats.extend(chunk_stats)
+                    timed_out = timed_out or chunk_timed_out
+                if progress:
+                    progress(pagesDone=len(scanned))
+                if stop_at_first and codes:
+                    break
+        except BrokenProcessPool:
+            self._reset_executor(workers)
+            raise
+        finally:
+            for future in pending:
+                future.cancel()
+        return codes, scanned, timed_out, render_stats
@@ -0,0 +1,79 @@
+"""Wspólne fixtury testów: aplikacja, klient testowy i generatory syntetycznych plików.
+
+Testy uruchamiane z katalogu PythonPdfService: ``python -m pytest -q``.
+"""
+import io
+import os
+
+import pytest
+
+# Konfiguracja czytana przy imporcie app - testy nie korzystają z cache wyników, by były od siebie niezależne
+os.environ.setdefault('RESULT_CACHE_ENABLED', 'false')
+os.environ.setdefault('STARTUP_MODE', 'lazy')
+os.environ.setdefault('CODE_SCAN_WORKERS', '1')
+
+fitz = pytest.importorskip('fitz')
+
+
+@pytest.fixture(scope='session')
+def app():
+    from app import create_app, shutdown_workers
+
+    flask_app = create_app({'TESTING': True})
+    yield flask_app
+    shutdown_workers()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+def build_pdf(pages=1, label='Strona', rotation=0, size=(595, 842)):
+    """PDF z tekstem ``<label> <n>`` na każdej stronie (opcjonalnie obróconej)"""
+    doc = fitz.open()
+    try:
+        for index in range(pages):
+            page = doc.new_page(width=size[0], height=size[1])
+            page.insert_text((72, 72), f'{label} {index + 1}', fontsize=12)
+            if rotation:
+                page.set_rotation(rotation)
+        return doc.tobytes()
+    finally:
+        doc.close()
+
+
+def build_image(width=320, height=240, fmt='png', alpha=False, noise=False):
+    """Obraz testowy (gradient lub szum) zakodowany przez OpenCV"""
+    cv2 = pytest.importorskip('cv2')
+    np = pytest.importorskip('numpy')
+    if noise:
+        pixels = np.random.default_rng(0).integers(0, 256, (height, width, 3), dtype=np.uint8)
+    else:
+        row = np.linspace(0, 255, width, dtype=np.uint8)
+        pixels = np.dstack([np.tile(row, (height, 1))] * 3)
+    if alpha:
+        pixels = np.dstack([pixels, np.full((height, width), 128, dtype=np.uint8)])
+    return cv2.imencode(f'.{fmt}', pixels)[1].tobytes()
+
+
+def page_texts(data):
+    """Tekst kolejnych stron PDF (bez białych znaków na końcach)"""
+    with fitz.open(stream=data, filetype='pdf') as doc:
+        return [page.get_text().strip() for page in doc]
+
+
+def upload(*files):
+    """Pliki formularza: pary (bajty, nazwa) -> krotki akceptowane przez klienta testowego"""
+    return [(io.BytesIO(data), name) for data, name in files]
+
+
+def build_image_pdf(image, rect=(72, 72, 272, 272), pages=1):
+    """PDF z obrazem ``image`` wyświetlanym w prostokącie ``rect`` (pt) na każdej stronie"""
+    doc = fitz.open()
+    try:
+        for _ in range(pages):
+            doc.new_page(width=595, height=842).insert_image(fitz.Rect(rect), stream=image)
+        return doc.tobytes(garbage=3, deflate=True)
+    finally:
+        doc.close()
@@ -0,0 +1,137 @@
+"""Pula modeli (detektory QR, czytniki OCR) współdzielona w obrębie procesu roboczego"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+
+class DetectorPoolTimeout(Exception):
+    """Nie udało się uzyskać wolnego detektora w zadanym czasie"""
+
+
+class DetectorPool:
+    """Ograniczona pula instancji detektora.
+
+    Modele są ładowane leniwie (lub przy rozgrzewce) najwyżej ``size`` razy
+    na proces, a liczba równoległych inferencji jest ograniczona do ``size``.
+    Pozostałe żądania czekają w kolejce maksymalnie ``acquire_timeout`` sekund.
+    """
+
+    def __init__(self, factory, size=1, acquire_timeout=30.0, name='QR'):
+        self._factory = factory
+        self.name = name
+        self.size = max(1, int(size))
+        self.acquire_timeout = acquire_timeout
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'loads': 0,
+            'loadTimeMs': 0.0,
+            'acquired': 0,
+            'timeouts': 0,
+            'waiting': 0,
+            'inUse': 0,
+            'waitTimeMs': 0.0,
+            'maxWaitTimeMs': 0.0,
+            'inferences': 0,
+            'inferenceTimeMs': 0.0,
+            'maxInferenceTimeMs': 0.0,
+        }
+
+    def _create(self):
+        start = time.perf_counter()
+        try:
+            detector = self._factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['loads'] += 1
+            self._stats['loadTimeMs'] += elapsed_ms
+        return detector
+
+    def _reserve_slot(self):
+        """Rezerwuje miejsce na nową instancję, jeśli pula nie jest pełna"""
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return True
+            return False
+
+    def warmup(self, count=None):
+        """Ładuje modele z wyprzedzeniem (domyślnie całą pulę)"""
+        count = self.size if count is None else min(int(count), self.size)
+        while self._created < count and self._reserve_slot():
+            self._idle.put(self._create())
+
+    @contextmanager
+    def acquire(self, timeout=None):
+        """Pobiera detektor z puli i zwraca go po zakończeniu bloku"""
+        timeout = self.acquire_timeout if timeout is None else timeout
+        start = time.perf_counter()
+        with self._lock:
+            self._stats['waiting'] += 1
+        try:
+            try:
+                detector = self._idle.get_nowait()
+            except queue.Empty:
+                if self._reserve_slot():
+                    detector = self._create()
+                else:
+                    detector = self._idle.get(timeout=timeout)
+        except queue.Empty:
+            with self._lock:
+                self._stats['waiting'] -= 1
+                self._stats['timeouts'] += 1
+            raise DetectorPoolTimeout(
+                f'Brak wolnego detektora {self.name} po {timeout:.1f}s oczekiwania'
+            )
+        except Exception:
+            with self._lock:
+                self._stats['waiting'] -= 1
+            raise
+
+        wait_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['waiting'] -= 1
+            self._stats['inUse'] += 1
+            self._stats['acquired'] += 1
+            self._stats['waitTimeMs'] += wait_ms
+            self._stats['maxWaitTimeMs'] = max(self._stats['maxWaitTimeMs'], wait_ms)
+        try:
+            yield detector
+        finally:
+            with self._lock:
+                self._stats['inUse'] -= 1
+            self._idle.put(detector)
+
+    def detect_and_decode(self, image, timeout=None):
+        """Uruchamia ``detect_and_decode`` na detektorze z puli"""
+        return self.infer(lambda detector: detector.detect_and_decode(image=image), timeout)
+
+    def infer(self, func, timeout=None):
+        """Wywołuje ``func(detektor)`` na instancji z puli, mierząc czas inferencji"""
+        with self.acquire(timeout=timeout) as detector:
+            start = time.perf_counter()
+            result = func(detector)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+        with self._lock:
+            self._stats['inferences'] += 1
+            self._stats['inferenceTimeMs'] += elapsed_ms
+            self._stats['maxInferenceTimeMs'] = max(self._stats['maxInferenceTimeMs'], elapsed_ms)
+        return result
+
+    def stats(self):
+        """Zwraca migawkę metryk puli"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['size'] = self.size
+            snapshot['loaded'] = self._created
+        acquired = snapshot['acquired'] or 1
+        inferences = snapshot['inferences'] or 1
+        snapshot['avgWaitTimeMs'] = snapshot['waitTimeMs'] / acquired
+        snapshot['avgInferenceTimeMs'] = snapshot['inferenceTimeMs'] / inferences
+        return snapshot
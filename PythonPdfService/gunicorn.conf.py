@@ -0,0 +1,45 @@
+"""Konfiguracja produkcyjna gunicorn.
+
+Uruchomienie: gunicorn -c gunicorn.conf.py
+Wszystkie wartości można nadpisać zmiennymi środowiskowymi GUNICORN_*.
+"""
+import multiprocessing
+import os
+import sys
+
+wsgi_app = 'app:create_app()'
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5032')
+
+# Praca CPU (PDF/OpenCV) - jeden proces na rdzeń, wątki dla operacji I/O
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count()))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Recykling workerów ogranicza narastanie pamięci (fragmentacja, modele, cache)
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+
+# preload - modele i biblioteki ładowane raz w procesie głównym i współdzielone (copy-on-write)
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'false').lower() in ('1', 'true', 'yes')
+if preload_app:
+    # Wątek rozgrzewki nie przetrwałby fork() - ładowanie musi zakończyć się przed startem workerów
+    os.environ.setdefault('STARTUP_MODE', 'eager')
+
+# Skanowanie kodów ma własną pulę procesów - dzielimy rdzenie między workery
+os.environ.setdefault('CODE_SCAN_WORKERS', str(max(1, multiprocessing.cpu_count() // max(1, workers))))
+
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG', '-')
+errorlog = os.environ.get('GUNICORN_ERROR_LOG', '-')
+loglevel = os.environ.get('GUNICORN_LOG_LEVEL', 'info')
+
+
+def worker_exit(server, worker):
+    """Łagodne zamknięcie puli procesów skanujących przy wyłączaniu workera"""
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.shutdown_workers()
@@ -0,0 +1,331 @@
+"""Normalizacja obrazów przed konwersją do PDF.
+
+Strony mają rozmiar wybranego formatu (``outputFormat``), a obraz jest
+wpasowywany w stronę przez ``img2pdf.get_layout_fun``. Domyślnie obrazy są
+osadzane bez zmian; zmniejszanie obrazów o rozdzielczości wyższej niż docelowe
+DPI na stronie (OpenCV, ``INTER_AREA``) jest opcjonalne (``dpi``). Ponownie
+kodowane obrazy zachowują rodzaj kompresji źródła - JPEG pozostaje JPEG-iem,
+a obrazy bezstratne (PNG, BMP, TIFF...) trafiają do PNG razem z kanałem alfa,
+chyba że wywołujący wybierze ``encoding`` (``jpeg`` nakłada przezroczystość na
+białe tło). Formaty, których img2pdf nie osadza bezpośrednio (BMP, GIF, TIFF,
+PNG z przeplotem lub 16-bitowy z alfą), są konwertowane do PNG.
+
+Przygotowanie obrazów (walidacja, dekodowanie, zmniejszanie, kodowanie)
+odbywa się równolegle we współdzielonej puli wątków - OpenCV zwalnia GIL.
+Kolejność obrazów jest zachowana, a łączny rozmiar jednocześnie zdekodowanych
+bitmap ograniczony budżetem pamięci wspólnym dla wszystkich żądań.
+"""
+import io
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_imports import lazy_import
+from metrics import observe_stage, stage
+
+cv2 = lazy_import('cv2', 'images')
+img2pdf = lazy_import('img2pdf', 'images')
+np = lazy_import('numpy', 'images')
+PILImage = lazy_import('PIL.Image', 'images')
+
+DEFAULT_IMAGE_OPTIONS = {
+    'page_size': None,      # (szerokość, wysokość) w punktach; None - strona o rozmiarze obrazu
+    'dpi': 0,               # Docelowa rozdzielczość na stronie; 0 - bez zmniejszania
+    'jpeg_quality': 85,     # Jakość ponownie kodowanych obrazów JPEG
+    'recompress': False,    # Koduj ponownie także obrazy, których nie trzeba zmniejszać
+    'encoding': 'auto',     # auto - JPEG dla źródeł JPEG, PNG (bezstratnie) dla pozostałych; jpeg; png
+}
+IMAGE_ENCODINGS = ('auto', 'jpeg', 'png')
+JPEG_FORMATS = ('JPEG', 'MPO')
+PASSTHROUGH_FORMATS = ('JPEG', 'MPO', 'JPEG2000', 'PNG')  # Osadzane przez img2pdf bez dekodowania
+EXIF_ORIENTATION = 0x0112
+ROTATED_ORIENTATIONS = (5, 6, 7, 8)  # Orientacje EXIF zamieniające szerokość z wysokością
+
+_image_threads = None
+_image_threads_lock = threading.Lock()
+_image_workers = max(2, os.cpu_count() or 1)
+
+
+class ImageOptionsError(ValueError):
+    """Nieprawidłowe parametry konwersji obrazów"""
+
+
+class InvalidImageError(ImageOptionsError):
+    """Przesłany plik nie jest poprawnym obrazem"""
+
+
+class MemoryBudget:
+    """Semafor bajtowy ograniczający łączny rozmiar zdekodowanych bitmap"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max(1, int(max_bytes))
+        self._in_use = 0
+        self._peak = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size):
+        """Rezerwuje ``size`` bajtów (większe obrazy - gdy nic innego nie jest w toku)"""
+        size = min(size, self.max_bytes)
+        with self._condition:
+            while self._in_use and self._in_use + size > self.max_bytes:
+                self._condition.wait()
+            self._in_use += size
+            self._peak = max(self._peak, self._in_use)
+        return size
+
+    def release(self, size):
+        with self._condition:
+            self._in_use -= size
+            self._condition.notify_all()
+
+    def stats(self):
+        with self._condition:
+            return {'inFlightBytes': self._in_use, 'peakBytes': self._peak, 'maxBytes': self.max_bytes}
+
+
+_memory_budget = MemoryBudget(256 * 1024 * 1024)
+
+
+def configure_image_pool(workers=None, max_inflight_bytes=None):
+    """Ustawia liczbę wątków i budżet pamięci (przed pierwszym użyciem puli)"""
+    global _image_workers, _memory_budget
+    if workers:
+        _image_workers = max(1, int(workers))
+    if max_inflight_bytes:
+        _memory_budget = MemoryBudget(max_inflight_bytes)
+
+
+def image_pool_stats():
+    stats = _memory_budget.stats()
+    stats['workers'] = _image_workers
+    return stats
+
+
+def get_memory_budget():
+    """Budżet pamięci zdekodowanych bitmap (współdzielony także przez optymalizację PDF)"""
+    return _memory_budget
+
+
+def image_options(**overrides):
+    """Łączy domyślne opcje z nadpisaniami (wartości ``None`` pomijane) i je waliduje"""
+    options = dict(DEFAULT_IMAGE_OPTIONS)
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    if options['dpi'] and not 36 <= options['dpi'] <= 1200:
+        raise ImageOptionsError('Parametr dpi musi mieścić się w zakresie 36-1200 (0 - bez zmniejszania)')
+    if not 1 <= options['jpeg_quality'] <= 100:
+        raise ImageOptionsError('Parametr jpegQuality musi mieścić się w zakresie 1-100')
+    if options['encoding'] not in IMAGE_ENCODINGS:
+        raise ImageOptionsError(f'Nieobsługiwane kodowanie obrazów: "{options["encoding"]}" (dozwolone: auto, jpeg, png)')
+    return options
+
+
+def get_image_threads():
+    """Zwraca pulę wątków przygotowujących obrazy"""
+    global _image_threads
+    if _image_threads is None:
+        with _image_threads_lock:
+            if _image_threads is None:
+                _image_threads = ThreadPoolExecutor(max_workers=_image_workers, thread_name_prefix='image-prepare')
+    return _image_threads
+
+
+def page_layout(page_size):
+    """Funkcja układu img2pdf wpasowująca obraz w stronę (orientacja strony wg obrazu)"""
+    return img2pdf.get_layout_fun(pagesize=page_size, fit=img2pdf.FitMode.into, auto_orient=True)
+
+
+def target_scale(width, height, page_size, dpi):
+    """Skala (<= 1), przy której obraz wpasowany w stronę ma co najwyżej ``dpi``"""
+    if page_size is None or not dpi:
+        return 1.0
+    page_width, page_height = page_size
+    if (width > height) != (page_width > page_height):
+        page_width, page_height = page_height, page_width  # auto_orient
+    points_per_pixel = min(page_width / width, page_height / height)
+    return min(1.0, points_per_pixel * dpi / 72)
+
+
+def probe_image(uploaded):
+    """Waliduje obraz i odczytuje z nagłówka wymiary (po obrocie EXIF), format, alfę i liczbę klatek"""
+    source = io.BytesIO(uploaded.data) if uploaded.in_memory else uploaded.path
+    try:
+        with PILImage.open(source) as image:
+            width, height = image.size
+            if image.getexif().get(EXIF_ORIENTATION, 1) in ROTATED_ORIENTATIONS:
+                width, height = height, width
+            alpha = image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info
+            return {
+                'width': width,
+                'height': height,
+                'format': image.format,
+                'alpha': alpha,
+                'frames': getattr(image, 'n_frames', 1),
+                # img2pdf osadza PNG bez dekodowania tylko bez przeplotu i do 8 bitów na kanał;
+                # przezroczystość zapisuje jako /SMask, ale nie dla obrazów 16-bitowych
+                'passthrough': image.format in PASSTHROUGH_FORMATS and not image.info.get('interlace')
+                and image.mode in ('1', 'L', 'P', 'RGB', 'CMYK', 'RGBA', 'LA')
+                and not (alpha and _is_16_bit(image)),
+            }
+    except Exception as e:
+        raise InvalidImageError(f'Nieprawidłowy plik obrazu "{uploaded.filename}": {e}')
+
+
+def _is_16_bit(image):
+    """Czy PNG ma 16 bitów na kanał (PIL zgłasza tryb 8-bitowy, głębię zdradza tryb surowy)"""
+    rawmode = image.tile[0][3] if image.tile else None
+    return isinstance(rawmode, str) and ';16' in rawmode
+
+
+def source_encoding(probe):
+    """Rodzaj kompresji źródła: ``jpeg`` (stratna) lub ``png`` (pozostałe formaty - bezstratne)"""
+    return 'jpeg' if probe['format'] in JPEG_FORMATS else 'png'
+
+
+def output_encoding(probe, options):
+    """Format ponownie kodowanego obrazu: ``jpeg`` lub ``png`` (bezstratnie, z alfą)"""
+    return source_encoding(probe) if options['encoding'] == 'auto' else options['encoding']
+
+
+def decoded_size(probe):
+    """Szacowany rozmiar zdekodowanej bitmapy (4 bajty na piksel - z zapasem na alfę)"""
+    return probe['width'] * probe['height'] * 4
+
+
+def needs_decoding(probe, options):
+    """Czy obraz trzeba zdekodować (zmniejszenie, konwersja formatu lub rekompresja na życzenie)"""
+    if probe['frames'] > 1:
+        return False  # Wielostronicowe TIFF/GIF obsługuje img2pdf
+    scale = target_scale(probe['width'], probe['height'], options['page_size'], options['dpi'])
+    converted = output_encoding(probe, options) != source_encoding(probe)  # Kodowanie wybrane przez wywołującego
+    return scale < 1.0 or not probe['passthrough'] or options['recompress'] or converted
+
+
+def flatten_alpha(img_array):
+    """Nakłada obraz z kanałem alfa na białe tło"""
+    alpha = img_array[:, :, 3:4].astype(np.float32) / 255.0
+    color = img_array[:, :, :3].astype(np.float32)
+    return (color * alpha + 255.0 * (1.0 - alpha)).astype(np.uint8)
+
+
+def _elapsed_ms(start):
+    return round((time.perf_counter() - start) * 1000, 1)
+
+
+def prepare_image(uploaded, options, probe=None):
+    """Zwraca źródło dla img2pdf (oryginał, JPEG lub PNG) i opis zmian z czasami etapów"""
+    start = time.perf_counter()
+    probe = probe or probe_image(uploaded)
+    scale = target_scale(probe['width'], probe['height'], options['page_size'], options['dpi'])
+    info = {
+        'filename': uploaded.filename,
+        'width': probe['width'],
+        'height': probe['height'],
+        'resized': False,
+        'reencoded': False,
+        'timings': {},
+    }
+    if not needs_decoding(probe, options):
+        info['timings']['total'] = _elapsed_ms(start)
+        return uploaded.source, info
+
+    # IMREAD_ANYCOLOR stosuje orientację EXIF; IMREAD_UNCHANGED zachowuje kanał alfa
+    stage = time.perf_counter()
+    img_array = uploaded.decode_image(cv2.IMREAD_UNCHANGED if probe['alpha'] else cv2.IMREAD_ANYCOLOR)
+    info['timings']['decode'] = _elapsed_ms(stage)
+    if img_array is None:
+        raise InvalidImageError(f'Nie udało się zdekodować obrazu "{uploaded.filename}"')
+    encoding = output_encoding(probe, options)
+    if img_array.dtype != np.uint8:
+        img_array = (img_array >> 8).astype(np.uint8)
+    if img_array.ndim == 3 and img_array.shape[2] == 4 and encoding == 'jpeg':
+        img_array = flatten_alpha(img_array)  # JPEG bez przezroczystości - białe tło
+    elif img_array.ndim == 3 and img_array.shape[2] == 2:
+        img_array = img_array[:, :, 0]
+
+    if scale < 1.0:
+        stage = time.perf_counter()
+        size = (max(1, round(img_array.shape[1] * scale)), max(1, round(img_array.shape[0] * scale)))
+        img_array = cv2.resize(img_array, size, interpolation=cv2.INTER_AREA)
+        info.update(resized=True, width=size[0], height=size[1])
+        info['timings']['resize'] = _elapsed_ms(stage)
+
+    # Źródła stratne trafiają do JPEG, bezstratne (także z kanałem alfa) do PNG - o ile nie wybrano inaczej
+    stage = time.perf_counter()
+    if encoding == 'jpeg':
+        ok, encoded = cv2.imencode('.jpg', img_array, [cv2.IMWRITE_JPEG_QUALITY, options['jpeg_quality']])
+    else:
+        ok, encoded = cv2.imencode('.png', img_array, [cv2.IMWRITE_PNG_COMPRESSION, 3])
+    info['timings']['encode'] = _elapsed_ms(stage)
+    if not ok:
+        raise InvalidImageError(f'Nie udało się zakodować obrazu "{uploaded.filename}"')
+    info['reencoded'] = True
+    info['timings']['total'] = _elapsed_ms(start)
+    return encoded.tobytes(), info
+
+
+def prepare_images(image_files, options):
+    """Przygotowuje obrazy w puli wątków z zachowaniem kolejności i limitem pamięci w toku"""
+    pool = get_image_threads()
+    budget = _memory_budget
+    futures = []
+
+    def run(uploaded, probe, reserved, submitted):
+        try:
+            started = time.perf_counter()
+            source, info = prepare_image(uploaded, options, probe)
+            info['timings']['wait'] = round((started - submitted) * 1000, 1)
+            return source, info
+        finally:
+            budget.release(reserved)
+
+    try:
+        for uploaded in image_files:
+            stage = time.perf_counter()
+            probe = probe_image(uploaded)
+            probe_ms = _elapsed_ms(stage)
+            reserved = budget.acquire(decoded_size(probe)) if needs_decoding(probe, options) else 0
+            try:
+                future = pool.submit(run, uploaded, probe, reserved, time.perf_counter())
+            except Exception:
+                budget.release(reserved)
+                raise
+            futures.append((future, probe_ms, reserved))
+        prepared = []
+        for future, probe_ms, _ in futures:
+            source, info = future.result()
+            info['timings']['probe'] = probe_ms
+            prepared.append((source, info))
+        return prepared
+    finally:
+        for future, _, reserved in futures:
+            if future.cancel():
+                budget.release(reserved)  # Zadanie nie wystartowało - rezerwację zwalniamy tutaj
+
+
+def timing_header(images):
+    """Czasy etapów (ms) dla każdego obrazu: ``0:probe=0.4;decode=31.2;...;total=45.0, 1:...``"""
+    entries = []
+    for index, info in enumerate(images):
+        timings = ';'.join(f'{name}={value}' for name, value in info['timings'].items())
+        entries.append(f'{index}:{timings}')
+    return ', '.join(entries)
+
+
+def images_to_pdf(image_files, options=None, output=None):
+    """Konwertuje obrazy do PDF; zwraca (``output`` lub bajty PDF, opisy obrazów)"""
+    options = options or DEFAULT_IMAGE_OPTIONS
+    prepared = prepare_images(image_files, options)
+    for _, info in prepared:
+        for name, elapsed_ms in info['timings'].items():
+            if name != 'total':
+                observe_stage(f'image_{name}', elapsed_ms / 1000)
+    sources = [source for source, _ in prepared]
+    kwargs = {}
+    if options['page_size'] is not None:
+        kwargs['layout_fun'] = page_layout(options['page_size'])
+    with stage('img2pdf'):
+        if output is None:
+            return img2pdf.convert(sources, **kwargs), [info for _, info in prepared]
+        img2pdf.convert(sources, outputstream=output, **kwargs)
+    return output, [info for _, info in prepared]
@@ -0,0 +1,264 @@
+"""Wspólna warstwa przyjmowania plików przesłanych w żądaniu.
+
+Małe pliki trzymane są w pamięci i przekazywane bibliotekom (PyMuPDF, PyPDF2,
+img2pdf, OpenCV) bezpośrednio jako bajty. Dopiero pliki większe od progu
+trafiają na dysk - do unikalnego pliku tworzonego atomowo (bez wyścigu mktemp).
+
+Części multipart mogą być zapisywane przez parser od razu do ``SpooledUpload``
+(fabryka strumieni żądania) - wtedy plik przyjmowany jest bez kolejnej kopii:
+bufor w pamięci staje się bajtami, a plik na dysku otwierany jest przez PyMuPDF
+ze ścieżki i czytany przez ``mmap`` (hash, dekodowanie obrazów).
+"""
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from lazy_imports import lazy_import
+from metrics import stage
+
+cv2 = lazy_import('cv2', 'images')
+fitz = lazy_import('fitz', 'pdf')
+np = lazy_import('numpy', 'images')
+
+
+class UploadedFile:
+    """Plik z żądania: bajty w pamięci albo ścieżka do pliku na dysku"""
+
+    def __init__(self, filename, data=None, path=None, size=0):
+        self.filename = filename
+        self.extension = os.path.splitext(filename)[1].lower()
+        self.data = data
+        self.path = path
+        self.size = size
+        self._sha256 = None
+
+    @property
+    def in_memory(self):
+        return self.data is not None
+
+    @property
+    def source(self):
+        """Źródło akceptowane przez img2pdf: bajty lub ścieżka"""
+        return self.data if self.in_memory else self.path
+
+    def read_bytes(self):
+        if self.in_memory:
+            return self.data
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    @contextmanager
+    def buffer(self):
+        """Treść jako bufor bez kopiowania: bajty w pamięci lub ``mmap`` pliku na dysku"""
+        if self.in_memory or not self.size:
+            yield memoryview(self.data or b'')
+            return
+        with open(self.path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            yield mapped
+
+    def sha256(self):
+        """Hash SHA-256 treści (liczony raz)"""
+        if self._sha256 is None:
+            with self.buffer() as buffer:
+                self._sha256 = hashlib.sha256(buffer).hexdigest()
+        return self._sha256
+
+    def merger_source(self):
+        """Źródło dla PyPDF2.PdfMerger: bufor w pamięci lub ścieżka"""
+        if self.in_memory:
+            return io.BytesIO(self.data)
+        return self.path
+
+    def open_pdf(self):
+        """Otwiera dokument PyMuPDF bez dodatkowego zapisu na dysk"""
+        with stage('fitz_open'):
+            if self.in_memory:
+                return fitz.open(stream=self.data, filetype='pdf')
+            return fitz.open(self.path)
+
+    def decode_image(self, flags=None):
+        """Dekoduje obraz OpenCV bezpośrednio z bufora (domyślnie IMREAD_COLOR)"""
+        flags = cv2.IMREAD_COLOR if flags is None else flags
+        with self.buffer() as buffer:
+            encoded = np.frombuffer(buffer, dtype=np.uint8)
+            try:
+                return cv2.imdecode(encoded, flags)
+            finally:
+                del encoded  # Widok musi zniknąć przed zamknięciem mmap
+
+    def close(self):
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        self.path = None
+        self.data = None
+
+
+class SpooledUpload(io.RawIOBase):
+    """Bufor części multipart zapisywany przez parser żądania.
+
+    Do ``spill_threshold`` bajtów dane trzymane są w pamięci, powyżej - w
+    nazwanym pliku tymczasowym w ``spill_dir``, który po przyjęciu
+    (``adopt``) staje się plikiem ``UploadedFile`` bez dodatkowego kopiowania.
+    Przekroczenie ``max_size`` przerywa odbiór żądania (413).
+    """
+
+    def __init__(self, filename, spill_threshold, spill_dir=None, max_size=None):
+        super().__init__()
+        self.filename = filename or ''
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self.max_size = max_size
+        self.path = None
+        self.size = 0
+        self._file = io.BytesIO()
+        self._adopted = False
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        size = self.size + len(data)
+        if self.max_size is not None and size > self.max_size:
+            raise RequestEntityTooLarge(
+                f'Plik "{self.filename}" przekracza dopuszczalny rozmiar {self.max_size / (1024 * 1024):.1f} MB'
+            )
+        if self.path is None and size > self.spill_threshold:
+            self._rollover()
+        self._file.write(data)
+        self.size = size
+        return len(data)
+
+    def _rollover(self):
+        fd, path = tempfile.mkstemp(suffix=os.path.splitext(self.filename)[1], dir=self.spill_dir)
+        target = os.fdopen(fd, 'w+b')
+        try:
+            target.write(self._file.getbuffer())
+        except Exception:
+            target.close()
+            os.remove(path)
+            raise
+        self._file = target
+        self.path = path
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def readinto(self, buffer):
+        return self._file.readinto(buffer)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def adopt(self, filename):
+        """Przekazuje treść do ``UploadedFile`` (plik na dysku nie jest już usuwany przy ``close``)"""
+        self._adopted = True
+        if self.path is None:
+            # Bez eksportowanych widoków getvalue() oddaje wewnętrzny bufor BytesIO (bez kopii);
+            # zamknięcie zwalnia odwołanie BytesIO, więc bajty należą już tylko do UploadedFile.
+            # Widok z getbuffer() nie wystarczy - PyMuPDF 1.23 i img2pdf przyjmują tylko bytes.
+            data = self._file.getvalue()
+            self._file.close()
+            return UploadedFile(filename, data=data, size=self.size)
+        self._file.close()
+        return UploadedFile(filename, path=self.path, size=self.size)
+
+    def close(self):
+        if not self.closed:
+            self._file.close()
+            if self.path and not self._adopted and os.path.exists(self.path):
+                os.remove(self.path)
+        super().close()
+
+
+def _stream_size(stream):
+    try:
+        position = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def ingest_upload(file, spill_threshold, spill_dir=None):
+    """Przyjmuje ``FileStorage`` i zwraca ``UploadedFile``.
+
+    Plik większy od ``spill_threshold`` bajtów jest kopiowany strumieniowo na dysk;
+    część odebrana już do ``SpooledUpload`` przyjmowana jest bez kopiowania.
+    """
+    if isinstance(file.stream, SpooledUpload) and not file.stream.closed:
+        return file.stream.adopt(file.filename)
+    return ingest_stream(file.filename, file.stream, spill_threshold, spill_dir, _stream_size(file.stream))
+
+
+def ingest_stream(filename, stream, spill_threshold, spill_dir=None, size=None):
+    """Przyjmuje dowolny strumień (np. element archiwum) i zwraca ``UploadedFile``"""
+    if size is not None and size <= spill_threshold:
+        data = stream.read()
+        return UploadedFile(filename, data=data, size=len(data))
+
+    fd, path = tempfile.mkstemp(suffix=os.path.splitext(filename)[1], dir=spill_dir)
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            shutil.copyfileobj(stream, target, 1024 * 1024)
+            written = target.tell()
+    except Exception:
+        os.remove(path)
+        raise
+
+    if size is None and written <= spill_threshold:
+        # Rozmiar nie był znany z góry - mały plik i tak wraca do pamięci
+        with open(path, 'rb') as f:
+            data = f.read()
+        os.remove(path)
+        return UploadedFile(filename, data=data, size=written)
+    return UploadedFile(filename, path=path, size=written)
+
+
+class UploadBatch:
+    """Zbiór przyjętych plików sprzątany automatycznie (``with``)"""
+
+    def __init__(self, spill_threshold, spill_dir=None):
+        self.spill_threshold = spill_threshold
+        self.spill_dir = spill_dir
+        self.files = []
+
+    def add(self, file):
+        with stage('upload'):
+            uploaded = ingest_upload(file, self.spill_threshold, self.spill_dir)
+        self.files.append(uploaded)
+        return uploaded
+
+    def add_stream(self, filename, stream, size=None):
+        with stage('upload'):
+            uploaded = ingest_stream(filename, stream, self.spill_threshold, self.spill_dir, size)
+        self.files.append(uploaded)
+        return uploaded
+
+    def close(self):
+        for uploaded in self.files:
+            uploaded.close()
+        self.files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
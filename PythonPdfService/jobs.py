@@ -0,0 +1,238 @@
+"""Asynchroniczne zadania dla długich operacji (łączenie, skanowanie dokumentów).
+
+Zadania trafiają do ograniczonej kolejki obsługiwanej przez stałą liczbę
+wątków roboczych. Postęp jest aktualizowany w trakcie pracy, a wyniki
+przechowywane przez ``result_ttl`` sekund od zakończenia zadania. Wyniki z
+metodą ``close()`` (np. bufory z plikiem tymczasowym) są zamykane przy
+usunięciu zadania lub wygaśnięciu wyniku.
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+JOB_CANCELLED = 'cancelled'
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+
+class JobQueueFull(Exception):
+    """Kolejka zadań jest pełna"""
+
+
+class Job:
+    """Pojedyncze zadanie: stan, postęp i wynik"""
+
+    def __init__(self, operation, runner, cleanup=None, notify=None):
+        self.id = uuid.uuid4().hex
+        self.operation = operation
+        self.status = JOB_QUEUED
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.progress = {}
+        self.error = None
+        self.result = None
+        self.version = 0
+        self._runner = runner
+        self._cleanup = cleanup
+        self._notify = notify
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATES
+
+    def update_progress(self, **fields):
+        """Aktualizuje postęp (np. pagesDone, filesDone, bytesWritten)"""
+        self.progress.update(fields)
+        self._changed()
+
+    def _changed(self):
+        self.version += 1
+        if self._notify:
+            self._notify()
+
+    def to_dict(self):
+        data = {
+            'jobId': self.id,
+            'operation': self.operation,
+            'status': self.status,
+            'progress': dict(self.progress),
+            'version': self.version,
+            'createdAt': self.created_at,
+            'startedAt': self.started_at,
+            'finishedAt': self.finished_at,
+        }
+        if self.started_at:
+            data['elapsedMs'] = round(((self.finished_at or time.time()) - self.started_at) * 1000, 3)
+        if self.error:
+            data['error'] = self.error
+        return data
+
+
+class JobManager:
+    """Ograniczona kolejka zadań z pulą wątków roboczych i czasem życia wyników"""
+
+    def __init__(self, workers=2, max_queued=32, result_ttl=600):
+        self.workers = max(1, int(workers))
+        self.max_queued = max(1, int(max_queued))
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=self.max_queued)
+        self._jobs = {}
+        self._condition = threading.Condition()
+        self._threads = []
+        self._pid = None
+        self._stats = {'submitted': 0, 'rejected': 0, 'succeeded': 0, 'failed': 0, 'cancelled': 0, 'expired': 0}
+
+    def _ensure_workers(self):
+        # Wątki startowane leniwie - także po fork() w workerze gunicorn
+        if self._pid == os.getpid() and all(thread.is_alive() for thread in self._threads):
+            return
+        with self._condition:
+            if self._pid != os.getpid():
+                self._threads = []
+                self._pid = os.getpid()
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(
+                    target=self._work, name=f'job-worker-{len(self._threads)}', daemon=True
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def _notify(self):
+        with self._condition:
+            self._condition.notify_all()
+
+    def submit(self, operation, runner, cleanup=None):
+        """Dodaje zadanie; ``runner(job)`` zwraca wynik, ``cleanup()`` zwalnia zasoby wejściowe"""
+        self._purge_expired()
+        self._ensure_workers()
+        job = Job(operation, runner, cleanup, self._notify)
+        with self._condition:
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._stats['rejected'] += 1
+                raise JobQueueFull(f'Kolejka zadań jest pełna ({self.max_queued})')
+            self._jobs[job.id] = job
+            self._stats['submitted'] += 1
+        return job
+
+    def get(self, job_id):
+        self._purge_expired()
+        with self._condition:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, timeout, version=None):
+        """Long-poll: czeka na zmianę stanu zadania (inną wersję niż ``version``) lub jego koniec"""
+        deadline = time.time() + max(0.0, timeout)
+        with self._condition:
+            job = self._jobs.get(job_id)
+            while job is not None and not job.finished:
+                if version is not None and job.version != version:
+                    break
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+                job = self._jobs.get(job_id)
+            return job
+
+    def cancel(self, job_id):
+        """Anuluje zadanie oczekujące w kolejce; zwraca False dla zadań już uruchomionych"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or job.status != JOB_QUEUED:
+                return False
+            job.status = JOB_CANCELLED
+            job.finished_at = time.time()
+            self._stats['cancelled'] += 1
+        self._release(job)
+        job._changed()
+        return True
+
+    def remove(self, job_id):
+        """Usuwa zakończone zadanie wraz z wynikiem"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is None or not job.finished:
+                return False
+            del self._jobs[job_id]
+        self._close_result(job)
+        return True
+
+    def _release(self, job):
+        cleanup, job._cleanup, job._runner = job._cleanup, None, None
+        if cleanup:
+            try:
+                cleanup()
+            except Exception:
+                pass
+
+    @staticmethod
+    def _close_result(job):
+        result, job.result = job.result, None
+        close = getattr(result, 'close', None)
+        if close:
+            try:
+                close()
+            except Exception:
+                pass
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            try:
+                # Sprawdzenie i zmiana stanu pod blokadą - jak w cancel(), który zwalnia pliki wejściowe
+                with self._condition:
+                    if job.status != JOB_QUEUED:
+                        continue  # Anulowane w kolejce
+                    job.status = JOB_RUNNING
+                    job.started_at = time.time()
+                job._changed()
+                try:
+                    job.result = job._runner(job)
+                    job.status = JOB_SUCCEEDED
+                except Exception as e:
+                    job.error = str(e)
+                    job.status = JOB_FAILED
+                job.finished_at = time.time()
+                with self._condition:
+                    self._stats[job.status] += 1
+                self._release(job)
+                job._changed()
+            finally:
+                self._queue.task_done()
+
+    def _purge_expired(self):
+        now = time.time()
+        with self._condition:
+            expired = [
+                job for job in self._jobs.values()
+                if job.finished and job.finished_at and now - job.finished_at > self.result_ttl
+            ]
+            for job in expired:
+                del self._jobs[job.id]
+            self._stats['expired'] += len(expired)
+        for job in expired:
+            self._close_result(job)
+
+    def stats(self):
+        with self._condition:
+            snapshot = dict(self._stats)
+            states = {}
+            for job in self._jobs.values():
+                states[job.status] = states.get(job.status, 0) + 1
+        snapshot.update({
+            'workers': self.workers,
+            'queueDepth': self._queue.qsize(),
+            'maxQueued': self.max_queued,
+            'resultTtl': self.result_ttl,
+            'jobs': states,
+        })
+        return snapshot
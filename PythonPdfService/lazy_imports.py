@@ -0,0 +1,122 @@
+"""Leniwe ładowanie ciężkich zależności z pomiarem czasu importu.
+
+``lazy_import('fitz', 'pdf')`` zwraca obiekt zastępczy, który importuje moduł
+przy pierwszym użyciu atrybutu. Czasy importów i stan podsystemów są
+dostępne przez ``import_report()``, a ``start_warmup()`` ładuje wskazane
+podsystemy z wyprzedzeniem (synchronicznie lub w wątku w tle).
+"""
+import importlib
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_registry_lock = threading.Lock()
+_warmup = {
+    'state': 'idle',  # idle | running | done | failed
+    'startedAt': None,
+    'finishedAt': None,
+    'error': None,
+}
+
+
+class LazyModule:
+    """Obiekt zastępczy modułu ładowanego przy pierwszym dostępie do atrybutu"""
+
+    def __init__(self, name, subsystem):
+        object.__setattr__(self, '_lazy_name', name)
+        object.__setattr__(self, '_lazy_subsystem', subsystem)
+        object.__setattr__(self, '_lazy_module', None)
+        object.__setattr__(self, '_lazy_import_ms', None)
+        object.__setattr__(self, '_lazy_lock', threading.Lock())
+
+    def _load(self):
+        if self._lazy_module is None:
+            with self._lazy_lock:
+                if self._lazy_module is None:
+                    start = time.perf_counter()
+                    module = importlib.import_module(self._lazy_name)
+                    elapsed_ms = (time.perf_counter() - start) * 1000
+                    object.__setattr__(self, '_lazy_import_ms', elapsed_ms)
+                    # Kolejne odwołania omijają __getattr__
+                    self.__dict__.update(module.__dict__)
+                    object.__setattr__(self, '_lazy_module', module)
+                    logger.info('Zaimportowano %s (%s) w %.1f ms', self._lazy_name, self._lazy_subsystem, elapsed_ms)
+        return self._lazy_module
+
+    @property
+    def loaded(self):
+        return self._lazy_module is not None
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self._load(), attr, value)
+
+    def __repr__(self):
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f'<LazyModule {self._lazy_name} ({state})>'
+
+
+def lazy_import(name, subsystem):
+    """Zwraca (współdzielony) leniwy moduł przypisany do podsystemu"""
+    with _registry_lock:
+        module = _registry.get(name)
+        if module is None:
+            module = LazyModule(name, subsystem)
+            _registry[name] = module
+        return module
+
+
+def load_subsystem(subsystem):
+    """Importuje wszystkie moduły podsystemu"""
+    for module in [m for m in _registry.values() if m._lazy_subsystem == subsystem]:
+        module._load()
+
+
+def subsystems():
+    return sorted({module._lazy_subsystem for module in _registry.values()})
+
+
+def start_warmup(names, background=True, extra=None):
+    """Ładuje podsystemy ``names`` (i wywołuje ``extra``) - w tle lub synchronicznie"""
+
+    def run():
+        _warmup.update(state='running', startedAt=time.time(), error=None)
+        try:
+            for subsystem in names:
+                load_subsystem(subsystem)
+            if extra:
+                extra()
+            _warmup.update(state='done', finishedAt=time.time())
+        except Exception as e:
+            logger.exception('Rozgrzewka zależności nie powiodła się')
+            _warmup.update(state='failed', finishedAt=time.time(), error=str(e))
+
+    if background:
+        thread = threading.Thread(target=run, name='import-warmup', daemon=True)
+        thread.start()
+        return thread
+    run()
+    return None
+
+
+def warmup_state():
+    return dict(_warmup)
+
+
+def import_report():
+    """Zwraca stan i czas importu każdego modułu, pogrupowane wg podsystemów"""
+    report = {}
+    for name, module in sorted(_registry.items()):
+        entry = report.setdefault(module._lazy_subsystem, {'loaded': True, 'importTimeMs': 0.0, 'modules': {}})
+        entry['modules'][name] = {
+            'loaded': module.loaded,
+            'importTimeMs': round(module._lazy_import_ms, 1) if module._lazy_import_ms is not None else None
+        }
+        entry['loaded'] = entry['loaded'] and module.loaded
+        entry['importTimeMs'] = round(entry['importTimeMs'] + (module._lazy_import_ms or 0.0), 1)
+    return report
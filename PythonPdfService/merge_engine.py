@@ -0,0 +1,224 @@
+"""Silniki łączenia dokumentów PDF.
+
+``pymupdf`` kopiuje strony przez ``Document.insert_pdf`` (kod natywny MuPDF)
+i przy zapisie może odśmiecać i deduplikować współdzielone zasoby (fonty,
+obrazy), kompresować strumienie oraz linearyzować wynik. ``pypdf2`` to
+dotychczasowa implementacja oparta o ``PyPDF2.PdfMerger``.
+
+Opcja ``optimize`` (tylko ``pymupdf``) przed zapisem zmniejsza i rekompresuje
+osadzone obrazy (``pdf_optimizer``) i zapisuje wynik z pełną deduplikacją.
+
+Z każdego pliku można wybrać zakres stron, obrót i kolejność (``parse_selection``)
+- kopiowane są wyłącznie wybrane strony.
+"""
+import io
+import re
+from collections import Counter
+
+from lazy_imports import lazy_import
+from metrics import stage
+from pdf_optimizer import OPTIMIZE_SAVE_OPTIONS, optimize_images
+from pdf_output import save_pdf
+
+fitz = lazy_import('fitz', 'pdf')
+PyPDF2 = lazy_import('PyPDF2', 'pdf')
+
+MERGE_ENGINES = ('pymupdf', 'pypdf2')
+DEFAULT_MERGE_OPTIONS = {
+    'engine': 'pymupdf',
+    'garbage': 3,        # 0-4: 3 - scalanie identycznych obiektów, 4 - także porównanie strumieni
+    'compression': 1,    # 0 - bez kompresji, 1 - strumienie, 2 - także obrazy i fonty
+    'linearize': False,  # "Fast web view"
+    'optimize': None,    # Opcje z ``optimize_options`` - optymalizacja obrazów wyniku
+}
+ROTATIONS = (0, 90, 180, 270)
+SELECTION_PATTERN = re.compile(r'^files\[(\d+)\](?::(\d*)(-?)(\d*))?(?:@(-?\d+))?$')
+
+
+class MergeOptionsError(ValueError):
+    """Nieprawidłowe parametry łączenia"""
+
+
+def merge_options(**overrides):
+    """Łączy domyślne opcje z nadpisaniami (wartości ``None`` pomijane) i je waliduje"""
+    options = dict(DEFAULT_MERGE_OPTIONS)
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    if options['engine'] not in MERGE_ENGINES:
+        raise MergeOptionsError(f'Nieobsługiwany silnik łączenia: "{options["engine"]}"')
+    if options['garbage'] not in range(5):
+        raise MergeOptionsError('Parametr garbage musi mieścić się w zakresie 0-4')
+    if options['compression'] not in range(3):
+        raise MergeOptionsError('Parametr compression musi mieścić się w zakresie 0-2')
+    if options['optimize'] and options['engine'] != 'pymupdf':
+        raise MergeOptionsError('Optymalizacja jest dostępna tylko dla silnika pymupdf')
+    return options
+
+
+def parse_selection(spec):
+    """Parsuje wybór stron, np. ``files[0]:1-5,files[2]:10-@90,files[0]:7``.
+
+    Kolejne elementy wyznaczają kolejność stron w wyniku. Zakres (numeracja od 1)
+    może mieć postać ``3``, ``1-5``, ``10-``, ``-4`` lub malejącą ``5-1`` (odwrócona
+    kolejność); brak zakresu oznacza cały plik. ``@90`` obraca strony zgodnie
+    z ruchem wskazówek zegara względem ich bieżącego obrotu (wielokrotność 90).
+    """
+    selection = []
+    for item in spec.split(','):
+        item = item.strip().replace(' ', '')
+        if not item:
+            continue
+        match = SELECTION_PATTERN.match(item)
+        if not match:
+            raise MergeOptionsError(f'Nieprawidłowy element wyboru stron: "{item}"')
+        file_index, start, dash, end, rotate = match.groups()
+        if ':' in item and not (start or dash or end):
+            raise MergeOptionsError(f'Nieprawidłowy element wyboru stron: "{item}"')
+        rotate = int(rotate or 0) % 360
+        if rotate not in ROTATIONS:
+            raise MergeOptionsError(f'Obrót musi być wielokrotnością 90 stopni: "{item}"')
+        start = int(start) if start else None
+        end = int(end) if end else (None if dash else start)
+        if (start is not None and start < 1) or (end is not None and end < 1):
+            raise MergeOptionsError(f'Numeracja stron zaczyna się od 1: "{item}"')
+        selection.append({'file': int(file_index), 'start': start, 'end': end, 'rotate': rotate})
+    if not selection:
+        raise MergeOptionsError('Pusty wybór stron')
+    return selection
+
+
+def page_range(part, page_count):
+    """Zamienia zakres elementu wyboru na indeksy (od 0) pierwszej i ostatniej strony"""
+    if part is None:
+        return 0, page_count - 1
+    first = part['start'] if part['start'] is not None else 1
+    last = part['end'] if part['end'] is not None else page_count
+    if max(first, last) > page_count:
+        raise MergeOptionsError(
+            f'Zakres stron {first}-{last} wykracza poza dokument files[{part["file"]}] ({page_count} stron)'
+        )
+    return first - 1, last - 1
+
+
+def _no_progress(**fields):
+    pass
+
+
+def save_options(options):
+    """Zamienia opcje łączenia na argumenty zapisu (``fitz.Document.save``)"""
+    if options.get('optimize'):
+        return {**OPTIMIZE_SAVE_OPTIONS, 'linear': options['linearize']}
+    return {
+        'garbage': options['garbage'],
+        'deflate': options['compression'] >= 1,
+        'deflate_images': options['compression'] >= 2,
+        'deflate_fonts': options['compression'] >= 2,
+        'linear': options['linearize'],
+    }
+
+
+def document_parts(pdf_files, selection=None):
+    """Lista (plik, element wyboru) do skopiowania; bez wyboru - całe dokumenty w kolejności"""
+    if selection is None:
+        return [(pdf_file, None) for pdf_file in pdf_files]
+    return selection
+
+
+def merge_with_pymupdf(pdf_files, images_pdf=None, options=None, progress=_no_progress, output=None, selection=None,
+                       report=None):
+    """Łączy dokumenty przez PyMuPDF; zwraca wynik w ``output`` (BytesIO) lub w pliku tymczasowym (domyślnie).
+
+    ``selection`` to lista par (plik, element z ``parse_selection``) - każdy plik
+    otwierany jest raz, a ``insert_pdf`` kopiuje tylko strony z wybranego zakresu.
+    Przy optymalizacji jej raport trafia do słownika ``report``.
+    """
+    options = options or DEFAULT_MERGE_OPTIONS
+    parts = document_parts(pdf_files, selection)
+    remaining = Counter(id(pdf_file) for pdf_file, _ in parts)
+    merged = fitz.open()
+    sources = {}
+    try:
+        for index, (pdf_file, part) in enumerate(parts, start=1):
+            source = sources.get(id(pdf_file))
+            if source is None:
+                source = sources[id(pdf_file)] = pdf_file.open_pdf()
+            with stage('insert_pdf'):
+                if part is None:
+                    merged.insert_pdf(source)
+                else:
+                    from_page, to_page = page_range(part, source.page_count)
+                    added = merged.page_count
+                    merged.insert_pdf(source, from_page=from_page, to_page=to_page)
+                    if part['rotate']:
+                        # Obrót względem bieżącego (jak w PyPDF2) - ``insert_pdf(rotate=)`` ustawia go bezwzględnie
+                        for page_number in range(added, merged.page_count):
+                            page = merged[page_number]
+                            page.set_rotation((page.rotation + part['rotate']) % 360)
+            # Dokument zamykany po ostatnim użyciu
+            remaining[id(pdf_file)] -= 1
+            if not remaining[id(pdf_file)]:
+                sources.pop(id(pdf_file)).close()
+            progress(filesDone=index)
+
+        if images_pdf is not None:
+            source = fitz.open(stream=images_pdf, filetype='pdf')
+            try:
+                with stage('insert_pdf'):
+                    merged.insert_pdf(source)
+            finally:
+                source.close()
+
+        if options.get('optimize'):
+            optimize_report = optimize_images(merged, options['optimize'])
+            if report is not None:
+                report.update(optimize_report)
+
+        with stage('save'):
+            output_buffer = save_pdf(merged, output, **save_options(options))
+    finally:
+        for source in sources.values():
+            source.close()
+        merged.close()
+    progress(bytesWritten=output_buffer.tell())
+    output_buffer.seek(0)
+    return output_buffer
+
+
+def merge_with_pypdf2(pdf_files, images_pdf=None, options=None, progress=_no_progress, output=None, selection=None):
+    """Łączy dokumenty przez PyPDF2.PdfMerger; zapisuje wynik do ``output`` (domyślnie BytesIO) i go zwraca"""
+    merger = PyPDF2.PdfMerger()
+    readers = {}
+    for index, (pdf_file, part) in enumerate(document_parts(pdf_files, selection), start=1):
+        if part is None:
+            merger.append(pdf_file.merger_source())
+        else:
+            reader = readers.get(id(pdf_file))
+            if reader is None:
+                reader = readers[id(pdf_file)] = PyPDF2.PdfReader(pdf_file.merger_source())
+            from_page, to_page = page_range(part, len(reader.pages))
+            step = 1 if to_page >= from_page else -1
+            added = len(merger.pages)
+            merger.append(reader, pages=(from_page, to_page + step, step))
+            if part['rotate']:
+                for merged_page in merger.pages[added:]:
+                    merged_page.pagedata.rotate(part['rotate'])
+        progress(filesDone=index)
+
+    if images_pdf is not None:
+        merger.append(io.BytesIO(images_pdf))
+
+    output_buffer = output if output is not None else io.BytesIO()
+    with stage('save'):
+        merger.write(output_buffer)
+    merger.close()
+    progress(bytesWritten=output_buffer.tell())
+    output_buffer.seek(0)
+    return output_buffer
+
+
+def merge_documents(pdf_files, images_pdf=None, options=None, progress=_no_progress, output=None, selection=None,
+                    report=None):
+    """Łączy dokumenty wybranym silnikiem (``options['engine']``)"""
+    options = options or DEFAULT_MERGE_OPTIONS
+    if options['engine'] == 'pypdf2':
+        return merge_with_pypdf2(pdf_files, images_pdf, options, progress, output, selection)
+    return merge_with_pymupdf(pdf_files, images_pdf, options, progress, output, selection, report)
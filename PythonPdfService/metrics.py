@@ -0,0 +1,315 @@
+"""Metryki w formacie tekstowym Prometheus oraz pomiar czasu etapów przetwarzania.
+
+Każde żądanie ma własną oś czasu (``Timeline``) ustawianą w zmiennej kontekstowej.
+``with stage('fitz_open'):`` mierzy etap, zapisuje go w histogramie
+``pdf_service_stage_duration_seconds`` i na osi czasu bieżącego żądania, z której
+budowany jest nagłówek ``Server-Timing``. Etapy wykonywane poza żądaniem (np. w
+zadaniach bez własnej osi czasu) trafiają do histogramu z etykietą ``background``.
+
+Metryki są przechowywane per proces - przy kilku workerach gunicorn każdy
+zwraca własne wartości (Prometheus agreguje je po etykiecie instancji).
+"""
+import contextvars
+import cProfile
+import logging
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+BYTES_BUCKETS = tuple(1024 * 4 ** exponent for exponent in range(10))  # 1 KiB - 256 MiB
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Licznik monotoniczny z etykietami"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Gauge:
+    """Wartość chwilowa z etykietami (np. głębokość kolejki)"""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} gauge']
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}')
+        return lines
+
+
+class Histogram:
+    """Histogram z kubełkami skumulowanymi w momencie eksportu"""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for key, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labelnames, key, ('le', _format_value(bound)))
+                    lines.append(f'{self.name}_bucket{labels} {cumulative}')
+                labels = _format_labels(self.labelnames, key)
+                lines.append(f'{self.name}_sum{labels} {_format_value(total)}')
+                lines.append(f'{self.name}_count{labels} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    """Zbiór metryk eksportowanych razem przez ``/metrics``"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, documentation, labelnames=()):
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def gauge(self, name, documentation, labelnames=()):
+        metric = Gauge(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Dodaje funkcję zwracającą listę (nazwa, typ, opis, wartość) - np. stan pul i cache"""
+        self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        for collector in self._collectors:
+            try:
+                for name, kind, documentation, value in collector():
+                    lines.extend([f'# HELP {name} {documentation}', f'# TYPE {name} {kind}', f'{name} {value}'])
+            except Exception:
+                logger.exception('Błąd kolektora metryk')
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+REQUEST_DURATION = registry.histogram(
+    'pdf_service_request_duration_seconds', 'Czas obsługi żądania (do wysłania nagłówków)',
+    ('endpoint', 'method', 'status')
+)
+STAGE_DURATION = registry.histogram(
+    'pdf_service_stage_duration_seconds', 'Czas etapów przetwarzania', ('endpoint', 'stage')
+)
+REQUEST_BYTES = registry.histogram(
+    'pdf_service_request_bytes', 'Rozmiar treści żądania', ('endpoint',), buckets=BYTES_BUCKETS
+)
+RESPONSE_BYTES = registry.histogram(
+    'pdf_service_response_bytes', 'Rozmiar treści odpowiedzi (gdy znany)', ('endpoint',), buckets=BYTES_BUCKETS
+)
+PAGES_PROCESSED = registry.counter('pdf_service_pages_processed_total', 'Przetworzone strony', ('endpoint',))
+ERRORS = registry.counter('pdf_service_errors_total', 'Odpowiedzi z błędem (4xx/5xx)', ('endpoint', 'status'))
+PROFILES = registry.counter('pdf_service_profiles_total', 'Zapisane profile żądań', ('endpoint',))
+ADMISSION_QUEUE_DEPTH = registry.gauge(
+    'pdf_service_admission_queue_depth', 'Żądania oczekujące na dopuszczenie', ('group',)
+)
+ADMISSION_IN_USE = registry.gauge(
+    'pdf_service_admission_in_use', 'Zajęte jednostki kosztu (grupy) lub bajty (pamięć)', ('group',)
+)
+ADMISSION_REJECTIONS = registry.counter(
+    'pdf_service_admission_rejections_total', 'Żądania odrzucone przez kontrolę dopuszczenia', ('group', 'reason')
+)
+ADMISSION_WAIT = registry.histogram(
+    'pdf_service_admission_wait_seconds', 'Czas oczekiwania na dopuszczenie', ('group',)
+)
+
+
+class Timeline:
+    """Etapy zmierzone w ramach jednego żądania lub zadania"""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.started = time.perf_counter()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def server_timing(self):
+        """Wartość nagłówka Server-Timing: czasy etapów (sumy) i czas całkowity w ms"""
+        with self._lock:
+            entries = [f'{name};dur={seconds * 1000:.1f}' for name, seconds in self.stages.items()]
+        entries.append(f'total;dur={(time.perf_counter() - self.started) * 1000:.1f}')
+        return ', '.join(entries)
+
+
+_timeline = contextvars.ContextVar('pdf_service_timeline', default=None)
+
+
+def start_timeline(endpoint):
+    """Ustawia nową oś czasu w bieżącym kontekście; zwraca ``(oś, token)``"""
+    timeline = Timeline(endpoint)
+    return timeline, _timeline.set(timeline)
+
+
+def end_timeline(token):
+    _timeline.reset(token)
+
+
+def current_timeline():
+    return _timeline.get()
+
+
+@contextmanager
+def timeline(endpoint):
+    """Oś czasu dla pracy poza żądaniem (np. zadania asynchronicznego)"""
+    current, token = start_timeline(endpoint)
+    try:
+        yield current
+    finally:
+        end_timeline(token)
+
+
+def observe_stage(name, seconds, timeline=None):
+    """Zapisuje czas etapu w histogramie i na osi czasu (bieżącej lub wskazanej)"""
+    timeline = timeline or _timeline.get()
+    STAGE_DURATION.observe(seconds, endpoint=timeline.endpoint if timeline else 'background', stage=name)
+    if timeline is not None:
+        timeline.add(name, seconds)
+
+
+@contextmanager
+def stage(name):
+    """Mierzy czas bloku jako etap ``name``"""
+    timeline = _timeline.get()
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started, timeline)
+
+
+def add_pages(count):
+    timeline = _timeline.get()
+    PAGES_PROCESSED.inc(count, endpoint=timeline.endpoint if timeline else 'background')
+
+
+class RequestProfiler:
+    """Próbkujący profiler żądań: ``sample_rate`` żądań jest profilowanych (cProfile)
+    i zapisywanych do ``output_dir``; naraz profilowane jest co najwyżej jedno żądanie"""
+
+    def __init__(self, sample_rate=0.0, output_dir=None):
+        self.sample_rate = sample_rate
+        self.output_dir = output_dir
+        self._active = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.sample_rate > 0 and bool(self.output_dir)
+
+    def maybe_start(self):
+        """Rozpoczyna profilowanie wylosowanego żądania; zwraca profil lub None"""
+        if not self.enabled or random.random() >= self.sample_rate:
+            return None
+        if not self._active.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Inny profiler jest już aktywny w tym procesie
+            self._active.release()
+            return None
+        return profile
+
+    def stop(self, profile, endpoint):
+        """Kończy profilowanie i zapisuje plik ``.prof`` (do analizy w pstats/snakeviz)"""
+        try:
+            profile.disable()
+            os.makedirs(self.output_dir, exist_ok=True)
+            name = endpoint.strip('/').replace('/', '_').replace('<', '').replace('>', '') or 'root'
+            path = os.path.join(self.output_dir, f'{name}-{time.strftime("%Y%m%d_%H%M%S")}-{os.getpid()}.prof')
+            profile.dump_stats(path)
+            PROFILES.inc(endpoint=endpoint)
+            logger.info('Zapisano profil żądania %s: %s', endpoint, path)
+        finally:
+            self._active.release()
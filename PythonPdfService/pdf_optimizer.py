@@ -0,0 +1,223 @@
+"""Optymalizacja rozmiaru PDF: zmniejszanie i rekompresja osadzonych obrazów.
+
+Dla każdego obrazu wyznaczana jest największa wielkość, w jakiej jest
+wyświetlany na stronach - obrazy o rozdzielczości wyższej niż docelowe DPI są
+zmniejszane (OpenCV, ``INTER_AREA``), a wszystkie kandydujące kodowane ponownie
+jako JPEG. Dekodowanie i kodowanie odbywa się równolegle we wspólnej puli wątków
+przygotowujących obrazy (OpenCV zwalnia GIL), z limitem pamięci zdekodowanych
+bitmap; podmiana strumieni w dokumencie - w wątku wywołującym. Nowy strumień
+zastępuje stary tylko, gdy jest wyraźnie mniejszy.
+
+Pomijane są obrazy z maską przezroczystości, o głębi innej niż 8 bitów, w
+przestrzeniach barw innych niż RGB/szarość oraz dwupoziomowe (JBIG2, CCITT).
+Identyczne strumienie, fonty i obiekty scala zapis z ``garbage=4``.
+"""
+import io
+import time
+from contextlib import contextmanager
+
+from image_pipeline import get_image_threads, get_memory_budget
+from lazy_imports import lazy_import
+from metrics import stage
+from pdf_output import save_pdf
+
+cv2 = lazy_import('cv2', 'images')
+np = lazy_import('numpy', 'images')
+
+DEFAULT_OPTIMIZE_OPTIONS = {
+    'dpi': 150,                  # Maks. rozdzielczość obrazu w miejscu wyświetlenia
+    'jpeg_quality': 75,          # Jakość ponownie kodowanych obrazów
+    'min_image_bytes': 16384,    # Mniejsze strumienie obrazów są pomijane
+    'min_savings': 0.1,          # Nowy strumień musi być mniejszy o co najmniej taką część
+}
+# Zapis z deduplikacją identycznych obiektów i strumieni (fonty, obrazy) i kompresją
+OPTIMIZE_SAVE_OPTIONS = {'garbage': 4, 'deflate': True, 'deflate_images': True, 'deflate_fonts': True}
+SUPPORTED_COLORSPACES = ('DeviceRGB', 'DeviceGray', 'ICCBased')
+SKIPPED_FILTERS = ('JBIG2Decode', 'CCITTFaxDecode')
+
+
+class OptimizeOptionsError(ValueError):
+    """Nieprawidłowe parametry optymalizacji"""
+
+
+def optimize_options(**overrides):
+    """Łączy domyślne opcje z nadpisaniami (wartości ``None`` pomijane) i je waliduje"""
+    options = dict(DEFAULT_OPTIMIZE_OPTIONS)
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    if not 36 <= options['dpi'] <= 1200:
+        raise OptimizeOptionsError('Rozdzielczość optymalizacji musi mieścić się w zakresie 36-1200 DPI')
+    if not 1 <= options['jpeg_quality'] <= 100:
+        raise OptimizeOptionsError('Jakość JPEG optymalizacji musi mieścić się w zakresie 1-100')
+    return options
+
+
+@contextmanager
+def optimize_stage(timings, name):
+    """Mierzy etap optymalizacji: histogram ``optimize_<name>`` i suma w ``timings`` (ms)"""
+    started = time.perf_counter()
+    try:
+        with stage(f'optimize_{name}'):
+            yield
+    finally:
+        timings[name] = round(timings.get(name, 0.0) + (time.perf_counter() - started) * 1000, 1)
+
+
+def required_scale(width, height, rects, dpi):
+    """Skala (<= 1) wystarczająca do wyświetlenia obrazu we wszystkich ``rects`` z ``dpi``"""
+    if not rects:
+        return 1.0  # Nieznany rozmiar wyświetlania - bez zmniejszania
+    needed = max(max(rect.width / 72 * dpi / width, rect.height / 72 * dpi / height) for rect in rects)
+    return min(1.0, needed)
+
+
+def image_targets(doc, options, skipped):
+    """Obrazy do optymalizacji: xref -> {page, width, height, scale}; powody pominięcia w ``skipped``"""
+    targets = {}
+    rejected = set()
+    for page in doc:
+        for xref, smask, width, height, bpc, colorspace, _, _, image_filter, _ in page.get_images(full=True):
+            if xref in rejected:
+                continue
+            reason = None
+            if smask:
+                reason = 'smask'
+            elif bpc != 8:
+                reason = 'bitDepth'
+            elif colorspace not in SUPPORTED_COLORSPACES:
+                reason = 'colorspace'
+            elif image_filter in SKIPPED_FILTERS:
+                reason = 'filter'
+            if reason:
+                rejected.add(xref)
+                skipped[reason] = skipped.get(reason, 0) + 1
+                continue
+            scale = required_scale(width, height, page.get_image_rects(xref), options['dpi'])
+            target = targets.get(xref)
+            if target is None:
+                targets[xref] = {'page': page.number, 'width': width, 'height': height, 'scale': scale}
+            else:
+                target['scale'] = max(target['scale'], scale)
+    return targets
+
+
+def recompress_image(data, scale, options):
+    """Dekoduje obraz, zmniejsza go do ``scale`` i koduje jako JPEG; zwraca bajty lub ``None``"""
+    img_array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_UNCHANGED)
+    if img_array is None:
+        return None
+    if img_array.dtype != np.uint8:
+        img_array = (img_array >> 8).astype(np.uint8)
+    if img_array.ndim == 3 and img_array.shape[2] == 4:
+        img_array = img_array[:, :, :3]
+    if scale < 1.0:
+        size = (max(1, round(img_array.shape[1] * scale)), max(1, round(img_array.shape[0] * scale)))
+        img_array = cv2.resize(img_array, size, interpolation=cv2.INTER_AREA)
+    ok, encoded = cv2.imencode('.jpg', img_array, [cv2.IMWRITE_JPEG_QUALITY, options['jpeg_quality']])
+    return encoded.tobytes() if ok else None
+
+
+def optimize_images(doc, options=None):
+    """Zmniejsza i rekompresuje obrazy otwartego dokumentu (w miejscu); zwraca raport"""
+    options = options or DEFAULT_OPTIMIZE_OPTIONS
+    timings = {}
+    skipped = {}
+    report = {
+        'imagesFound': 0,
+        'imagesRecompressed': 0,
+        'imagesDownsampled': 0,
+        'imageBytesBefore': 0,
+        'imageBytesAfter': 0,
+        'skipped': skipped,
+        'stageMs': timings,
+    }
+    pool = get_image_threads()
+    budget = get_memory_budget()
+    futures = []
+
+    def run(data, scale, reserved):
+        try:
+            return recompress_image(data, scale, options)
+        finally:
+            budget.release(reserved)
+
+    try:
+        with optimize_stage(timings, 'analyze'):
+            targets = image_targets(doc, options, skipped)
+        report['imagesFound'] = len(targets) + sum(skipped.values())
+
+        # Obrazy trafiają do puli zaraz po odczytaniu - rekompresja biegnie równolegle z odczytem kolejnych
+        for xref, target in targets.items():
+            with optimize_stage(timings, 'extract'):
+                original_size = len(doc.xref_stream_raw(xref))
+                if original_size < options['min_image_bytes']:
+                    skipped['small'] = skipped.get('small', 0) + 1
+                    continue
+                data = doc.extract_image(xref)['image']
+            reserved = budget.acquire(target['width'] * target['height'] * 3)
+            try:
+                future = pool.submit(run, data, target['scale'], reserved)
+            except Exception:
+                budget.release(reserved)
+                raise
+            futures.append((future, xref, target, original_size, reserved))
+
+        for future, xref, target, original_size, _ in futures:
+            with optimize_stage(timings, 'recompress'):
+                data = future.result()
+            report['imageBytesBefore'] += original_size
+            if data is None or len(data) > original_size * (1 - options['min_savings']):
+                skipped['noSavings'] = skipped.get('noSavings', 0) + 1
+                report['imageBytesAfter'] += original_size
+                continue
+            with optimize_stage(timings, 'replace'):
+                doc[target['page']].replace_image(xref, stream=data)
+            report['imagesRecompressed'] += 1
+            report['imagesDownsampled'] += target['scale'] < 1.0
+            report['imageBytesAfter'] += len(data)
+    finally:
+        for future, _, _, _, reserved in futures:
+            if future.cancel():
+                budget.release(reserved)  # Zadanie nie wystartowało - rezerwację zwalniamy tutaj
+    return report
+
+
+def optimize_pdf(uploaded, options=None, output=None):
+    """Optymalizuje przesłany PDF; zwraca (plik lub ``output`` z wynikiem, raport).
+
+    Bez ``output`` wynik zapisywany jest do pliku tymczasowego (``save_pdf``).
+    Gdy nie jest mniejszy od oryginału, zwracany jest oryginał - bez kopiowania.
+    """
+    doc = uploaded.open_pdf()
+    try:
+        report = optimize_images(doc, options)
+        with optimize_stage(report['stageMs'], 'save'):
+            output = save_pdf(doc, output, **OPTIMIZE_SAVE_OPTIONS)
+        report['pageCount'] = doc.page_count
+    finally:
+        doc.close()
+
+    optimized_size = output.tell()
+    report['originalBytes'] = uploaded.size
+    report['unchanged'] = optimized_size >= uploaded.size
+    if report['unchanged']:
+        output.close()
+        # Uchwyt otwarty teraz pozostaje ważny także po usunięciu pliku przy sprzątaniu uploadów
+        output = io.BytesIO(uploaded.data) if uploaded.in_memory else open(uploaded.path, 'rb')
+        optimized_size = uploaded.size
+    report['optimizedBytes'] = optimized_size
+    report['savedBytes'] = uploaded.size - optimized_size
+    output.seek(0)
+    return output, report
+
+
+def report_headers(report):
+    """Nagłówki podsumowujące optymalizację (oszczędność i czasy etapów)"""
+    headers = {
+        'X-Images-Recompressed': str(report['imagesRecompressed']),
+        'X-Optimize-Timings': ';'.join(f'{name}={value}' for name, value in report['stageMs'].items()),
+    }
+    if 'savedBytes' in report:
+        headers['X-Bytes-Saved'] = str(report['savedBytes'])
+    else:
+        headers['X-Image-Bytes-Saved'] = str(report['imageBytesBefore'] - report['imageBytesAfter'])
+    return headers
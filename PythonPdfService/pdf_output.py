@@ -0,0 +1,41 @@
+"""Zapis dokumentów PyMuPDF do plików wynikowych bez serializacji całości w pamięci.
+
+PyMuPDF 1.23 zapisuje dokument tylko do ścieżki albo ``io.BytesIO`` - inne
+obiekty plikowe (``SpooledTemporaryFile``, ``TemporaryFile``) kończą się błędem
+"could not write to Py file obj", a ``Document.tobytes`` buduje cały wynik jako
+jeden obiekt ``bytes``. Wynik trafia więc do nowego pliku tymczasowego zapisanego
+przez ścieżkę; plik jest od razu usuwany z katalogu, a otwarty uchwyt pozwala
+wysłać go fragmentami i znika wraz z zamknięciem.
+"""
+import os
+import tempfile
+
+_output_dir = None
+
+
+def configure_output_dir(path):
+    """Ustawia katalog plików wynikowych (domyślnie katalog tymczasowy systemu)"""
+    global _output_dir
+    _output_dir = path
+
+
+def save_pdf(doc, output=None, **save_options):
+    """Zapisuje dokument; zwraca ``output`` (BytesIO) albo plik wyniku ustawiony na końcu danych.
+
+    Bez ``output`` dokument zapisywany jest do pliku tymczasowego, więc w pamięci
+    nie powstaje kopia całego wyniku.
+    """
+    if output is not None:
+        doc.save(output, **save_options)
+        return output
+
+    fd, path = tempfile.mkstemp(suffix='.pdf', dir=_output_dir)
+    os.close(fd)
+    try:
+        # MuPDF tworzy plik pod ścieżką na nowo - uchwyt otwierany dopiero po zapisie
+        doc.save(path, **save_options)
+        result = open(path, 'rb')
+    finally:
+        os.remove(path)
+    result.seek(0, os.SEEK_END)
+    return result
@@ -0,0 +1,164 @@
+"""Cache wyrenderowanych stron (pixmap PyMuPDF) współdzielony przez podgląd i odczyt kodów.
+
+Klucz to hash dokumentu, numer strony, skala, wycinek i przestrzeń barw.
+Całe strony w skali nie większej niż kanoniczna (``canonical_zoom``, domyślnie
+rozdzielczość podglądu) są wyprowadzane z jednego renderowania strony w RGB
+w skali kanonicznej - pomniejszeniem i/lub konwersją do skali szarości. Dzięki
+temu przebieg zgrubny skanowania kodów (szarość, ``coarse_dpi``) i domyślny
+podgląd (``/api/pdf/render``, RGB) kosztują jedno renderowanie strony.
+Wycinki i skale większe od kanonicznej mają własne wpisy; żądanie skali
+szarości może zostać obsłużone konwersją zapisanej pixmapy RGB.
+Zapisane pixmapy są traktowane jako niemodyfikowalne - wiele wątków może
+czytać tę samą instancję.
+
+Cache działa w procesie serwera; procesy robocze skanujące duże dokumenty
+renderują strony bez niego.
+"""
+import threading
+from collections import OrderedDict
+
+from lazy_imports import lazy_import
+
+fitz = lazy_import('fitz', 'pdf')
+
+_cache = None
+
+
+def configure_pixmap_cache(cache):
+    """Ustawia cache używany przez ``render_page`` w bieżącym procesie"""
+    global _cache
+    _cache = cache
+
+
+def get_pixmap_cache():
+    """Zwraca cache procesu lub ``None`` (np. w procesach roboczych)"""
+    return _cache
+
+
+def _clip_key(clip):
+    return None if clip is None else tuple(round(value, 2) for value in clip)
+
+
+class PixmapCache:
+    """LRU pixmap ograniczone łącznym rozmiarem próbek i liczbą wpisów"""
+
+    def __init__(self, max_bytes=128 * 1024 * 1024, max_entries=256, enabled=True, canonical_zoom=1.0):
+        self.enabled = enabled
+        self.canonical_zoom = canonical_zoom or 0
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'convertedHits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+
+    @staticmethod
+    def key(doc_hash, page_index, zoom, clip=None, gray=False):
+        return doc_hash, page_index, round(zoom, 4), _clip_key(clip), 'gray' if gray else 'rgb'
+
+    def get(self, key):
+        """Zwraca zapisaną pixmapę lub ``None``"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            pix = self._entries.get(key)
+            if pix is not None:
+                self._entries.move_to_end(key)
+                self._stats['hits'] += 1
+            return pix
+
+    def put(self, key, pix):
+        if not self.enabled or len(pix.samples_mv) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= len(previous.samples_mv)
+            self._entries[key] = pix
+            self._bytes += len(pix.samples_mv)
+            self._stats['stores'] += 1
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted.samples_mv)
+                self._stats['evictions'] += 1
+
+    def render(self, page, doc_hash, zoom, clip=None, gray=False):
+        """Zwraca ``(pixmapa, z_cache)`` - renderuje stronę tylko przy braku wpisu"""
+        key = self.key(doc_hash, page.number, zoom, clip, gray)
+        pix = self.get(key)
+        if pix is not None:
+            return pix, True
+        if not self.enabled:
+            return _render(page, zoom, clip, gray), False
+        if clip is None and round(zoom, 4) <= round(self.canonical_zoom, 4):
+            if not gray and round(zoom, 4) == round(self.canonical_zoom, 4):
+                return self._render_and_store(key, page, zoom, None, False), False
+            canonical, cached = self.render(page, doc_hash, self.canonical_zoom)
+            pix = _derive(canonical, page, zoom, gray)
+            self.put(key, pix)
+            if cached:
+                with self._lock:
+                    self._stats['convertedHits'] += 1
+            return pix, cached
+        if gray:
+            color = self.get(self.key(doc_hash, page.number, zoom, clip, gray=False))
+            if color is not None:
+                pix = fitz.Pixmap(fitz.csGRAY, color)
+                self.put(key, pix)
+                with self._lock:
+                    self._stats['convertedHits'] += 1
+                return pix, True
+        return self._render_and_store(key, page, zoom, clip, gray), False
+
+    def _render_and_store(self, key, page, zoom, clip, gray):
+        with self._lock:
+            self._stats['misses'] += 1
+        pix = _render(page, zoom, clip, gray)
+        self.put(key, pix)
+        return pix
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Zwraca liczniki trafień, chybień i eksmisji"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'enabled': self.enabled,
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'maxBytes': self.max_bytes,
+                'maxEntries': self.max_entries,
+                'canonicalZoom': self.canonical_zoom,
+            })
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hitRatio'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+        return snapshot
+
+
+def _render(page, zoom, clip=None, gray=False):
+    return page.get_pixmap(
+        matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=fitz.csGRAY if gray else fitz.csRGB, alpha=False
+    )
+
+
+def _derive(canonical, page, zoom, gray):
+    """Pomniejsza pixmapę całej strony do skali ``zoom`` (wymiary jak przy renderowaniu) i/lub zamienia na szarość"""
+    pix = canonical
+    size = (page.rect * fitz.Matrix(zoom, zoom)).irect
+    if (size.width, size.height) != (pix.width, pix.height):
+        # Bez jawnego wycinka PyMuPDF 1.23 zgłasza "bad clip parameter"
+        pix = fitz.Pixmap(pix, size.width, size.height, pix.irect)
+    if gray:
+        pix = fitz.Pixmap(fitz.csGRAY, pix)
+    return pix
+
+
+def render_page(page, zoom, clip=None, gray=False, doc_hash=None):
+    """Renderuje stronę przez cache procesu (gdy skonfigurowany i znany jest hash dokumentu)"""
+    if _cache is not None and doc_hash is not None:
+        return _cache.render(page, doc_hash, zoom, clip, gray)[0]
+    return _render(page, zoom, clip, gray)
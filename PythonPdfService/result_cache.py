@@ -0,0 +1,183 @@
+"""Cache wyników adresowany treścią (SHA-256 pliku + parametry operacji).
+
+Warstwa w pamięci działa jako LRU ograniczone rozmiarem, opcjonalna warstwa
+dyskowa przechowuje wpisy w katalogu i usuwa najdawniej używane po
+przekroczeniu limitu bajtów.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+
+def cache_key(content_hash, operation, params=None):
+    """Buduje klucz z hasha treści, nazwy operacji i jej parametrów"""
+    payload = json.dumps(params or {}, sort_keys=True, separators=(',', ':'), default=str)
+    digest = hashlib.sha256(f'{operation}|{content_hash}|{payload}'.encode('utf-8')).hexdigest()
+    return digest
+
+
+class ResultCache:
+    """Dwupoziomowy cache bajtów: LRU w pamięci + opcjonalny katalog na dysku"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, max_entries=1024,
+                 disk_dir=None, disk_max_bytes=1024 * 1024 * 1024, enabled=True):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = {
+            'hits': 0,
+            'memoryHits': 0,
+            'diskHits': 0,
+            'misses': 0,
+            'stores': 0,
+            'memoryEvictions': 0,
+            'diskEvictions': 0,
+        }
+        if self.enabled and self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            self._disk_bytes = sum(size for _, size, _ in self._disk_entries())
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f'{key}.bin')
+
+    def _disk_entries(self):
+        entries = []
+        for name in os.listdir(self.disk_dir):
+            if not name.endswith('.bin'):
+                continue
+            path = os.path.join(self.disk_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((path, stat.st_size, stat.st_mtime))
+        return entries
+
+    def get(self, key):
+        """Zwraca zapisane bajty lub ``None``"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            value = self._memory.get(key)
+            if value is not None:
+                self._memory.move_to_end(key)
+                self._stats['hits'] += 1
+                self._stats['memoryHits'] += 1
+                return value
+
+        if self.disk_dir:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    value = f.read()
+                os.utime(path)  # Odświeżenie czasu użycia dla eksmisji LRU
+            except FileNotFoundError:
+                value = None
+            if value is not None:
+                with self._lock:
+                    self._stats['hits'] += 1
+                    self._stats['diskHits'] += 1
+                    self._store_memory(key, value)
+                return value
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key, value):
+        """Zapisuje bajty w obu warstwach"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._stats['stores'] += 1
+            self._store_memory(key, value)
+        if self.disk_dir:
+            self._store_disk(key, value)
+
+    def _store_memory(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = value
+        self._memory_bytes += len(value)
+        while self._memory and (self._memory_bytes > self.max_bytes or len(self._memory) > self.max_entries):
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self._stats['memoryEvictions'] += 1
+
+    def _store_disk(self, key, value):
+        if len(value) > self.disk_max_bytes:
+            return
+        path = self._disk_path(key)
+        try:
+            os.utime(path)
+            return
+        except FileNotFoundError:
+            pass  # Brak wpisu (lub usunięty przez inny proces) - zapis poniżej
+        fd, temp_path = tempfile.mkstemp(dir=self.disk_dir, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(value)
+            os.replace(temp_path, path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+        with self._lock:
+            self._disk_bytes += len(value)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+
+    def _evict_disk(self):
+        # Usuń najdawniej używane wpisy aż do zejścia poniżej limitu
+        entries = sorted(self._disk_entries(), key=lambda entry: entry[2])
+        self._disk_bytes = sum(size for _, size, _ in entries)
+        for path, size, _ in entries:
+            if self._disk_bytes <= self.disk_max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            self._disk_bytes -= size
+            self._stats['diskEvictions'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            if self.disk_dir:
+                for path, _, _ in self._disk_entries():
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass  # Usunięty w międzyczasie przez inny proces współdzielący katalog
+                self._disk_bytes = 0
+
+    def stats(self):
+        """Zwraca liczniki trafień, chybień i eksmisji"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot.update({
+                'enabled': self.enabled,
+                'memoryEntries': len(self._memory),
+                'memoryBytes': self._memory_bytes,
+                'memoryMaxBytes': self.max_bytes,
+                'diskEnabled': bool(self.disk_dir),
+                'diskBytes': self._disk_bytes,
+                'diskMaxBytes': self.disk_max_bytes if self.disk_dir else 0,
+            })
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hitRatio'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+        return snapshot
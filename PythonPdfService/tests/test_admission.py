@@ -0,0 +1,86 @@
+"""Kontrola dopuszczenia: limity grup, kolejka, budżet pamięci i odpowiedź 429"""
+import threading
+
+import pytest
+
+from admission import (
+    REJECT_OVERLOADED, REJECT_QUEUE_FULL, REJECT_TIMEOUT, AdmissionController, AdmissionRejected, WeightedLimiter
+)
+from conftest import build_pdf, upload
+
+
+def test_limiter_rejects_when_queue_is_full():
+    limiter = WeightedLimiter('merge', capacity=2, max_queue=0)
+    assert limiter.acquire(5, timeout=1, retry_after=3) == 2  # Waga przycięta do pojemności
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.acquire(1, timeout=1, retry_after=3)
+    assert (rejected.value.reason, rejected.value.retry_after) == (REJECT_QUEUE_FULL, 3)
+
+
+def test_limiter_queue_times_out_and_admits_after_release():
+    limiter = WeightedLimiter('codes', capacity=1, max_queue=1)
+    limiter.acquire(1, timeout=1, retry_after=1)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        limiter.acquire(1, timeout=0.05, retry_after=1)
+    assert rejected.value.reason == REJECT_TIMEOUT
+
+    admitted = []
+    waiter = threading.Thread(target=lambda: admitted.append(limiter.acquire(1, timeout=5, retry_after=1)))
+    waiter.start()
+    limiter.release(1)
+    waiter.join(5)
+    assert admitted == [1]
+    assert limiter.stats() == {'capacity': 1, 'inUse': 1, 'queued': 0, 'maxQueue': 1}
+
+
+def test_controller_limits_pending_requests_and_memory():
+    controller = AdmissionController({'merge': 4}, max_queue=0, memory_budget=100, max_pending=2, retry_after=7)
+    ticket = controller.admit('merge', memory=80)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.admit('merge', memory=40)
+    assert rejected.value.group == 'memory' and rejected.value.reason == REJECT_QUEUE_FULL
+
+    other = controller.admit('merge', memory=20)
+    with pytest.raises(AdmissionRejected) as rejected:
+        controller.admit('merge')
+    assert rejected.value.reason == REJECT_OVERLOADED
+
+    ticket.release()
+    ticket.release()  # Idempotentne
+    other.release()
+    stats = controller.stats()
+    assert (stats['pending'], stats['admitted'], stats['rejected']) == (0, 2, 2)
+    assert stats['groups']['merge']['inUse'] == 0 and stats['memory']['inUse'] == 0
+
+
+@pytest.fixture
+def tight_admission(monkeypatch):
+    """Jedna jednostka na grupę i brak kolejki - drugie kosztowne żądanie dostaje 429"""
+    import app as app_module
+
+    controller = AdmissionController(
+        {group: 1 for group in app_module.ADMISSION_LIMITS}, max_queue=0, retry_after=9
+    )
+    monkeypatch.setattr(app_module, 'admission', controller)
+    return controller
+
+
+def test_overloaded_endpoint_returns_429(client, tight_admission):
+    ticket = tight_admission.admit('merge')
+    files = upload((build_pdf(), 'a.pdf'))
+
+    response = client.post('/api/pdf/merge-pdfs', data={'files': files}, content_type='multipart/form-data')
+
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '9'
+    assert response.get_json()['reason'] == REJECT_QUEUE_FULL
+    assert client.get('/health').status_code == 200
+
+    ticket.release()
+    files = upload((build_pdf(), 'a.pdf'))
+    response = client.post('/api/pdf/merge-pdfs', data={'files': files}, content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert tight_admission.stats()['pending'] == 0
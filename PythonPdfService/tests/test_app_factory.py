@@ -0,0 +1,27 @@
+"""Fabryka aplikacji i endpointy stanu"""
+import importlib
+
+
+def test_import_does_not_create_app():
+    module = importlib.import_module('app')
+
+    assert not hasattr(module, 'app')
+
+
+def test_create_app_applies_config(app):
+    assert app.config['TESTING'] is True
+    assert 'api' in app.blueprints
+
+
+def test_health(client):
+    response = client.get('/health')
+
+    assert response.status_code == 200
+    assert response.get_json()['status'] == 'healthy'
+
+
+def test_supported_formats(client):
+    response = client.get('/api/pdf/supported-formats')
+
+    assert response.status_code == 200
+    assert '.pdf' in response.get_json()['supportedPdfFormats']
@@ -0,0 +1,93 @@
+"""Wsadowy odczyt kodów (/api/pdf/read-codes/batch): archiwa, błędy plików i limity"""
+import io
+import json
+import zipfile
+
+import pytest
+
+from conftest import build_image, build_pdf, upload
+
+BATCH = '/api/pdf/read-codes/batch'
+
+
+def post_batch(client, files, query=''):
+    return client.post(f'{BATCH}{query}', data={'files': upload(*files)}, content_type='multipart/form-data')
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+def zip_archive(*members):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for data, name in members:
+            archive.writestr(name, data)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def scanned(monkeypatch):
+    """Zastępuje dekodery zapisem przekazanych plików - testuje tylko obsługę wsadu"""
+    import app as app_module
+
+    calls = []
+
+    def read_codes(uploaded, is_pdf, kinds, options):
+        calls.append((uploaded.filename, is_pdf, uploaded.read_bytes()[:4]))
+        return [], None, 'MISS'
+
+    monkeypatch.setattr(app_module, 'read_codes', read_codes)
+    return calls
+
+
+def test_batch_validation(client):
+    assert client.post(BATCH, data={}).status_code == 400
+    assert post_batch(client, [(build_pdf(), 'a.pdf')], '?kinds=ean').status_code == 400
+
+
+def test_batch_expands_archives_and_reports_bad_files(client, scanned):
+    archive = zip_archive((build_pdf(), 'docs/b.pdf'), (b'readme', 'readme.txt'), (build_image(), 'c.png'))
+    files = [(build_pdf(), 'a.pdf'), (b'text', 'notes.txt'), (archive, 'set.zip'), (b'not a zip', 'broken.zip')]
+
+    lines = ndjson(post_batch(client, files))
+
+    *entries, summary = lines
+    by_name = {entry['filename']: entry for entry in entries}
+    assert set(by_name) == {'a.pdf', 'notes.txt', 'docs/b.pdf', 'c.png', 'broken.zip'}
+    assert by_name['notes.txt']['error'] == 'Nieobsługiwany format pliku'
+    assert by_name['broken.zip']['error'].startswith('Nieprawidłowe archiwum')
+    assert by_name['a.pdf']['count'] == 0
+    assert sorted(entry['index'] for entry in entries) == [0, 1, 2, 3, 4]
+    assert sorted(scanned) == [('a.pdf', True, b'%PDF'), ('c.png', False, b'\x89PNG'), ('docs/b.pdf', True, b'%PDF')]
+    assert summary['done'] and (summary['files'], summary['errors']) == (3, 2)
+
+
+def test_batch_file_limit_ends_stream(client, scanned, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'BATCH_MAX_FILES', 1)
+
+    *lines, summary = ndjson(post_batch(client, [(build_pdf(), 'a.pdf'), (build_pdf(), 'b.pdf')]))
+
+    # Zlecony plik jest dokończony także po błędzie krytycznym (kolejność wierszy zależy od puli)
+    assert [line['filename'] for line in lines if 'filename' in line] == ['a.pdf']
+    assert [line['error'] for line in lines if line.get('fatal')] == [
+        'Przekroczono limit żądania wsadowego (1 plików)'
+    ]
+    assert (summary['files'], summary['errors']) == (1, 1)
+
+
+def test_batch_decodes_codes(client):
+    try:
+        import pyzbar.pyzbar  # noqa: F401 - wymaga biblioteki systemowej zbar
+    except ImportError as e:
+        pytest.skip(f'pyzbar niedostępny: {e}')
+    qrcode = pytest.importorskip('qrcode')
+    image = io.BytesIO()
+    qrcode.make('batch-123').save(image)
+
+    *entries, summary = ndjson(post_batch(client, [(image.getvalue(), 'code.png')], '?kinds=barcode'))
+
+    assert [code['data'] for code in entries[0]['codes']] == ['batch-123']
+    assert summary['codes'] == 1
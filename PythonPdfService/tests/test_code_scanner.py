@@ -0,0 +1,111 @@
+"""Skanowanie kodów: zakresy stron, limity skanu i podział na pule procesów"""
+import os
+import time
+
+import pytest
+
+import code_scanner
+from code_scanner import CodeScanner, PageSpecError, merge_regions, parse_pages, scan_pages
+from conftest import build_pdf
+from ingest import UploadedFile
+
+
+def test_qr_scans_use_bounded_worker_pool():
+    scanner = CodeScanner(workers=4, qr_workers=1)
+
+    assert scanner._pool_workers(['barcode']) == 4
+    assert scanner._pool_workers(['barcode', 'qr']) == 1
+    assert scanner.stats() == {'workers': 4, 'qrWorkers': 1, 'startedPools': []}
+
+
+def test_qr_workers_never_exceed_scan_workers():
+    assert CodeScanner(workers=2, qr_workers=8).qr_workers == 2
+    assert CodeScanner(workers=3).qr_workers == 3
+
+
+def test_qr_detector_stats_report_instance_bound(client):
+    import app as app_module
+
+    stats = client.get('/api/pdf/qr-detector-stats').get_json()
+
+    assert stats['maxInstances'] == app_module.QREADER_POOL_SIZE + app_module.code_scanner.qr_workers
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('all', [0, 1, 2, 3, 4]),
+    ('', [0, 1, 2, 3, 4]),
+    ('2', [1]),
+    ('1,3,4-', [0, 2, 3, 4]),
+    ('-2,2-3', [0, 1, 2]),
+    ('4-9', [3, 4]),
+])
+def test_parse_pages(spec, expected):
+    assert parse_pages(spec, 5) == expected
+
+
+@pytest.mark.parametrize('spec', ['0', '3-1', 'x', '1-a'])
+def test_parse_pages_rejects_invalid(spec):
+    with pytest.raises(PageSpecError):
+        parse_pages(spec, 5)
+
+
+def test_merge_regions_joins_chained_boxes():
+    # Środkowy prostokąt łączy dwa rozłączne - wynik to jeden obszar
+    regions = merge_regions([(0, 0, 10, 10), (20, 0, 30, 10), (8, 2, 22, 8), (50, 50, 60, 60)])
+
+    assert [tuple(rect) for rect in regions] == [(0, 0, 30, 10), (50, 50, 60, 60)]
+
+
+def test_merge_regions_leaves_no_intersections():
+    boxes = [(x, 0, x + 12, 10) for x in range(0, 100, 20)] + [(10, 0, 90, 5)]
+    regions = merge_regions(boxes)
+
+    assert [tuple(rect) for rect in regions] == [(0, 0, 92, 10)]
+
+
+@pytest.fixture
+def document():
+    data = build_pdf(6)
+    return UploadedFile('doc.pdf', data=data, size=len(data))
+
+
+def test_scan_stops_at_deadline(document):
+    codes, scanned, timed_out, _ = scan_pages(document.source, range(6), [], deadline=time.time() - 1)
+
+    assert (codes, scanned, timed_out) == ([], [], True)
+
+
+def test_scan_stops_at_first_code(document, monkeypatch):
+    def scan_page(page, kinds, options, doc_hash=None):
+        codes = [{'type': 'barcode', 'data': 'x', 'page': page.number + 1}] if page.number == 1 else []
+        return codes, {'page': page.number + 1, 'pixels': 0, 'regions': 1, 'timings': {}}
+
+    monkeypatch.setattr(code_scanner, 'scan_page', scan_page)
+    result = CodeScanner(workers=1).scan_document(document, ['barcode'], stop_at_first=True)
+
+    assert result['scannedPages'] == [1, 2]
+    assert result['stoppedEarly'] and result['codes'][0]['page'] == 2
+
+
+def test_parallel_scan_passes_document_path(document, monkeypatch, tmp_path):
+    scanner = CodeScanner(workers=2, chunk_pages=2, parallel_min_pages=4, spill_dir=str(tmp_path))
+    executor = scanner._get_executor(2)
+    sources = []
+    submit = executor.submit
+
+    def record_submit(func, source, *args):
+        sources.append(source)
+        return submit(func, source, *args)
+
+    monkeypatch.setattr(executor, 'submit', record_submit)
+    try:
+        # Bez rodzajów kodów - tylko renderowanie (dekodery nie są potrzebne)
+        result = scanner.scan_document(document, [], pages='1-5')
+    finally:
+        scanner.shutdown()
+
+    assert result['scannedPages'] == [1, 2, 3, 4, 5] and not result['timedOut']
+    assert len(result['render']['pages']) == 5
+    assert len(sources) == 3 and len(set(sources)) == 1
+    assert isinstance(sources[0], str) and os.path.dirname(sources[0]) == str(tmp_path)
+    assert not os.listdir(tmp_path)  # Plik tymczasowy usunięty po skanowaniu
@@ -0,0 +1,98 @@
+"""Ekstrakcja tekstu: odpowiedź buforowana, strumień oraz formaty strukturalne"""
+import json
+
+import pytest
+
+from conftest import build_pdf, upload
+
+
+def post_pdf(client, path, data=None, name='doc.pdf'):
+    return client.post(path, data={'file': upload((data or build_pdf(3, 'Tekst'), name))[0]})
+
+
+def ndjson(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines() if line]
+
+
+def test_extract_text(client):
+    response = post_pdf(client, '/api/pdf/extract-text')
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    text = response.get_data(as_text=True)
+    assert 'Strona 1:\nTekst 1' in text
+    assert 'Strona 3:\nTekst 3' in text
+    assert response.headers['X-OCR-Pages'] == '0'
+
+
+def test_extract_text_stream(client):
+    response = post_pdf(client, '/api/pdf/extract-text/stream')
+
+    assert response.status_code == 200
+    assert response.headers['X-Page-Count'] == '3'
+    assert response.get_data(as_text=True).count('Strona ') == 3
+
+
+def test_extract_text_stream_ndjson(client):
+    response = post_pdf(client, '/api/pdf/extract-text/stream?format=ndjson')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/x-ndjson'
+    *pages, summary = ndjson(response)
+    assert [(page['page'], page['text'].strip(), page['source']) for page in pages] == [
+        (1, 'Tekst 1', 'text'), (2, 'Tekst 2', 'text'), (3, 'Tekst 3', 'text')
+    ]
+    assert summary['done'] and summary['pages'] == 3
+
+
+@pytest.mark.parametrize('path', ['/api/pdf/extract-text', '/api/pdf/extract-text/stream'])
+def test_extract_text_validation(client, path):
+    assert client.post(path, data={}).status_code == 400
+    assert post_pdf(client, path, name='doc.txt').status_code == 400
+    assert post_pdf(client, f'{path}?format=xml').status_code == 400
+    assert post_pdf(client, f'{path}?ocr=sometimes').status_code == 400
+
+
+def test_extract_text_rejects_ndjson_without_stream(client):
+    assert post_pdf(client, '/api/pdf/extract-text?format=ndjson').status_code == 400
+
+
+def test_extract_text_stream_invalid_pdf(client):
+    response = post_pdf(client, '/api/pdf/extract-text/stream', data=b'not a pdf')
+
+    assert response.status_code == 500
+
+
+def test_extract_text_words(client):
+    response = post_pdf(client, '/api/pdf/extract-text?format=words')
+
+    assert response.status_code == 200
+    assert response.mimetype == 'application/json'
+    result = response.get_json()
+    assert result['format'] == 'words'
+    assert [page['page'] for page in result['pages']] == [1, 2, 3]
+    words = result['pages'][1]['words']
+    assert words['text'] == ['Tekst', '2']
+    assert words['x0'] == [72.0, 104.68]
+    assert len(words['y1']) == len(words['block']) == len(words['line']) == 2
+
+
+def test_extract_text_blocks_and_json(client):
+    blocks = post_pdf(client, '/api/pdf/extract-text?format=blocks').get_json()['pages'][0]['blocks']
+    assert [text.strip() for text in blocks['text']] == ['Tekst 1']
+    assert blocks['type'] == [0]
+
+    page = post_pdf(client, '/api/pdf/extract-text?format=json').get_json()['pages'][0]
+    assert (page['width'], page['height']) == (595, 842)
+    assert page['fonts'] and page['lines']['block'] == [0]
+    assert ''.join(page['spans']['text']) == 'Tekst 1'
+
+
+@pytest.mark.parametrize('output', ['blocks', 'words', 'json'])
+def test_extract_text_stream_structures(client, output):
+    buffered = post_pdf(client, f'/api/pdf/extract-text?format={output}').get_json()['pages']
+    response = post_pdf(client, f'/api/pdf/extract-text/stream?format={output}')
+
+    assert response.status_code == 200
+    *pages, summary = ndjson(response)
+    assert pages == buffered
+    assert summary['done'] and summary['pages'] == 3
@@ -0,0 +1,78 @@
+"""Konwersja obrazów do PDF (images-to-pdf, merge-all)"""
+import fitz
+import pytest
+
+from conftest import build_image, build_pdf, page_texts, upload
+
+
+def embedded_images(data):
+    """(szerokość, wysokość, filtr, czy maska alfa) obrazów kolejnych stron"""
+    with fitz.open(stream=data, filetype='pdf') as doc:
+        return [
+            (width, height, image_filter, bool(smask))
+            for page in doc
+            for _, smask, width, height, _, _, _, _, image_filter, _ in page.get_images(full=True)
+        ]
+
+
+def convert(client, query='', *images):
+    files = upload(*[(data, f'image{index}.{fmt}') for index, (data, fmt) in enumerate(images)])
+    return client.post(f'/api/pdf/images-to-pdf{query}', data={'files': files})
+
+
+def test_images_embedded_losslessly_by_default(client):
+    response = convert(client, '', (build_image(2400, 1800), 'png'), (build_image(640, 480, fmt='jpg'), 'jpg'))
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.headers['X-Images-Resized'] == '0'
+    assert embedded_images(response.data) == [(2400, 1800, 'FlateDecode', False), (640, 480, 'DCTDecode', False)]
+
+
+def test_transparency_is_preserved(client):
+    response = convert(client, '', (build_image(200, 100, alpha=True), 'png'))
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert embedded_images(response.data) == [(200, 100, 'FlateDecode', True)]
+
+
+def test_opt_in_downsampling_keeps_png_lossless(client):
+    response = convert(client, '?dpi=72', (build_image(2400, 1800, alpha=True), 'png'))
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.headers['X-Images-Resized'] == '1'
+    (width, height, image_filter, smask), = embedded_images(response.data)
+    assert width < 2400 and height < 1800
+    assert image_filter == 'FlateDecode' and smask
+
+
+def test_explicit_jpeg_encoding(client):
+    response = convert(client, '?imageEncoding=jpeg', (build_image(320, 240, alpha=True), 'png'))
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert embedded_images(response.data) == [(320, 240, 'DCTDecode', False)]
+
+
+def test_bmp_is_converted_to_png(client):
+    response = convert(client, '?outputFormat=ORIGINAL', (build_image(100, 50, fmt='bmp'), 'bmp'))
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert embedded_images(response.data) == [(100, 50, 'FlateDecode', False)]
+
+
+@pytest.mark.parametrize('query', ['?imageEncoding=webp', '?dpi=5', '?jpegQuality=101'])
+def test_invalid_image_options(client, query):
+    assert convert(client, query, (build_image(), 'png')).status_code == 400
+
+
+def test_invalid_image_is_rejected(client):
+    response = client.post('/api/pdf/images-to-pdf', data={'files': upload((b'not an image', 'broken.png'))})
+
+    assert response.status_code == 400
+
+
+def test_merge_all(client):
+    files = upload((build_pdf(2, 'A'), 'a.pdf'), (build_image(), 'photo.png'))
+    response = client.post('/api/pdf/merge-all', data={'files': files})
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert page_texts(response.data) == ['A 1', 'A 2', '']
@@ -0,0 +1,73 @@
+"""Przyjmowanie części multipart (SpooledUpload) i limity rozmiaru plików"""
+import os
+
+import pytest
+from werkzeug.exceptions import RequestEntityTooLarge
+
+from conftest import build_pdf, page_texts, upload
+from ingest import SpooledUpload
+
+
+def spooled(data, spill_threshold, tmp_path, max_size=None):
+    part = SpooledUpload('a.pdf', spill_threshold, str(tmp_path), max_size)
+    for offset in range(0, len(data), 1000):
+        part.write(data[offset:offset + 1000])
+    return part
+
+
+def test_in_memory_part_is_adopted_as_bytes(tmp_path):
+    data = os.urandom(5000)
+    part = spooled(data, 1 << 20, tmp_path)
+
+    uploaded = part.adopt('a.pdf')
+    part.close()
+
+    assert uploaded.in_memory
+    assert type(uploaded.data) is bytes and uploaded.data == data
+    assert uploaded.size == 5000
+    assert not os.listdir(tmp_path)
+
+
+def test_spilled_part_is_adopted_without_copy(tmp_path):
+    data = os.urandom(5000)
+    part = spooled(data, 2000, tmp_path)
+
+    uploaded = part.adopt('a.pdf')
+    part.close()
+
+    assert not uploaded.in_memory
+    assert os.path.dirname(uploaded.path) == str(tmp_path)
+    assert uploaded.read_bytes() == data
+    uploaded.close()
+    assert not os.listdir(tmp_path)
+
+
+def test_unadopted_spill_file_is_removed(tmp_path):
+    spooled(os.urandom(5000), 2000, tmp_path).close()
+
+    assert not os.listdir(tmp_path)
+
+
+def test_part_over_limit_is_rejected(tmp_path):
+    with pytest.raises(RequestEntityTooLarge):
+        spooled(os.urandom(5000), 1 << 20, tmp_path, max_size=4000)
+
+
+@pytest.mark.parametrize('spill_threshold', [1 << 20, 100])
+def test_uploaded_parts_reach_operation(app, client, monkeypatch, spill_threshold):
+    monkeypatch.setitem(app.config, 'INGEST_SPILL_THRESHOLD', spill_threshold)
+    files = upload((build_pdf(1, 'A'), 'a.pdf'), (build_pdf(1, 'B'), 'b.pdf'))
+
+    response = client.post('/api/pdf/merge-pdfs', data={'files': files}, content_type='multipart/form-data')
+
+    assert response.status_code == 200
+    assert page_texts(response.data) == ['A 1', 'B 1']
+
+
+def test_part_over_limit_returns_413(app, client, monkeypatch):
+    monkeypatch.setitem(app.config, 'UPLOAD_MAX_PART_SIZE', 100)
+    files = upload((build_pdf(), 'a.pdf'))
+
+    response = client.post('/api/pdf/merge-pdfs', data={'files': files}, content_type='multipart/form-data')
+
+    assert response.status_code == 413
@@ -0,0 +1,126 @@
+"""Zadania asynchroniczne: cykl życia przez API i zachowanie JobManager"""
+import threading
+import time
+
+from conftest import build_pdf, page_texts, upload
+from jobs import JOB_CANCELLED, JOB_QUEUED, JOB_SUCCEEDED, JobManager
+
+
+def wait_finished(client, job_id):
+    for _ in range(50):
+        body = client.get(f'/api/jobs/{job_id}?wait=1').get_json()
+        if body['status'] not in ('queued', 'running'):
+            return body
+    raise AssertionError(f'Zadanie {job_id} nie zakończyło się')
+
+
+def test_job_lifecycle(client):
+    files = upload((build_pdf(1, 'A'), 'a.pdf'), (build_pdf(1, 'B'), 'b.pdf'))
+    response = client.post('/api/jobs/merge-pdfs', data={'files': files})
+
+    assert response.status_code == 202, response.get_data(as_text=True)
+    job_id = response.get_json()['jobId']
+    assert response.headers['Location'] == f'/api/jobs/{job_id}'
+    assert wait_finished(client, job_id)['status'] == JOB_SUCCEEDED
+
+    result = client.get(f'/api/jobs/{job_id}/result')
+    assert result.status_code == 200
+    assert page_texts(result.data) == ['A 1', 'B 1']
+
+    assert client.delete(f'/api/jobs/{job_id}').get_json()['deleted'] is True
+    assert client.get(f'/api/jobs/{job_id}').status_code == 404
+    assert client.get(f'/api/jobs/{job_id}/result').status_code == 404
+
+
+def test_job_failure_is_reported(client):
+    response = client.post('/api/jobs/extract-text', data={'file': upload((b'not a pdf', 'a.pdf'))[0]})
+
+    body = wait_finished(client, response.get_json()['jobId'])
+    assert body['status'] == 'failed'
+    assert client.get(f"/api/jobs/{body['jobId']}/result").status_code == 500
+
+
+def test_job_unknown_operation(client):
+    assert client.post('/api/jobs/compress-everything').status_code == 404
+
+
+class Result:
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def blocking_job(manager, started, release):
+    def runner(job):
+        started.set()
+        release.wait(5)
+        return Result()
+    return manager.submit('slow', runner)
+
+
+def test_cancel_queued_job_never_runs_and_releases_inputs():
+    manager = JobManager(workers=1, max_queued=4)
+    started, release = threading.Event(), threading.Event()
+    blocking_job(manager, started, release)
+    assert started.wait(5)
+
+    ran, released = [], []
+    queued = manager.submit('queued', lambda job: ran.append(job), cleanup=lambda: released.append(True))
+    assert queued.status == JOB_QUEUED
+    assert manager.cancel(queued.id)
+    release.set()
+
+    manager._queue.join()
+    assert queued.status == JOB_CANCELLED
+    assert ran == [] and released == [True]
+
+
+def test_running_job_cannot_be_cancelled():
+    manager = JobManager(workers=1)
+    started, release = threading.Event(), threading.Event()
+    job = blocking_job(manager, started, release)
+    assert started.wait(5)
+
+    assert not manager.cancel(job.id)
+    release.set()
+    manager._queue.join()
+    assert job.status == JOB_SUCCEEDED
+
+
+def test_remove_and_expiry_close_results():
+    manager = JobManager(workers=1)
+    results = []
+    jobs = []
+    for _ in range(2):
+        jobs.append(manager.submit('op', lambda job: results.append(Result()) or results[-1]))
+    manager._queue.join()
+
+    assert manager.remove(jobs[0].id)
+    assert results[0].closed and not results[1].closed
+
+    manager.result_ttl = 0
+    time.sleep(0.01)
+    assert manager.get(jobs[1].id) is None
+    assert results[1].closed
+
+
+def test_job_removed_during_download(client):
+    import app as app_module
+
+    files = upload((build_pdf(3, 'A'), 'a.pdf'), (build_pdf(1, 'B'), 'b.pdf'))
+    job_id = client.post('/api/jobs/merge-pdfs', data={'files': files}).get_json()['jobId']
+    assert wait_finished(client, job_id)['status'] == JOB_SUCCEEDED
+    result = app_module.job_manager.get(job_id).result
+
+    download = client.get(f'/api/jobs/{job_id}/result', buffered=False)
+    assert client.delete(f'/api/jobs/{job_id}').get_json()['deleted'] is True
+    assert not result.payload.closed  # Pobranie w toku - bufor zamknie jego koniec
+
+    data = b''.join(download.iter_encoded())
+    assert len(data) == int(download.headers['Content-Length'])
+    assert page_texts(data) == ['A 1', 'A 2', 'A 3', 'B 1']
+    download.close()
+    assert result.payload.closed
+    assert client.get(f'/api/jobs/{job_id}/result').status_code == 404
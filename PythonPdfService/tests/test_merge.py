@@ -0,0 +1,106 @@
+"""Łączenie PDF przez endpointy (oba silniki)"""
+import os
+
+import fitz
+import pytest
+
+from conftest import build_pdf, page_texts, upload
+
+ENGINES = ('pymupdf', 'pypdf2')
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_merge_pdfs(client, engine):
+    files = upload((build_pdf(2, 'A'), 'a.pdf'), (build_pdf(1, 'B'), 'b.pdf'))
+    response = client.post(f'/api/pdf/merge-pdfs?engine={engine}', data={'files': files})
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert response.mimetype == 'application/pdf'
+    assert page_texts(response.data) == ['A 1', 'A 2', 'B 1']
+
+
+@pytest.mark.parametrize('query', ['garbage=4&compression=2', 'linearize=true'])
+def test_merge_pdfs_save_options(client, query):
+    files = upload((build_pdf(1, 'A'), 'a.pdf'), (build_pdf(1, 'B'), 'b.pdf'))
+    response = client.post(f'/api/pdf/merge-pdfs?{query}', data={'files': files})
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert page_texts(response.data) == ['A 1', 'B 1']
+
+
+def test_pypdf2_large_output_spools_to_disk(client, monkeypatch):
+    import app as app_module
+
+    monkeypatch.setattr(app_module, 'OUTPUT_SPOOL_MAX_MEMORY', 1024)
+    files = upload((build_pdf(30, 'A'), 'a.pdf'), (build_pdf(30, 'B'), 'b.pdf'))
+    response = client.post('/api/pdf/merge-pdfs?engine=pypdf2', data={'files': files})
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert len(page_texts(response.data)) == 60
+
+
+def test_pymupdf_output_is_saved_to_file(client, monkeypatch, tmp_path):
+    import pdf_output
+
+    files = upload((build_pdf(2, 'A'), 'a.pdf'), (build_pdf(1, 'B'), 'b.pdf'))
+    saved = []
+    save = fitz.Document.save
+
+    def record_save(doc, target, *args, **kwargs):
+        saved.append(target)
+        return save(doc, target, *args, **kwargs)
+
+    def forbid_tobytes(doc, *args, **kwargs):
+        raise AssertionError('Wynik nie może być serializowany w pamięci')
+
+    monkeypatch.setattr(fitz.Document, 'save', record_save)
+    monkeypatch.setattr(fitz.Document, 'tobytes', forbid_tobytes)
+    monkeypatch.setattr(pdf_output, '_output_dir', str(tmp_path))
+    response = client.post('/api/pdf/merge-pdfs', data={'files': files})
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert page_texts(response.data) == ['A 1', 'A 2', 'B 1']
+    assert len(saved) == 1 and os.path.dirname(saved[0]) == str(tmp_path)
+    assert not os.listdir(tmp_path)  # Plik usunięty z katalogu zaraz po otwarciu
+
+
+def test_merge_pdfs_rejects_unknown_engine(client):
+    files = upload((build_pdf(1), 'a.pdf'), (build_pdf(1), 'b.pdf'))
+    response = client.post('/api/pdf/merge-pdfs?engine=qpdf', data={'files': files})
+
+    assert response.status_code == 400
+
+
+def page_rotations(data):
+    with fitz.open(stream=data, filetype='pdf') as doc:
+        return [page.rotation for page in doc]
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_merge_page_selection_and_order(client, engine):
+    files = upload((build_pdf(5, 'A'), 'a.pdf'), (build_pdf(3, 'B'), 'b.pdf'))
+    response = client.post(
+        f'/api/pdf/merge-pdfs?engine={engine}', data={'files': files, 'pages': 'files[1]:3-2,files[0]:4-,files[1]:1'}
+    )
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert page_texts(response.data) == ['B 3', 'B 2', 'A 4', 'A 5', 'B 1']
+
+
+@pytest.mark.parametrize('engine', ENGINES)
+def test_merge_rotation_is_relative_to_source_rotation(client, engine):
+    files = upload((build_pdf(2, 'A', rotation=90), 'rotated.pdf'), (build_pdf(1, 'B'), 'b.pdf'))
+    response = client.post(
+        f'/api/pdf/merge-pdfs?engine={engine}', data={'files': files, 'pages': 'files[0]:1@90,files[0]:2,files[1]@270'}
+    )
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert page_rotations(response.data) == [180, 90, 270]
+
+
+@pytest.mark.parametrize('pages', ['files[2]', 'files[0]:9', 'files[0]@45', 'files[0]:0'])
+def test_merge_invalid_selection(client, pages):
+    files = upload((build_pdf(2), 'a.pdf'), (build_pdf(1), 'b.pdf'))
+    response = client.post('/api/pdf/merge-pdfs', data={'files': files, 'pages': pages})
+
+    assert response.status_code == 400
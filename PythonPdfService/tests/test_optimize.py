@@ -0,0 +1,95 @@
+"""Optymalizacja rozmiaru PDF: endpoint /api/pdf/optimize i opcja optimize przy łączeniu"""
+import io
+import os
+
+import fitz
+
+from conftest import build_image, build_image_pdf, build_pdf, page_texts, upload
+from ingest import UploadedFile
+from pdf_optimizer import OPTIMIZE_SAVE_OPTIONS, optimize_options, optimize_pdf
+
+
+def oversized_image_pdf():
+    # 1600 px wyświetlane na 200 pt (~576 DPI) - przy 150 DPI wystarczy ~417 px
+    return build_image_pdf(build_image(1600, 1600, noise=True))
+
+
+def test_optimize_downsamples_oversized_image(client):
+    source = oversized_image_pdf()
+    response = client.post('/api/pdf/optimize', data={'file': upload((source, 'scan.pdf'))[0]})
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    saved = int(response.headers['X-Bytes-Saved'])
+    assert saved > len(source) // 2
+    assert len(response.data) == len(source) - saved
+    assert response.headers['X-Images-Recompressed'] == '1'
+    with fitz.open(stream=response.data, filetype='pdf') as doc:
+        xrefs = {image[0] for image in doc[0].get_images(full=True)}
+        assert len(xrefs) == 1
+        assert doc.extract_image(xrefs.pop())['width'] < 600
+
+
+def test_optimize_keeps_original_without_savings(client):
+    source = build_pdf(2, 'Tekst')
+    response = client.post('/api/pdf/optimize', data={'file': upload((source, 'text.pdf'))[0]})
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert int(response.headers['X-Bytes-Saved']) >= 0
+    assert page_texts(response.data) == ['Tekst 1', 'Tekst 2']
+
+
+def test_optimized_output_is_saved_to_file(monkeypatch, tmp_path):
+    import pdf_output
+
+    source = oversized_image_pdf()
+
+    def forbid_tobytes(doc, *args, **kwargs):
+        raise AssertionError('Wynik nie może być serializowany w pamięci')
+
+    monkeypatch.setattr(fitz.Document, 'tobytes', forbid_tobytes)
+    monkeypatch.setattr(pdf_output, '_output_dir', str(tmp_path))
+    output, report = optimize_pdf(UploadedFile('scan.pdf', data=source, size=len(source)), optimize_options())
+
+    with output:
+        assert not isinstance(output, io.BytesIO) and output.fileno() >= 0
+        assert not report['unchanged']
+        assert len(output.read()) == report['optimizedBytes'] < len(source)
+    assert not os.listdir(tmp_path)
+
+
+def test_unchanged_result_is_the_original(tmp_path):
+    # Dokument już zapisany z opcjami optymalizacji - ponowny zapis nie jest mniejszy
+    with fitz.open(stream=build_pdf(2, 'Tekst'), filetype='pdf') as doc:
+        source = doc.tobytes(**OPTIMIZE_SAVE_OPTIONS)
+    path = tmp_path / 'text.pdf'
+    path.write_bytes(source)
+
+    in_memory, report = optimize_pdf(UploadedFile('text.pdf', data=source, size=len(source)), optimize_options())
+    assert report['unchanged'] and in_memory.getbuffer() == source
+
+    on_disk, report = optimize_pdf(UploadedFile('text.pdf', path=str(path), size=len(source)), optimize_options())
+    with on_disk:
+        assert report['unchanged'] and on_disk.name == str(path)
+        assert on_disk.read() == source
+
+
+def test_optimize_rejects_invalid_quality(client):
+    response = client.post('/api/pdf/optimize?jpegQuality=0', data={'file': upload((build_pdf(), 'a.pdf'))[0]})
+
+    assert response.status_code == 400
+
+
+def test_merge_with_optimize_reports_image_savings(client):
+    files = upload((oversized_image_pdf(), 'scan.pdf'), (build_pdf(1, 'B'), 'b.pdf'))
+    response = client.post('/api/pdf/merge-pdfs?optimize=true&optimizeDpi=100', data={'files': files})
+
+    assert response.status_code == 200, response.get_data(as_text=True)
+    assert int(response.headers['X-Image-Bytes-Saved']) > 0
+    assert page_texts(response.data) == ['', 'B 1']
+
+
+def test_merge_optimize_requires_pymupdf(client):
+    files = upload((build_pdf(1), 'a.pdf'), (build_pdf(1), 'b.pdf'))
+    response = client.post('/api/pdf/merge-pdfs?optimize=true&engine=pypdf2', data={'files': files})
+
+    assert response.status_code == 400
@@ -0,0 +1,65 @@
+"""Cache pixmap współdzielony przez odczyt kodów i podgląd stron"""
+import hashlib
+
+import fitz
+import pytest
+
+from code_scanner import find_code_regions, render_gray, render_options
+from conftest import build_pdf, upload
+from pixmap_cache import PixmapCache
+
+
+@pytest.fixture
+def page():
+    doc = fitz.open(stream=build_pdf(), filetype='pdf')
+    yield doc.load_page(0)
+    doc.close()
+
+
+def test_lower_resolutions_derive_from_canonical_render(page):
+    cache = PixmapCache(canonical_zoom=1.0)
+
+    coarse, cached = cache.render(page, 'doc', 50 / 72, gray=True)
+    assert not cached
+    preview, cached = cache.render(page, 'doc', 1.0)
+    assert cached
+
+    direct = page.get_pixmap(matrix=fitz.Matrix(50 / 72, 50 / 72), colorspace=fitz.csGRAY, alpha=False)
+    assert (coarse.width, coarse.height, coarse.n) == (direct.width, direct.height, 1)
+    assert (preview.width, preview.height, preview.n) == (595, 842, 3)
+    assert cache.stats()['misses'] == 1
+
+
+def test_higher_resolutions_and_clips_use_own_entries(page):
+    cache = PixmapCache(canonical_zoom=1.0)
+    cache.render(page, 'doc', 1.0)
+
+    assert not cache.render(page, 'doc', 2.0)[1]
+    assert not cache.render(page, 'doc', 1.0, clip=fitz.Rect(0, 0, 100, 100))[1]
+    assert cache.render(page, 'doc', 1.0, clip=fitz.Rect(0, 0, 100, 100), gray=True)[1]
+
+
+def test_disabled_canonical_render_requires_exact_key(page):
+    cache = PixmapCache(canonical_zoom=0)
+    cache.render(page, 'doc', 50 / 72, gray=True)
+
+    assert not cache.render(page, 'doc', 1.0)[1]
+
+
+def test_preview_after_scan_is_served_from_cache(client):
+    import app as app_module
+
+    data = build_pdf(label='Podgląd')
+    doc_hash = hashlib.sha256(data).hexdigest()
+    app_module.pixmap_cache.clear()
+
+    # Przebieg zgrubny i pełna strona skanu w procesie serwera (bez dekoderów)
+    with fitz.open(stream=data, filetype='pdf') as doc:
+        find_code_regions(doc[0], render_options(), doc_hash)
+        render_gray(doc[0], 72, doc_hash=doc_hash)
+
+    response = client.post('/api/pdf/render', data={'file': upload((data, 'a.pdf'))[0]},
+                           content_type='multipart/form-data')
+    assert response.status_code == 200
+    assert response.headers['X-Cache'] == 'HIT'
+    assert response.headers['X-Image-Size'] == '595x842'
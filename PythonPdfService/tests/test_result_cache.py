@@ -0,0 +1,95 @@
+"""Cache wyników: warstwy pamięci i dysku, klucze oraz nagłówek X-Cache"""
+import pytest
+
+from conftest import build_pdf, upload
+from result_cache import ResultCache, cache_key
+
+
+def test_hit_and_miss():
+    cache = ResultCache()
+
+    assert cache.get('a') is None
+    cache.put('a', b'wynik')
+    assert cache.get('a') == b'wynik'
+    stats = cache.stats()
+    assert (stats['hits'], stats['misses'], stats['memoryHits']) == (1, 1, 1)
+
+
+def test_key_depends_on_content_operation_and_options():
+    key = cache_key('hash', 'extract-text', {'format': 'words', 'ocr': 'auto'})
+
+    assert key == cache_key('hash', 'extract-text', {'ocr': 'auto', 'format': 'words'})
+    assert key != cache_key('hash', 'extract-text', {'format': 'blocks', 'ocr': 'auto'})
+    assert key != cache_key('hash', 'read-codes', {'format': 'words', 'ocr': 'auto'})
+    assert key != cache_key('other', 'extract-text', {'format': 'words', 'ocr': 'auto'})
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    ResultCache(disk_dir=str(tmp_path)).put('a', b'wynik')
+
+    reloaded = ResultCache(disk_dir=str(tmp_path))
+    assert reloaded.stats()['diskBytes'] == 5
+    assert reloaded.get('a') == b'wynik'
+    assert reloaded.stats()['diskHits'] == 1
+    assert reloaded.get('a') == b'wynik'  # Teraz z pamięci
+    assert reloaded.stats()['memoryHits'] == 1
+
+
+def test_disk_eviction_keeps_limit(tmp_path):
+    cache = ResultCache(disk_dir=str(tmp_path), disk_max_bytes=10)
+    for key in 'abc':
+        cache.put(key, b'12345')
+
+    assert cache.stats()['diskBytes'] <= 10
+    assert cache.stats()['diskEvictions'] == 1
+
+
+def test_clear_tolerates_files_removed_by_other_process(tmp_path, monkeypatch):
+    cache = ResultCache(disk_dir=str(tmp_path))
+    cache.put('a', b'1')
+    cache.put('b', b'2')
+    entries = cache._disk_entries()
+    (tmp_path / 'a.bin').unlink()  # Inny worker usuwa wpis między listowaniem a usunięciem
+    monkeypatch.setattr(cache, '_disk_entries', lambda: entries)
+
+    cache.clear()
+
+    assert not list(tmp_path.iterdir())
+    assert cache.get('b') is None
+
+
+@pytest.fixture
+def cache(monkeypatch, tmp_path):
+    """Włączony cache z warstwą dyskową (testy domyślnie działają bez cache)"""
+    import app as app_module
+
+    cache = ResultCache(disk_dir=str(tmp_path))
+    monkeypatch.setattr(app_module, 'result_cache', cache)
+    return cache
+
+
+DOCUMENT = build_pdf(2, 'Tekst')  # Jedna treść - kolejne wywołania build_pdf różnią się metadanymi
+
+
+def extract(client, query='', data=DOCUMENT):
+    return client.post(f'/api/pdf/extract-text{query}', data={'file': upload((data, 'doc.pdf'))[0]})
+
+
+def test_extract_text_uses_cache(client, cache, monkeypatch, tmp_path):
+    import app as app_module
+
+    first = extract(client)
+    second = extract(client)
+    assert (first.headers['X-Cache'], second.headers['X-Cache']) == ('MISS', 'HIT')
+    assert first.data == second.data
+
+    # Inne opcje i inna treść - osobne wpisy
+    assert extract(client, '?format=words').headers['X-Cache'] == 'MISS'
+    assert extract(client, '?format=words').headers['X-Cache'] == 'HIT'
+    assert extract(client, data=build_pdf(2, 'Inny')).headers['X-Cache'] == 'MISS'
+
+    # Nowy proces z tym samym katalogiem - trafienie z warstwy dyskowej
+    monkeypatch.setattr(app_module, 'result_cache', ResultCache(disk_dir=str(tmp_path)))
+    reloaded = extract(client)
+    assert reloaded.headers['X-Cache'] == 'HIT' and reloaded.data == first.data
+    assert app_module.result_cache.stats()['diskHits'] == 1
@@ -0,0 +1,255 @@
+"""Ekstrakcja tekstu z PDF: warstwa tekstowa PyMuPDF, OCR tylko dla stron-skanów.
+
+Każda strona najpierw czytana jest przez ``page.get_text()``. Do OCR (easyocr)
+trafiają wyłącznie strony bez tekstu (lub z jego śladową ilością), na których
+obrazy pokrywają znaczną część powierzchni. Strony renderowane są w wątku
+wywołującym (dokument PyMuPDF nie jest współdzielony między wątkami), a
+rozpoznawanie odbywa się w ograniczonej puli wątków z czytnikami OCR ładowanymi
+raz na proces. Wyniki OCR są zapisywane w cache pod hashem wyrenderowanej strony,
+więc powtórzone strony (także w innych dokumentach) nie są rozpoznawane ponownie.
+
+Formaty strukturalne (``blocks``, ``words``, ``json``) zwracają położenie tekstu
+na stronie w postaci kolumnowej - patrz ``iter_page_structures``.
+"""
+import contextvars
+import hashlib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from lazy_imports import lazy_import
+from metrics import stage
+from result_cache import cache_key
+
+easyocr = lazy_import('easyocr', 'ocr')  # Pociąga za sobą torch - ładowany dopiero dla stron-skanów
+fitz = lazy_import('fitz', 'pdf')
+np = lazy_import('numpy', 'images')
+
+OCR_MODES = ('auto', 'off', 'force')
+DEFAULT_OCR_OPTIONS = {
+    'mode': 'auto',               # auto - OCR tylko stron bez warstwy tekstowej; off; force - wszystkie strony
+    'dpi': 200,                   # Rozdzielczość renderowania stron do OCR
+    'min_chars': 20,              # Mniej znaków w warstwie tekstowej - strona jest kandydatem do OCR
+    'min_image_coverage': 0.3,    # ...o ile obrazy pokrywają co najmniej taką część strony
+    'languages': ('pl', 'en'),
+}
+
+
+class OcrOptionsError(ValueError):
+    """Nieprawidłowe parametry OCR"""
+
+
+def ocr_options(**overrides):
+    """Łączy domyślne opcje OCR z nadpisaniami (wartości ``None`` pomijane) i je waliduje"""
+    options = dict(DEFAULT_OCR_OPTIONS)
+    options.update({key: value for key, value in overrides.items() if value is not None})
+    if options['mode'] not in OCR_MODES:
+        raise OcrOptionsError(f'Nieobsługiwany tryb OCR: "{options["mode"]}" (dozwolone: auto, off, force)')
+    if not 72 <= options['dpi'] <= 400:
+        raise OcrOptionsError('Rozdzielczość OCR poza zakresem 72-400 DPI')
+    options['languages'] = tuple(options['languages'])
+    return options
+
+
+def create_ocr_reader(languages):
+    """Tworzy czytnik easyocr (ładuje modele detekcji i rozpoznawania, CPU)"""
+    return easyocr.Reader(list(languages), gpu=False, verbose=False)
+
+
+def image_coverage(page):
+    """Część powierzchni strony pokryta obrazami (0-1)"""
+    page_rect = page.rect
+    page_area = page_rect.width * page_rect.height
+    if not page_area:
+        return 0.0
+    covered = 0.0
+    for info in page.get_image_info():
+        bbox = fitz.Rect(info['bbox']) & page_rect
+        if not bbox.is_empty:
+            covered += bbox.width * bbox.height
+    return min(1.0, covered / page_area)
+
+
+def needs_ocr(page, text, options):
+    """Czy stronę trzeba rozpoznać przez OCR"""
+    if options['mode'] == 'off':
+        return False
+    if options['mode'] == 'force':
+        return True
+    return len(text.strip()) < options['min_chars'] and image_coverage(page) >= options['min_image_coverage']
+
+
+def render_for_ocr(page, dpi):
+    """Renderuje stronę w skali szarości; zwraca tablicę NumPy (kopię - niezależną od pixmapy)"""
+    zoom = dpi / 72
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    view = np.frombuffer(pix.samples_mv, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width]
+    return np.ascontiguousarray(view)
+
+
+STRUCTURED_FORMATS = ('blocks', 'words', 'json')
+BBOX_COLUMNS = ('x0', 'y0', 'x1', 'y1')
+
+
+def bbox_columns(boxes):
+    """Prostokąty jako cztery równoległe kolumny x0/y0/x1/y1 zaokrąglone do 0.01 pt"""
+    if not len(boxes):
+        return {name: [] for name in BBOX_COLUMNS}
+    columns = np.round(np.asarray(boxes, dtype=np.float64).reshape(-1, 4), 2).T.tolist()
+    return dict(zip(BBOX_COLUMNS, columns))
+
+
+def page_words(page):
+    """Słowa strony: kolumny współrzędnych, tekstu oraz numerów bloku i wiersza"""
+    words = page.get_text('words')
+    columns = bbox_columns([word[:4] for word in words])
+    columns['text'] = [word[4] for word in words]
+    columns['block'] = [word[5] for word in words]
+    columns['line'] = [word[6] for word in words]
+    return {'words': columns}
+
+
+def page_blocks(page):
+    """Bloki strony: kolumny współrzędnych, tekstu i typu (0 - tekst, 1 - obraz)"""
+    blocks = page.get_text('blocks')
+    columns = bbox_columns([block[:4] for block in blocks])
+    columns['text'] = [block[4] for block in blocks]
+    columns['type'] = [block[6] for block in blocks]
+    return {'blocks': columns}
+
+
+def page_dict(page):
+    """Pełna struktura strony (bloki, wiersze, fragmenty) spłaszczona do tabel kolumnowych.
+
+    Wiersze wskazują blok indeksem ``block``, fragmenty - wiersz indeksem ``line``;
+    nazwy czcionek są przechowywane raz w ``fonts``, a fragmenty odwołują się do nich indeksem.
+    """
+    # Bez danych binarnych obrazów - tylko ich położenie
+    structure = page.get_text('dict', flags=fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES)
+    block_boxes, block_types = [], []
+    line_boxes, line_blocks = [], []
+    span_boxes, span_lines, span_text, span_font, span_size, span_flags, span_color = [], [], [], [], [], [], []
+    fonts = {}
+    for block in structure['blocks']:
+        block_index = len(block_types)
+        block_boxes.append(block['bbox'])
+        block_types.append(block['type'])
+        for line in block.get('lines', ()):
+            line_index = len(line_blocks)
+            line_boxes.append(line['bbox'])
+            line_blocks.append(block_index)
+            for span in line['spans']:
+                span_boxes.append(span['bbox'])
+                span_lines.append(line_index)
+                span_text.append(span['text'])
+                span_font.append(fonts.setdefault(span['font'], len(fonts)))
+                span_size.append(round(span['size'], 2))
+                span_flags.append(span['flags'])
+                span_color.append(span['color'])
+    return {
+        'fonts': list(fonts),
+        'blocks': {**bbox_columns(block_boxes), 'type': block_types},
+        'lines': {**bbox_columns(line_boxes), 'block': line_blocks},
+        'spans': {
+            **bbox_columns(span_boxes), 'line': span_lines, 'text': span_text, 'font': span_font,
+            'size': span_size, 'flags': span_flags, 'color': span_color
+        },
+    }
+
+
+PAGE_STRUCTURES = {'blocks': page_blocks, 'words': page_words, 'json': page_dict}
+
+
+def iter_page_structures(doc, output):
+    """Zwraca kolejno struktury stron w formacie ``output`` (blocks|words|json).
+
+    Format kolumnowy (równoległe tablice zamiast słownika na każde słowo)
+    ogranicza rozmiar odpowiedzi i czas serializacji. Struktura pochodzi
+    wyłącznie z warstwy tekstowej - strony-skany nie są rozpoznawane przez OCR.
+    """
+    extract = PAGE_STRUCTURES[output]
+    for page in doc:
+        with stage(f'get_text_{output}'):
+            structure = extract(page)
+        yield {'page': page.number + 1, 'width': page.rect.width, 'height': page.rect.height, **structure}
+
+
+class TextExtractor:
+    """Ekstrakcja tekstu stron z OCR wykonywanym w puli czytników"""
+
+    def __init__(self, reader_pool, cache=None):
+        self.reader_pool = reader_pool
+        self.cache = cache
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _get_executor(self):
+        with self._lock:
+            if self._executor is None:
+                # Tyle wątków, ile czytników - pula ogranicza równoległe inferencje
+                self._executor = ThreadPoolExecutor(max_workers=self.reader_pool.size, thread_name_prefix='ocr')
+            return self._executor
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def recognize(self, image, options):
+        """Rozpoznaje tekst obrazu strony; zwraca ``(tekst, z_cache)``"""
+        key = None
+        if self.cache is not None:
+            page_hash = hashlib.sha256(image.tobytes()).hexdigest()
+            key = cache_key(page_hash, 'ocr-page', {'dpi': options['dpi'], 'languages': options['languages']})
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached.decode('utf-8'), True
+        with stage('ocr'):
+            lines = self.reader_pool.infer(lambda reader: reader.readtext(image, detail=0, paragraph=True))
+        text = '\n'.join(lines)
+        if key is not None:
+            self.cache.put(key, text.encode('utf-8'))
+        return text, False
+
+    def iter_pages(self, doc, options=None):
+        """Zwraca kolejno (w kolejności stron) słowniki ``page``, ``text``, ``source`` (text|ocr|ocr-cache).
+
+        Strony do OCR są zlecane do puli od razu po wyrenderowaniu, a na wynik
+        czeka się dopiero, gdy strona jest następna w kolejności.
+        """
+        options = options or DEFAULT_OCR_OPTIONS
+        max_in_flight = self.reader_pool.size * 2  # Ogranicza liczbę wyrenderowanych stron w pamięci
+        pending = deque()
+
+        def finish(page_num, text, future):
+            if future is None:
+                return {'page': page_num, 'text': text, 'source': 'text'}
+            ocr_text, cached = future.result()
+            if not ocr_text.strip():
+                return {'page': page_num, 'text': text, 'source': 'text'}
+            return {'page': page_num, 'text': ocr_text, 'source': 'ocr-cache' if cached else 'ocr'}
+
+        try:
+            for page in doc:
+                with stage('get_text'):
+                    text = page.get_text()
+                future = None
+                if needs_ocr(page, text, options):
+                    with stage('ocr_render'):
+                        image = render_for_ocr(page, options['dpi'])
+                    future = self._get_executor().submit(
+                        contextvars.copy_context().run, self.recognize, image, options
+                    )
+                pending.append((page.number + 1, text, future))
+
+                while pending and (pending[0][2] is None or pending[0][2].done()):
+                    yield finish(*pending.popleft())
+                while sum(1 for _, _, queued in pending if queued is not None) >= max_in_flight:
+                    yield finish(*pending.popleft())
+            while pending:
+                yield finish(*pending.popleft())
+        finally:
+            for _, _, future in pending:
+                if future is not None:
+                    future.cancel()